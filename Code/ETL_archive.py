@@ -0,0 +1,254 @@
+"""
+Content-addressed archive of the GSTAT workbooks.
+
+ArchiveStore keeps every workbook once, compressed, under its SHA-256, and an SQLite index with the
+URL, file name, year, quarter, hash, size and timestamps of every archived file:
+
+    store = ArchiveStore('Archive')
+    store.put(content, 'ITR Q12024A.xlsx', url=url, year='2024', quarter='Q1')
+    store.lookup_url(url)              # index entry, or None
+    store.lookup_quarter('2024', 'Q1')
+    store.read_bytes(entry['sha256'])
+
+Renamed or republished files with the same content share one blob, and lookups are index queries
+instead of directory scans.
+"""
+
+import glob
+import gzip
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from urllib.parse import unquote, urlparse
+
+# Index database and blob directory inside the archive directory
+INDEX_FILE_NAME = 'archive_index.db'
+OBJECTS_DIRECTORY = 'objects'
+BLOCK_SIZE = 1024 * 1024
+
+
+def url_file_name(url):
+    """File name of a download URL, e.g. '.../ITR%20Q12024A.xlsx' -> 'ITR Q12024A.xlsx'."""
+    return unquote(os.path.basename(urlparse(url).path))
+
+
+class ArchiveStore:
+    """Deduplicated, compressed workbook archive with an SQLite index, safe to share between threads."""
+
+    def __init__(self, archive_directory, compress=True):
+        """
+        Parameters:
+            archive_directory (str): Directory of the archive, created if needed.
+            compress (bool): Store new blobs gzip compressed. Workbooks are already zip files, so this mostly
+                saves the space of their uncompressed parts, existing blobs are read either way.
+        """
+        self.archive_directory = archive_directory
+        self.compress = compress
+        os.makedirs(os.path.join(archive_directory, OBJECTS_DIRECTORY), exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = sqlite3.connect(os.path.join(archive_directory, INDEX_FILE_NAME), timeout=30,
+                                      check_same_thread=False)
+        self._index.row_factory = sqlite3.Row
+        with self._index:
+            self._index.executescript("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    stored_size INTEGER NOT NULL,
+                    compression TEXT,
+                    stored_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS files (
+                    file_name TEXT PRIMARY KEY,
+                    url TEXT,
+                    year TEXT,
+                    quarter TEXT,
+                    sha256 TEXT NOT NULL REFERENCES blobs (sha256),
+                    size INTEGER NOT NULL,
+                    first_archived_at TEXT NOT NULL,
+                    last_archived_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS files_url ON files (url);
+                CREATE INDEX IF NOT EXISTS files_quarter ON files (year, quarter);
+                CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256);
+            """)
+
+    def close(self):
+        with self._lock:
+            self._index.close()
+
+    def blob_path(self, sha256, compression=None):
+        """Path of the blob of a hash, in a sub directory named after its first two characters."""
+        extension = '.gz' if compression == 'gzip' else ''
+        return os.path.join(self.archive_directory, OBJECTS_DIRECTORY, sha256[:2], sha256 + extension)
+
+    def _write_blob(self, sha256, chunks):
+        """Write a blob atomically from an iterable of byte chunks, return (stored size, compression)."""
+        compression = 'gzip' if self.compress else None
+        path = self.blob_path(sha256, compression)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            with open(part_path, 'wb') as raw:
+                # mtime=0 so the same content always gives the same blob bytes
+                output = gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) if compression else raw
+                with output:
+                    for chunk in chunks:
+                        output.write(chunk)
+            os.replace(part_path, path)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        return os.path.getsize(path), compression
+
+    def _put(self, sha256, size, chunks, file_name, url, year, quarter):
+        now = datetime.now().isoformat(timespec='seconds')
+        with self._lock:
+            # Identical content is only stored once, whatever its name or URL
+            if self._index.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)).fetchone() is None:
+                stored_size, compression = self._write_blob(sha256, chunks())
+                # Another process may have stored the same content meanwhile, its blob file is identical
+                with self._index:
+                    self._index.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?, ?)",
+                                        (sha256, size, stored_size, compression, now))
+                logging.info(f"Archived {file_name} as {sha256[:12]} ({size} -> {stored_size} bytes)")
+            else:
+                logging.info(f"Archived {file_name}, same content as blob {sha256[:12]}")
+
+            previous = self._index.execute("SELECT sha256 FROM files WHERE file_name = ?", (file_name,)).fetchone()
+            with self._index:
+                self._index.execute("""
+                    INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (file_name) DO UPDATE SET
+                        url = COALESCE(excluded.url, url), year = COALESCE(excluded.year, year),
+                        quarter = COALESCE(excluded.quarter, quarter), sha256 = excluded.sha256,
+                        size = excluded.size, last_archived_at = excluded.last_archived_at""",
+                                    (file_name, url, year, quarter, sha256, size, now, now))
+            # A republished workbook replaces its older copy, unless another file still has that content
+            if previous is not None and previous['sha256'] != sha256:
+                self._delete_unreferenced(previous['sha256'])
+        return self.lookup_name(file_name)
+
+    def _delete_unreferenced(self, sha256):
+        if self._index.execute("SELECT 1 FROM files WHERE sha256 = ?", (sha256,)).fetchone() is not None:
+            return
+        blob = self._index.execute("SELECT compression FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        with self._index:
+            self._index.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+        if blob is not None and os.path.exists(self.blob_path(sha256, blob['compression'])):
+            os.remove(self.blob_path(sha256, blob['compression']))
+
+    def put(self, content, file_name, url=None, year=None, quarter=None):
+        """
+        Archive the bytes of a workbook.
+
+        Parameters:
+            content (bytes): Bytes of the workbook.
+            file_name (str): Name of the workbook, the key of its index entry.
+            url (str, optional): URL it was downloaded from.
+            year (str), quarter (str), optional: Quarter of the workbook, e.g. '2024', 'Q1'.
+
+        Returns:
+            dict: The index entry of the file (see lookup_name).
+        """
+        sha256 = hashlib.sha256(content).hexdigest()
+        return self._put(sha256, len(content), lambda: [content], os.path.basename(file_name), url, year, quarter)
+
+    def put_file(self, path, url=None, year=None, quarter=None, remove=True):
+        """
+        Archive a workbook file, streamed in 1 MB blocks, and remove it unless remove is False.
+
+        Returns:
+            dict: The index entry of the file (see lookup_name).
+        """
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+                hasher.update(block)
+
+        def chunks():
+            with open(path, 'rb') as file:
+                yield from iter(lambda: file.read(BLOCK_SIZE), b'')
+
+        entry = self._put(hasher.hexdigest(), os.path.getsize(path), chunks, os.path.basename(path),
+                          url, year, quarter)
+        if remove:
+            os.remove(path)
+        return entry
+
+    def _lookup(self, where, parameters):
+        with self._lock:
+            row = self._index.execute(f"""
+                SELECT files.*, blobs.stored_size, blobs.compression FROM files JOIN blobs USING (sha256)
+                WHERE {where} ORDER BY last_archived_at DESC LIMIT 1""", parameters).fetchone()
+        return dict(row) if row is not None else None
+
+    def lookup_name(self, file_name):
+        """
+        Index entry of an archived file name, or None.
+
+        Returns:
+            dict: {'file_name', 'url', 'year', 'quarter', 'sha256', 'size', 'first_archived_at',
+                   'last_archived_at', 'stored_size', 'compression'}
+        """
+        return self._lookup("file_name = ?", (file_name,))
+
+    def lookup_url(self, url):
+        """Index entry of the file downloaded from url, or None. Files archived without URL match by file name."""
+        return self._lookup("url = ? OR (url IS NULL AND file_name = ?)", (url, url_file_name(url)))
+
+    def lookup_quarter(self, year, quarter):
+        """Index entry of the last archived workbook of (year, quarter), e.g. ('2024', 'Q1'), or None."""
+        return self._lookup("year = ? AND quarter = ?", (str(year), quarter))
+
+    def lookup_sha256(self, sha256):
+        """Index entry of the last archived file with this content, or None."""
+        return self._lookup("sha256 = ?", (sha256,))
+
+    def entry_path(self, entry):
+        """Path of the blob of an index entry."""
+        return self.blob_path(entry['sha256'], entry['compression'])
+
+    def read_bytes(self, sha256):
+        """Uncompressed bytes of an archived blob."""
+        blob = self._lookup("sha256 = ?", (sha256,))
+        if blob is None:
+            raise KeyError(f"No archived blob {sha256}")
+        opener = gzip.open if blob['compression'] == 'gzip' else open
+        with opener(self.entry_path(blob), 'rb') as file:
+            return file.read()
+
+    def export(self, entry, path):
+        """Write the workbook of an index entry to path, e.g. to process it again."""
+        with open(path, 'wb') as file:
+            file.write(self.read_bytes(entry['sha256']))
+        return path
+
+    def stats(self):
+        """Counts and sizes of the archive: {'files', 'blobs', 'size', 'stored_size'}."""
+        with self._lock:
+            files = self._index.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            blobs, size, stored_size = self._index.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0) FROM blobs").fetchone()
+        return {'files': files, 'blobs': blobs, 'size': size, 'stored_size': stored_size}
+
+    def import_flat_files(self, pattern='*.xlsx', describe=None):
+        """
+        Move the loose files of the archive directory, archived before the store existed, into the store.
+
+        Parameters:
+            pattern (str): Glob pattern of the files, relative to the archive directory.
+            describe (callable, optional): file name -> dict of put_file arguments (url, year, quarter).
+
+        Returns:
+            int: Number of files imported.
+        """
+        files = sorted(glob.glob(os.path.join(self.archive_directory, pattern)))
+        for path in files:
+            self.put_file(path, **(describe(os.path.basename(path)) if describe else {}))
+        if files:
+            logging.info(f"Imported {len(files)} archived files into the archive store")
+        return len(files)
@@ -4,8 +4,15 @@ It includes functionalities to connect to databases, read and manipulate data, a
 """
 
 import urllib.parse
+import csv
+import io
+import time
+import threading
+import weakref
+from contextlib import nullcontext
 import sqlalchemy
-from sqlalchemy import create_engine, text, literal_column
+from sqlalchemy import create_engine, text, literal_column, event
+from sqlalchemy.pool import QueuePool
 import pandas as pd
 import logging
 import mysql.connector 
@@ -14,7 +21,8 @@ import psycopg2
 import ETL_Config as c
 
 
-def Connect_TO_SQL(TargetServer: str, TargetDb: str, username: str, password: str) -> sqlalchemy.engine.Engine:
+def Connect_TO_SQL(TargetServer: str, TargetDb: str, username: str, password: str,
+                   pool_size: int = 5, max_overflow: int = 10, **engine_options) -> sqlalchemy.engine.Engine:
     """
     Connects to a SQL Server database using provided credentials.
     
@@ -23,6 +31,9 @@ def Connect_TO_SQL(TargetServer: str, TargetDb: str, username: str, password: st
         TargetDb (str): Database name.
         username (str): Username for the database.
         password (str): Password for the database.
+        pool_size (int): Number of connections kept open in the engine pool.
+        max_overflow (int): Extra connections allowed above pool_size under load.
+        **engine_options: Other create_engine options, e.g. pool_pre_ping, pool_recycle or poolclass.
 
     Returns:
         sqlalchemy.engine.Engine: A connection engine to the SQL Server database.
@@ -32,31 +43,173 @@ def Connect_TO_SQL(TargetServer: str, TargetDb: str, username: str, password: st
             f"DRIVER={{SQL Server}};SERVER={TargetServer};DATABASE={TargetDb};UID={username};PWD={password}"
         )
         conn_str = f"mssql+pyodbc:///?odbc_connect={params}"
-        return create_engine(conn_str, encoding="utf-8")
+        return create_engine(conn_str, encoding="utf-8", pool_size=pool_size, max_overflow=max_overflow,
+                             **engine_options)
     except Exception as e:
         logging.exception("Error connecting to SQL Server: %s", e)
         raise
 
 
+# Pool settings of the registry engines, each one can be overridden in the server entry of ETL_Config
+POOL_DEFAULTS = {"pool_size": 5, "max_overflow": 10, "pool_pre_ping": True, "pool_recycle": 1800, "pool_timeout": 30}
+
+# Engines created by get_engine, one per ETL_Config server key for the whole process
+_engines = {}
+_pool_metrics = {}
+_engines_lock = threading.Lock()
+
+
+class PoolMetrics:
+    """Checkout counts and checkout wait times of one engine pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0        # new database connections (login cost paid)
+        self.checkouts = 0
+        self.checked_out = 0     # connections currently in use
+        self.wait_seconds = 0.0  # total time spent waiting for a connection, including connects
+        self.max_wait_seconds = 0.0
+
+    def record_checkout(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def record_checkin(self):
+        with self._lock:
+            self.checked_out -= 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {"connects": self.connects, "checkouts": self.checkouts, "checked_out": self.checked_out,
+                    "wait_seconds": self.wait_seconds, "max_wait_seconds": self.max_wait_seconds,
+                    "mean_wait_seconds": self.wait_seconds / self.checkouts if self.checkouts else 0.0}
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that times every checkout, the wait includes a new connection when the pool has none free."""
+
+    metrics = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        connection = super()._do_get()
+        if self.metrics is not None:
+            self.metrics.record_checkout(time.perf_counter() - start)
+        return connection
+
+    def _do_return_conn(self, conn):
+        if self.metrics is not None:
+            self.metrics.record_checkin()
+        super()._do_return_conn(conn)
+
+    def recreate(self):
+        # engine.dispose() replaces the pool, the new one keeps counting in the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+def _create_registry_engine(config: dict, pool_options: dict) -> sqlalchemy.engine.Engine:
+    """Create the engine of an ETL_Config server entry, its "type" is mssql (default), mysql or postgresql."""
+    db_type = config.get("type", "mssql")
+    if db_type == "mssql":
+        return Connect_TO_SQL(config["server"], config["database"], config["username"], config["password"],
+                              poolclass=MeteredQueuePool, **pool_options)
+
+    drivers = {"mysql": "mysql+mysqlconnector", "postgresql": "postgresql+psycopg2"}
+    if db_type not in drivers:
+        raise ValueError(f"Unknown database type {db_type}, expected mssql, mysql or postgresql")
+    url = sqlalchemy.engine.URL.create(drivers[db_type], username=config["username"], password=config["password"],
+                                       host=config["server"], port=config.get("port"), database=config["database"])
+    return create_engine(url, poolclass=MeteredQueuePool, **pool_options)
+
+
+def get_engine(config_key: str, **pool_options) -> sqlalchemy.engine.Engine:
+    """
+    Returns the pooled engine of an ETL_Config server, creating it on first use.
+
+    Every call with the same key returns the same engine, so repeated jobs in one process reuse
+    its open connections instead of connecting and logging in again.
+    
+    Args:
+        config_key (str): Key of the server in ETL_Config.
+        **pool_options: pool_size, max_overflow, pool_pre_ping, pool_recycle or pool_timeout. They override
+            POOL_DEFAULTS and the server entry, and only apply when the engine is created.
+
+    Returns:
+        sqlalchemy.engine.Engine: The engine of the server.
+    """
+    with _engines_lock:
+        engine = _engines.get(config_key)
+        if engine is None:
+            config = c.config["servers"][config_key]
+            options = {name: config.get(name, default) for name, default in POOL_DEFAULTS.items()}
+            options.update(pool_options)
+            engine = _create_registry_engine(config, options)
+
+            metrics = PoolMetrics()
+            engine.pool.metrics = metrics
+            event.listen(engine, "connect", lambda dbapi_connection, connection_record: metrics.record_connect())
+            _engines[config_key] = engine
+            _pool_metrics[config_key] = metrics
+            logging.info("Created engine for %s with %s", config_key, options)
+        return engine
+
+
+def pool_metrics(config_key: str = None) -> dict:
+    """
+    Returns the pool metrics of one registry engine, or of all of them by key if config_key is None.
+
+    See PoolMetrics.as_dict for the values; pool_size and overflow are the current pool state.
+    """
+    with _engines_lock:
+        keys = [config_key] if config_key else list(_engines)
+        metrics = {key: {**_pool_metrics[key].as_dict(), "pool_size": _engines[key].pool.size(),
+                         "overflow": _engines[key].pool.overflow()} for key in keys}
+    return metrics[config_key] if config_key else metrics
+
+
+def log_pool_metrics():
+    """Log the pool metrics of every registry engine."""
+    for key, metrics in pool_metrics().items():
+        logging.info("Pool %s: %s connects, %s checkouts, %s in use, wait total %.3f s mean %.4f s max %.3f s",
+                     key, metrics["connects"], metrics["checkouts"], metrics["checked_out"],
+                     metrics["wait_seconds"], metrics["mean_wait_seconds"], metrics["max_wait_seconds"])
+
+
+def dispose_engines():
+    """Close the pooled connections of all registry engines and empty the registry."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _pool_metrics.clear()
+
+
 # connect to destinations 
-def connect_to_databases(dest_config_key: str, dmdq_config_key: str):
+def connect_to_databases(dest_config_key: str, dmdq_config_key: str, pool_size: int = 5):
     """
     Establishes connections to DM_Quality and a variable Destination database using configurations from ETL_Config.
     
     Args:
         dest_config_key (str): Key to specify which Destination database configuration to use.
+        dmdq_config_key (str): Key of the DM_Quality database configuration.
+        pool_size (int): Number of pooled connections of the Destination engine when it is created.
 
     Returns:
-        tuple: Tuple containing engine objects for DM_Quality and the specified Destination database.
+        tuple: Tuple containing engine objects for DM_Quality and the specified Destination database,
+               shared with every later call for the same keys (see get_engine).
     """
     try:
-        config_DMDQ = c.config["servers"][dmdq_config_key]
-        Engine_DMDQ = Connect_TO_SQL(config_DMDQ["server"], config_DMDQ["database"], 
-                                     config_DMDQ["username"], config_DMDQ["password"])
-
-        config_dest = c.config["servers"][dest_config_key]
-        Engine_Dest = Connect_TO_SQL(config_dest["server"], config_dest["database"], 
-                                     config_dest["username"], config_dest["password"])
+        Engine_DMDQ = get_engine(dmdq_config_key)
+        Engine_Dest = get_engine(dest_config_key, pool_size=pool_size)
 
         return Engine_DMDQ, Engine_Dest
     except Exception as e:
@@ -64,7 +217,7 @@ def connect_to_databases(dest_config_key: str, dmdq_config_key: str):
         raise
 
 
-def create_mysql_connection(config_key: str, port: int = None, auth_plugin: str = None):
+def create_mysql_connection(config_key: str, port: int = None, auth_plugin: str = None, pooled: bool = False):
     """
     Creates and returns a MySQL connection using the specified configuration.
     
@@ -72,10 +225,14 @@ def create_mysql_connection(config_key: str, port: int = None, auth_plugin: str
         config_key (str): The key to access the database configuration.
         port (int, optional): The port number for the database connection.
         auth_plugin (str, optional): The authentication plugin for the database connection.
+        pooled (bool): Check out a connection of the registry engine instead (see get_engine), the server
+            entry must have "type": "mysql" and its "port". close() returns it to the pool.
 
     Returns:
         MySQLConnection: A MySQL connection object.
     """
+    if pooled:
+        return get_engine(config_key).raw_connection()
     config = c.config["servers"][config_key]
     connection_params = {
         "host": config["server"],
@@ -93,7 +250,7 @@ def create_mysql_connection(config_key: str, port: int = None, auth_plugin: str
     return mysql.connector.connect(**connection_params)
 
 
-def create_postgres_connection(config_key: str, port: int = None, sslmode: str = None):
+def create_postgres_connection(config_key: str, port: int = None, sslmode: str = None, pooled: bool = False):
     """
     Creates and returns a PostgreSQL connection using the specified configuration.
     
@@ -101,10 +258,14 @@ def create_postgres_connection(config_key: str, port: int = None, sslmode: str =
         config_key (str): The key to access the database configuration.
         port (int, optional): The port number for the database connection.
         sslmode (str, optional): The SSL mode for the database connection.
+        pooled (bool): Check out a connection of the registry engine instead (see get_engine), the server
+            entry must have "type": "postgresql". close() returns it to the pool.
 
     Returns:
         psycopg2.extensions.connection: A PostgreSQL connection object.
     """
+    if pooled:
+        return get_engine(config_key).raw_connection()
     config = c.config["servers"][config_key]
     connection_params = {
         "host": config["server"],
@@ -127,32 +288,112 @@ def create_mssql_connection(config_key: str):
     Args:
         config_key (str): The key to access the database configuration.
     Returns:
-        mssql.extensions.connection: A MSSQL connection object.
+        sqlalchemy.engine.Engine: The pooled engine of the server, shared by every call with the same key.
     """
     try:
-
-        config_src = c.config["servers"][config_key]
-        Engine_src = Connect_TO_SQL(config_src["server"], config_src["database"], 
-                                     config_src["username"], config_src["password"])
-
-        return  Engine_src
+        return get_engine(config_key)
     except Exception as e:
         logging.exception("Error connecting to databases: %s", e)
         raise
 
-def read_source_data(table_name: str, connection) -> pd.DataFrame:
+def _select_query(table_name: str, columns: list = None, where: str = None, quote=None) -> str:
+    """Build SELECT <columns> FROM <table_name> [WHERE <where>], columns quoted with quote if given."""
+    projection = ", ".join(quote(column) if quote else column for column in columns) if columns else "*"
+    query = f"SELECT {projection} FROM {table_name}"
+    if where:
+        query += f" WHERE {where}"
+    return query
+
+
+def read_source_data(table_name: str, connection, columns: list = None, where: str = None,
+                     params=None) -> pd.DataFrame:
     """
     Reads data from a specified source table and returns it as a DataFrame.
     
     Args:
         table_name (str): Name of the source table.
         connection (sqlalchemy.engine.Connection): Database connection object.
+        columns (list, optional): Columns to read, all of them if None.
+        where (str, optional): SQL condition applied by the database, e.g. "Year = :year".
+        params (dict, optional): Parameters of the where condition.
 
     Returns:
         pd.DataFrame: DataFrame containing data from the source table.
     """
-    query = f"SELECT * FROM {table_name}"
-    return pd.read_sql(query, connection)
+    query = _select_query(table_name, columns, where)
+    return pd.read_sql(text(query) if params else query, connection, params=params)
+
+
+def read_source_data_chunks(table_name: str, connection, chunksize: int = 50000, columns: list = None,
+                            where: str = None, params=None):
+    """
+    Reads a source table in DataFrames of at most chunksize rows, with a server-side cursor so that only
+    one chunk is held in memory.
+
+    The cursor depends on the connection:
+        - SQLAlchemy engine or connection (SQL Server from create_mssql_connection, or any other engine):
+          stream_results execution option and pd.read_sql chunks.
+        - psycopg2 connection (create_postgres_connection): named cursor fetching chunksize rows per round-trip.
+        - mysql.connector connection (create_mysql_connection): unbuffered cursor.
+
+    Args:
+        table_name (str): Name of the source table.
+        connection: SQLAlchemy engine or connection, psycopg2 connection or mysql.connector connection.
+        chunksize (int): Maximum number of rows per DataFrame.
+        columns (list, optional): Columns to read, all of them if None.
+        where (str, optional): SQL condition applied by the database. Placeholders use the style of the
+            connection: ":name" for SQLAlchemy, "%(name)s" for psycopg2 and mysql.connector.
+        params (dict, optional): Parameters of the where condition.
+
+    Yields:
+        pd.DataFrame: The next chunk of rows, with the selected columns.
+    """
+    if isinstance(connection, (sqlalchemy.engine.Engine, sqlalchemy.engine.Connection)):
+        engine = getattr(connection, "engine", connection)
+        query = text(_select_query(table_name, columns, where, lambda column: quote_identifier(engine, column)))
+        if isinstance(connection, sqlalchemy.engine.Engine):
+            with connection.connect() as conn:
+                yield from pd.read_sql(query, conn.execution_options(stream_results=True),
+                                       params=params, chunksize=chunksize)
+        else:
+            yield from pd.read_sql(query, connection.execution_options(stream_results=True),
+                                   params=params, chunksize=chunksize)
+        return
+
+    # Pooled connections (create_postgres_connection(..., pooled=True)) wrap the driver connection
+    unbuffered = not isinstance(getattr(connection, "dbapi_connection", connection), psycopg2.extensions.connection)
+    if not unbuffered:
+        quote = lambda column: '"' + str(column).replace('"', '""') + '"'
+        # A named cursor is declared on the server, rows are fetched itersize at a time
+        cursor = connection.cursor(name=f"read_{time.monotonic_ns()}")
+        cursor.itersize = chunksize
+    else:
+        quote = lambda column: "`" + str(column).replace("`", "``") + "`"
+        # An unbuffered cursor reads the result set from the socket as rows are fetched
+        cursor = connection.cursor(buffered=False)
+
+    try:
+        cursor.execute(_select_query(table_name, columns, where, quote), params)
+        names = None
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if names is None:
+                names = [description[0] for description in cursor.description]
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows, columns=names)
+    except GeneratorExit:
+        if unbuffered:
+            # The caller stopped iterating before the last row. Closing an unbuffered cursor with unread rows
+            # raises "Unread result found", so the rest of the result set is read and discarded chunk by chunk
+            while cursor.fetchmany(chunksize):
+                pass
+        raise
+    except Exception as e:
+        logging.exception("Error reading %s: %s", table_name, e)
+        raise
+    finally:
+        cursor.close()
 
 
 def read_database_count(db_name: str, schema_name: str, table_name: str, con):
@@ -268,5 +509,330 @@ def Insert_TO_DMDQ(Engine_DMDQ, db_name: str, db_schema: str, db_table: str,
         logging.exception("Error inserting to DM_Quality: %s", e)
         raise
 
+# Columns of a DM_Quality row, in the order of the INSERT statement
+DMDQ_COLUMNS = ('DB_Name', 'DB_Schema', 'DB_Table', 'Time_of_execution', 'Number_of_Columns', 'Number_of_Rows',
+                'Frequency_of_load', 'STG_CreatedDate', 'SRC_Table', 'SRC_Type', 'Number_of_Rejected_Rows')
+
+
+def Generate_Frequency_of_loads(connection, source_tables: list) -> dict:
+    """
+    Increments the load frequency count of several tables with a single MERGE statement.
+
+    The MERGE holds a range lock (HOLDLOCK) on the counter rows, so concurrent runs cannot read the same
+    count, and returns the new counts with OUTPUT instead of a separate SELECT.
+
+    Args:
+        connection: SQLAlchemy connection to DM_Quality, the caller owns the transaction.
+        source_tables (list): Table names whose counter is incremented, created at 1 if missing.
+
+    Returns:
+        dict: Table name -> its new load count.
+    """
+    # A MERGE source must not match the same target row twice
+    tables = list(dict.fromkeys(source_tables))
+    if not tables:
+        return {}
+    values = ", ".join(f"(:table_{i})" for i in range(len(tables)))
+    query = text(f"""
+        MERGE ByDB.[General].Frequency_of_load_count WITH (HOLDLOCK) AS main
+        USING (VALUES {values}) AS src (DB_Table)
+        ON main.DB_Table = src.DB_Table
+        WHEN MATCHED THEN
+            UPDATE SET Max_Load_Count = main.Max_Load_Count + 1
+        WHEN NOT MATCHED BY TARGET THEN
+            INSERT (DB_Table, Max_Load_Count, Insertion_date) VALUES (src.DB_Table, 1, GETDATE())
+        OUTPUT inserted.DB_Table, inserted.Max_Load_Count;
+    """)
+    result = connection.execute(query, {f"table_{i}": table for i, table in enumerate(tables)})
+    return {row[0]: int(row[1]) for row in result.fetchall()}
+
+
+def Insert_TO_DMDQ_batch(Engine_DMDQ, records: list) -> dict:
+    """
+    Writes the DM_Quality rows of a whole load in one transaction and two round-trips.
+
+    The load counters of all the tables are incremented with Generate_Frequency_of_loads, then all the
+    rows are inserted with one executemany. If either step fails, nothing is written.
+
+    Args:
+        Engine_DMDQ: SQLAlchemy engine connected to DM_Quality.
+        records (list): One dict per loaded table with the DMDQ_COLUMNS keys except Frequency_of_load,
+            which is set from the incremented counter of its DB_Table.
+
+    Returns:
+        dict: Table name -> load count written to Frequency_of_load.
+    """
+    if not records:
+        return {}
+    query = text(f"""
+        INSERT INTO ByDB.[General].DM_Quality ({', '.join(DMDQ_COLUMNS)})
+        VALUES ({', '.join(f':{column}' for column in DMDQ_COLUMNS)})
+    """)
+    try:
+        with Engine_DMDQ.begin() as connection:
+            counts = Generate_Frequency_of_loads(connection, [record['DB_Table'] for record in records])
+            rows = [{**record, 'Frequency_of_load': counts[record['DB_Table']]} for record in records]
+            connection.execute(query, rows)
+        return counts
+    except Exception as e:
+        logging.exception("Error inserting to DM_Quality: %s", e)
+        raise
+
+# Bulk load methods accepted by bulk_load_dataframe
+BULK_LOAD_METHODS = ('default', 'multirow', 'fast_executemany', 'copy')
+
+# SQL Server accepts at most 2100 parameters per statement, multi-row INSERTs are sized to stay below it
+MAX_STATEMENT_PARAMETERS = 2000
+
+# Execution option that turns on pyodbc fast_executemany for the statements run with it
+FAST_EXECUTEMANY_OPTION = "pyodbc_fast_executemany"
+
+# Engines on which enable_fast_executemany already registered its event listener
+_fast_executemany_engines = weakref.WeakSet()
+
+
+def enable_fast_executemany(engine: sqlalchemy.engine.Engine):
+    """
+    Let executemany statements run with the FAST_EXECUTEMANY_OPTION execution option use pyodbc fast_executemany.
+
+    pyodbc then sends all the rows of an INSERT in one array-bound round-trip instead of one per row.
+    Only the statements run through engine.execution_options(pyodbc_fast_executemany=True) (or such a
+    connection) are affected, other loads on the same engine keep their own method.
+    Calling it again on the same engine does nothing.
+    
+    Args:
+        engine: SQLAlchemy engine using the mssql+pyodbc dialect.
+    """
+    if engine in _fast_executemany_engines:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _set_fast_executemany(conn, cursor, statement, parameters, context, executemany):
+        if (executemany and context is not None and context.execution_options.get(FAST_EXECUTEMANY_OPTION)
+                and hasattr(cursor, "fast_executemany")):
+            cursor.fast_executemany = True
+
+    _fast_executemany_engines.add(engine)
+
+
+def _copy_sql(table_name: str, schema: str, columns) -> str:
+    """Build a PostgreSQL COPY ... FROM STDIN statement with quoted identifiers."""
+    quote = lambda name: '"{}"'.format(str(name).replace('"', '""'))
+    target = f"{quote(schema)}.{quote(table_name)}" if schema else quote(table_name)
+    return f"COPY {target} ({', '.join(quote(col) for col in columns)}) FROM STDIN WITH (FORMAT CSV)"
+
+
+def psql_insert_copy(table, conn, keys, data_iter) -> int:
+    """
+    pandas to_sql method that loads rows with PostgreSQL COPY instead of INSERT statements.
+    
+    Args:
+        table (pandas.io.sql.SQLTable): Target table, given by pandas.
+        conn (sqlalchemy.engine.Connection): Connection of a postgresql+psycopg2 engine.
+        keys (list): Column names.
+        data_iter (iterable): Rows to load.
+
+    Returns:
+        int: Number of rows copied.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(data_iter)
+    buffer.seek(0)
+
+    dbapi_conn = conn.connection
+    with dbapi_conn.cursor() as cursor:
+        cursor.copy_expert(sql=_copy_sql(table.name, table.schema, keys), file=buffer)
+        return cursor.rowcount
+
+
+def copy_dataframe_to_postgres(df: pd.DataFrame, table_name: str, connection, schema: str = None) -> int:
+    """
+    Loads a DataFrame into an existing PostgreSQL table with COPY, using a connection from create_postgres_connection.
+    
+    Args:
+        df (pd.DataFrame): Data to load, its column names must match the table columns.
+        table_name (str): Target table name.
+        connection (psycopg2.extensions.connection): PostgreSQL connection.
+        schema (str, optional): Schema of the target table.
+
+    Returns:
+        int: Number of rows copied.
+    """
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql=_copy_sql(table_name, schema, df.columns), file=buffer)
+        rowcount = cursor.rowcount
+    connection.commit()
+    return rowcount
+
+
+def bulk_load_dataframe(df: pd.DataFrame, table_name: str, con, schema: str = None, method: str = "default",
+                        chunksize: int = None, dtype: dict = None, if_exists: str = "append") -> float:
+    """
+    Loads a DataFrame into a table with the selected bulk load method and logs the throughput.
+    
+    Args:
+        df (pd.DataFrame): Data to load.
+        table_name (str): Target table name.
+        con: SQLAlchemy engine or connection of the destination.
+        schema (str, optional): Schema of the target table.
+        method (str): One of BULK_LOAD_METHODS:
+            - 'default': pandas to_sql executemany, one round-trip per row with pyodbc.
+            - 'multirow': multi-row INSERT ... VALUES statements, chunksize rows each
+              (defaults to the most rows that fit in MAX_STATEMENT_PARAMETERS parameters).
+            - 'fast_executemany': pyodbc fast_executemany, rows are sent as parameter arrays (SQL Server).
+            - 'copy': PostgreSQL COPY FROM STDIN (postgresql+psycopg2 engines).
+        chunksize (int, optional): Number of rows sent per batch.
+        dtype (dict, optional): Column types passed to to_sql.
+        if_exists (str): to_sql behaviour if the table exists ('append', 'replace' or 'fail').
+
+    Returns:
+        float: Load duration in seconds.
+    """
+    if method not in BULK_LOAD_METHODS:
+        raise ValueError(f"Unknown bulk load method {method}, expected one of {BULK_LOAD_METHODS}")
+
+    to_sql_method = None
+    load_con = con
+    if method == "multirow":
+        to_sql_method = "multi"
+        chunksize = chunksize or max(1, MAX_STATEMENT_PARAMETERS // max(1, len(df.columns)))
+    elif method == "fast_executemany":
+        # to_sql may receive a connection, the event listener is set on its engine
+        enable_fast_executemany(getattr(con, "engine", con))
+        # Only this load runs with the option: a copy of an engine, a branch (1.4) or the connection itself (2.0)
+        load_con = con.execution_options(**{FAST_EXECUTEMANY_OPTION: True})
+    elif method == "copy":
+        to_sql_method = psql_insert_copy
+
+    try:
+        start = time.perf_counter()
+        df.to_sql(table_name, con=load_con, schema=schema, if_exists=if_exists, index=False,
+                  dtype=dtype, method=to_sql_method, chunksize=chunksize)
+        duration = time.perf_counter() - start
+        logging.info("Loaded %s rows into %s with %s in %.2f s (%.0f rows/s)",
+                     len(df), table_name, method, duration, len(df) / duration if duration else float("inf"))
+        return duration
+    except Exception as e:
+        logging.exception("Error bulk loading into %s: %s", table_name, e)
+        raise
+    finally:
+        if method == "fast_executemany" and load_con is con and isinstance(con, sqlalchemy.engine.Connection):
+            # SQLAlchemy 2.0 sets the options on the connection itself, the next statements run without it
+            con.execution_options(**{FAST_EXECUTEMANY_OPTION: False})
+
+
+def quote_identifier(engine, name: str) -> str:
+    """Quote an identifier (Arabic names, spaces, keywords) for the dialect of the engine."""
+    return engine.dialect.identifier_preparer.quote(str(name))
+
+
+def qualified_name(engine, schema: str, table: str) -> str:
+    """Return the quoted schema.table name, or only the table if there is no schema."""
+    if not schema:
+        return quote_identifier(engine, table)
+    return f"{quote_identifier(engine, schema)}.{quote_identifier(engine, table)}"
+
+
+def upsert_dataframe(df: pd.DataFrame, table_name: str, key_columns: list, con, schema: str = None,
+                     dtype: dict = None, bulk_method: str = "default", chunksize: int = None,
+                     compare_exclude: tuple = ("STG_CreatedDate",), timer=None, staging_name: str = None) -> dict:
+    """
+    Inserts new rows and updates changed rows of a table from a DataFrame with one set-based statement.
+
+    The DataFrame is staged once into temp_<table_name>, then merged into the table on key_columns:
+    SQL Server runs a single MERGE ... OUTPUT $action, other databases (PostgreSQL, SQLite) run
+    UPDATE ... FROM followed by INSERT ... WHERE NOT EXISTS. Staging, merge and drop run in one transaction.
+    
+    Args:
+        df (pd.DataFrame): Rows to upsert, its columns must exist in the table.
+        table_name (str): Target table name.
+        key_columns (list): Columns identifying a row, e.g. ['Section_number', 'Year', 'Quarter'].
+        con: SQLAlchemy engine (a transaction is opened) or connection (the caller owns the transaction).
+        schema (str, optional): Schema of the target table.
+        dtype (dict, optional): Column types of the staging table.
+        bulk_method (str): How the staging table is filled, see bulk_load_dataframe.
+        chunksize (int, optional): Rows per batch for the staging load.
+        compare_exclude (tuple): Columns updated on changed rows but not compared, like the load timestamp.
+        timer (ETL_timing.StageTimer, optional): Records the 'stage' and 'merge' spans of the table.
+        staging_name (str, optional): Name of the staging table, temp_<table_name> by default. Processes loading
+            the same table at the same time need different names.
+
+    Returns:
+        dict: {'inserted': int, 'updated': int, 'skipped': int}, skipped rows were identical to the table.
+    """
+    if isinstance(con, sqlalchemy.engine.Engine):
+        with con.begin() as connection:
+            return upsert_dataframe(df, table_name, key_columns, connection, schema, dtype,
+                                    bulk_method, chunksize, compare_exclude, timer, staging_name)
+
+    engine = con.engine
+    # A key may appear in several files (republished quarter), the last one wins
+    df = df.drop_duplicates(subset=key_columns, keep="last")
+    staging_name = staging_name or f"temp_{table_name}"
+    target = qualified_name(engine, schema, table_name)
+    staging = qualified_name(engine, schema, staging_name)
+
+    columns = [quote_identifier(engine, col) for col in df.columns]
+    keys = [quote_identifier(engine, col) for col in key_columns]
+    value_columns = [quote_identifier(engine, col) for col in df.columns if col not in key_columns]
+    compared_columns = [quote_identifier(engine, col) for col in df.columns
+                        if col not in key_columns and col not in compare_exclude]
+
+    key_match = " AND ".join(f"main.{key} = temp.{key}" for key in keys)
+    # EXCEPT compares NULLs as equal, so only rows with a real difference are updated
+    row_changed = (f"EXISTS (SELECT {', '.join(f'main.{col}' for col in compared_columns)} "
+                   f"EXCEPT SELECT {', '.join(f'temp.{col}' for col in compared_columns)})"
+                   if compared_columns else "1 = 0")
+
+    def timed(stage):
+        return timer.span(stage, table=table_name) if timer else nullcontext()
+
+    try:
+        with timed("stage"):
+            bulk_load_dataframe(df, staging_name, con, schema, bulk_method, chunksize, dtype=dtype, if_exists="replace")
+
+        with timed("merge"):
+            if engine.dialect.name == "mssql":
+                merge_query = f"""
+                    MERGE {target} WITH (HOLDLOCK) AS main
+                    USING {staging} AS temp
+                    ON {key_match}
+                    WHEN MATCHED AND {row_changed} THEN
+                        UPDATE SET {', '.join(f'{col} = temp.{col}' for col in value_columns)}
+                    WHEN NOT MATCHED BY TARGET THEN
+                        INSERT ({', '.join(columns)}) VALUES ({', '.join(f'temp.{col}' for col in columns)})
+                    OUTPUT $action;
+                """
+                actions = [row[0] for row in con.execute(text(merge_query)).fetchall()]
+                inserted, updated = actions.count("INSERT"), actions.count("UPDATE")
+            else:
+                update_query = f"""
+                    UPDATE {target} AS main
+                    SET {', '.join(f'{col} = temp.{col}' for col in value_columns)}
+                    FROM {staging} AS temp
+                    WHERE {key_match} AND {row_changed}
+                """
+                updated = con.execute(text(update_query)).rowcount if value_columns else 0
+                insert_query = f"""
+                    INSERT INTO {target} ({', '.join(columns)})
+                    SELECT {', '.join(f'temp.{col}' for col in columns)}
+                    FROM {staging} AS temp
+                    WHERE NOT EXISTS (SELECT 1 FROM {target} AS main WHERE {key_match})
+                """
+                inserted = con.execute(text(insert_query)).rowcount
+
+        con.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+    except Exception as e:
+        logging.exception("Error upserting into %s: %s", table_name, e)
+        raise
+
+    counts = {"inserted": inserted, "updated": updated, "skipped": len(df) - inserted - updated}
+    logging.info("Upserted into %s: %s", table_name, counts)
+    return counts
+
+
 # Logging configuration
 logging.basicConfig(level=logging.INFO)
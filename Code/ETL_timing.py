@@ -0,0 +1,123 @@
+"""
+Stage timing of the GSTAT ETL.
+
+StageTimer records spans (stage name, labels such as file, sheet or table, duration) with the monotonic
+time.perf_counter clock, logs each span as one JSON line and sums them per stage at the end of a run:
+
+    timer = StageTimer('GSTAT')
+    with timer.span('read', file=file, sheet=sheet_name):
+        ...
+
+    @timer.timed('transform')
+    def transform(...):
+        ...
+"""
+
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Collects the timed spans of one ETL run, safe to share between threads."""
+
+    def __init__(self, run_name, log_spans=True):
+        """
+        Parameters:
+            run_name (str): Name of the run written in every span, e.g. 'GSTAT'.
+            log_spans (bool): Log every span as it is recorded. A worker process timer does not,
+                its spans are logged when the main process records them.
+        """
+        self.run_name = run_name
+        self.log_spans = log_spans
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        """Seconds since the timer was created."""
+        return time.perf_counter() - self.started
+
+    def record(self, stage, seconds, status='ok', **labels):
+        """
+        Add a span measured elsewhere (e.g. the elapsed time of a download result) and log it.
+
+        Parameters:
+            stage (str): Stage name: download, read, transform, stage, merge, load or audit.
+            seconds (float): Duration of the span.
+            status (str): 'ok', or 'error' if the timed code raised.
+            **labels: Labels of the span, such as file, sheet or table.
+
+        Returns:
+            dict: The recorded span.
+        """
+        span = {'run': self.run_name, 'stage': stage, **labels, 'seconds': round(seconds, 6), 'status': status}
+        with self._lock:
+            self.spans.append(span)
+        if self.log_spans:
+            # One JSON object per line so the timings can be parsed back from the log files
+            logging.info(f"stage_timing {json.dumps(span, ensure_ascii=False, default=str)}")
+        return span
+
+    def record_spans(self, spans):
+        """Add the spans recorded by another timer, e.g. in a worker process, to this run."""
+        for span in spans:
+            labels = {key: value for key, value in span.items() if key not in ('run', 'stage', 'seconds', 'status')}
+            self.record(span['stage'], span['seconds'], span['status'], **labels)
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """Time the body of a with block as one span of stage, recorded even if the block raises."""
+        status = 'ok'
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - started, status, **labels)
+
+    def timed(self, stage, **labels):
+        """Decorator timing every call of a function as one span of stage."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(stage, **labels):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def total(self, stage=None, **labels):
+        """Sum of the spans of stage (all stages if None) whose labels match the given ones."""
+        with self._lock:
+            spans = list(self.spans)
+        return sum(span['seconds'] for span in spans
+                   if (stage is None or span['stage'] == stage)
+                   and all(span.get(key) == value for key, value in labels.items()))
+
+    def summary(self):
+        """
+        Total seconds and number of spans per stage, in the order the stages first ran.
+
+        Nested or concurrent spans overlap, so the totals of different stages do not add up to the run time.
+        """
+        summary = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            stage = summary.setdefault(span['stage'], {'seconds': 0.0, 'spans': 0})
+            stage['seconds'] += span['seconds']
+            stage['spans'] += 1
+        return summary
+
+    def log_summary(self):
+        """Log the per-stage summary and the run wall-clock time as one JSON line."""
+        summary = {'run': self.run_name, 'seconds': round(self.elapsed(), 6),
+                   'stages': {stage: {'seconds': round(values['seconds'], 6), 'spans': values['spans']}
+                              for stage, values in self.summary().items()}}
+        logging.info(f"stage_summary {json.dumps(summary, ensure_ascii=False)}")
+        return summary
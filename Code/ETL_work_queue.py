@@ -0,0 +1,293 @@
+"""
+Work queue shared by several GSTAT ETL workers.
+
+Workbooks (or single sheets) are registered as jobs in a database table. Each worker claims jobs under
+a lease that it renews with heartbeats while it processes them; a job whose lease expired (crashed or
+stalled worker) can be claimed again by another worker:
+
+    work_queue = WorkQueue(engine)
+    work_queue.create_table()
+    work_queue.register([{'job_key': sha256, 'file_name': ..., 'sheets': '1.1,2.1,1.4,2.4'}])
+    for job in work_queue.claim('node-1'):
+        with work_queue.keep_alive(job):
+            ...
+        work_queue.complete(job)
+
+Claiming selects the candidate rows with FOR UPDATE SKIP LOCKED on PostgreSQL and MySQL, and with
+UPDLOCK, READPAST on SQL Server, so workers never wait on each other's rows. Each row is then taken with a
+conditional UPDATE that only succeeds while the row is still claimable, which is also what makes the claim
+safe on SQLite. Every claim gets a new lease token, and heartbeat, complete and fail only apply with the
+token of the current lease, so a worker that lost its lease cannot overwrite the new owner's job.
+A job whose lease expired on its last attempt is marked failed by the next claim.
+"""
+
+import logging
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy
+from sqlalchemy import text
+
+JOBS_TABLE = 'ETL_jobs'
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+# Columns of a job row, in the order of the CREATE TABLE statement
+JOB_COLUMNS = ('job_key', 'file_name', 'file_path', 'file_hash', 'year', 'quarter', 'sheets', 'status', 'owner',
+               'lease_token', 'lease_expires_at', 'heartbeat_at', 'attempts', 'last_error', 'created_at', 'updated_at')
+
+
+def default_worker_id():
+    """Worker id unique across nodes and processes: '<host>:<pid>'."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _now():
+    # Every node writes and compares naive UTC times (the columns have no time zone), their clocks are
+    # expected to be in sync (NTP)
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _quote(engine, name):
+    """Quote an identifier for the dialect of the engine (ETL_com_functions is not imported, it needs ETL_Config)."""
+    return engine.dialect.identifier_preparer.quote(str(name))
+
+
+class WorkQueue:
+    """Jobs table of the ETL workers on a SQLAlchemy engine (SQL Server, PostgreSQL, MySQL or SQLite)."""
+
+    def __init__(self, engine, table_name=JOBS_TABLE, schema=None, lease_seconds=300, max_attempts=3):
+        """
+        Parameters:
+            engine (sqlalchemy.engine.Engine): Database holding the jobs table, shared by all the workers.
+            table_name (str): Name of the jobs table.
+            schema (str, optional): Schema of the jobs table.
+            lease_seconds (int): How long a claim lasts without heartbeat before another worker may take the job.
+            max_attempts (int): Claims of a job before it stays failed.
+        """
+        self.engine = engine
+        self.table_name = table_name
+        self.schema = schema
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.table = f"{_quote(engine, schema)}.{_quote(engine, table_name)}" if schema else _quote(engine, table_name)
+        self._columns = ', '.join(_quote(engine, column) for column in JOB_COLUMNS)
+
+    def create_table(self):
+        """Create the jobs table and its claim index if they do not exist."""
+        if sqlalchemy.inspect(self.engine).has_table(self.table_name, schema=self.schema):
+            return
+        if self.engine.dialect.name == 'mssql':
+            key, name, timestamp, long_text = 'NVARCHAR(100)', 'NVARCHAR(400)', 'DATETIME2', 'NVARCHAR(MAX)'
+        else:
+            key, name, timestamp, long_text = 'VARCHAR(100)', 'VARCHAR(400)', 'TIMESTAMP', 'TEXT'
+        q = lambda column: _quote(self.engine, column)
+        index = _quote(self.engine, f"ix_{self.table_name}_claim")
+        with self.engine.begin() as connection:
+            connection.execute(text(f"""
+                CREATE TABLE {self.table} (
+                    {q('job_key')} {key} NOT NULL PRIMARY KEY,
+                    {q('file_name')} {name} NOT NULL,
+                    {q('file_path')} {long_text},
+                    {q('file_hash')} VARCHAR(64),
+                    {q('year')} VARCHAR(4),
+                    {q('quarter')} VARCHAR(2),
+                    {q('sheets')} VARCHAR(100),
+                    {q('status')} VARCHAR(10) NOT NULL,
+                    {q('owner')} {key},
+                    {q('lease_token')} VARCHAR(32),
+                    {q('lease_expires_at')} {timestamp},
+                    {q('heartbeat_at')} {timestamp},
+                    {q('attempts')} INTEGER NOT NULL,
+                    {q('last_error')} {long_text},
+                    {q('created_at')} {timestamp} NOT NULL,
+                    {q('updated_at')} {timestamp} NOT NULL
+                )"""))
+            connection.execute(text(f"CREATE INDEX {index} ON {self.table} ({q('status')}, {q('lease_expires_at')})"))
+
+    def register(self, jobs):
+        """
+        Add jobs to the queue, keys already registered (by this or another worker) are left as they are.
+
+        Parameters:
+            jobs (list): Dicts with 'job_key' and 'file_name', and optionally 'file_path', 'file_hash',
+                'year', 'quarter' and 'sheets' (comma separated sheet names, all the sheets if empty).
+
+        Returns:
+            int: Number of new jobs.
+        """
+        q = lambda column: _quote(self.engine, column)
+        insert = text(f"INSERT INTO {self.table} ({self._columns}) "
+                      f"VALUES ({', '.join(f':{column}' for column in JOB_COLUMNS)})")
+        with self.engine.connect() as connection:
+            existing = {row[0] for row in connection.execute(text(f"SELECT {q('job_key')} FROM {self.table}"))}
+        registered = 0
+        now = _now()
+        for job in jobs:
+            if job['job_key'] in existing:
+                continue
+            row = {column: job.get(column) for column in JOB_COLUMNS}
+            row.update(status=STATUS_PENDING, attempts=0, created_at=now, updated_at=now)
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(insert, row)
+                registered += 1
+            except sqlalchemy.exc.IntegrityError:
+                # Registered by another worker in the meantime
+                pass
+        logging.info(f"Work queue: {registered} new jobs registered, {len(jobs) - registered} already known")
+        return registered
+
+    def _claimable(self):
+        """Condition of the rows that can be claimed: pending, or running with an expired lease, attempts left."""
+        q = lambda column: _quote(self.engine, column)
+        return (f"({q('status')} = '{STATUS_PENDING}' OR ({q('status')} = '{STATUS_RUNNING}' "
+                f"AND {q('lease_expires_at')} < :now)) AND {q('attempts')} < :max_attempts")
+
+    def claim(self, worker_id, limit=1):
+        """
+        Claim up to limit jobs for worker_id, oldest first.
+
+        Returns:
+            list of dict: The claimed job rows, with the 'lease_token' to pass back to heartbeat, complete and fail.
+        """
+        q = lambda column: _quote(self.engine, column)
+        now = _now()
+        parameters = {'now': now, 'max_attempts': self.max_attempts}
+        dialect = self.engine.dialect.name
+        if dialect == 'mssql':
+            candidates = (f"SELECT TOP ({int(limit)}) {q('job_key')} FROM {self.table} WITH (UPDLOCK, READPAST, ROWLOCK) "
+                          f"WHERE {self._claimable()} ORDER BY {q('created_at')}, {q('job_key')}")
+        elif dialect in ('postgresql', 'mysql'):
+            candidates = (f"SELECT {q('job_key')} FROM {self.table} WHERE {self._claimable()} "
+                          f"ORDER BY {q('created_at')}, {q('job_key')} LIMIT {int(limit)} FOR UPDATE SKIP LOCKED")
+        else:
+            candidates = (f"SELECT {q('job_key')} FROM {self.table} WHERE {self._claimable()} "
+                          f"ORDER BY {q('created_at')}, {q('job_key')} LIMIT {int(limit)}")
+        # Only succeeds if no other worker took the row since it was selected
+        take = text(f"""
+            UPDATE {self.table}
+            SET {q('status')} = '{STATUS_RUNNING}', {q('owner')} = :worker_id, {q('lease_token')} = :lease_token,
+                {q('lease_expires_at')} = :lease_expires_at, {q('heartbeat_at')} = :now,
+                {q('attempts')} = {q('attempts')} + 1, {q('updated_at')} = :now
+            WHERE {q('job_key')} = :job_key AND {self._claimable()}""")
+
+        # Expired leases without attempts left can never be claimed again
+        expire = text(f"""
+            UPDATE {self.table}
+            SET {q('status')} = '{STATUS_FAILED}', {q('last_error')} = :error, {q('lease_expires_at')} = NULL,
+                {q('updated_at')} = :now
+            WHERE {q('status')} = '{STATUS_RUNNING}' AND {q('lease_expires_at')} < :now
+                AND {q('attempts')} >= :max_attempts""")
+
+        claimed = []
+        with self.engine.begin() as connection:
+            expired = connection.execute(expire, {**parameters, 'error': 'lease expired after the last attempt'}).rowcount
+            if expired:
+                logging.warning(f"Work queue: {expired} jobs failed, their lease expired after the last attempt")
+            keys = [row[0] for row in connection.execute(text(candidates), parameters)]
+            for job_key in keys:
+                lease_token = uuid.uuid4().hex
+                result = connection.execute(take, {**parameters, 'job_key': job_key, 'worker_id': worker_id,
+                                                   'lease_token': lease_token,
+                                                   'lease_expires_at': now + timedelta(seconds=self.lease_seconds)})
+                if result.rowcount == 1:
+                    claimed.append(job_key)
+            rows = connection.execute(
+                text(f"SELECT {self._columns} FROM {self.table} WHERE {q('job_key')} IN :job_keys")
+                .bindparams(sqlalchemy.bindparam('job_keys', expanding=True)), {'job_keys': claimed}
+            ).mappings().fetchall() if claimed else []
+        jobs = sorted((dict(row) for row in rows), key=lambda job: claimed.index(job['job_key']))
+        if jobs:
+            logging.info(f"Work queue: {worker_id} claimed {[job['job_key'] for job in jobs]}")
+        return jobs
+
+    def _update_leased(self, job, assignments, parameters):
+        """Apply assignments to a job only while job['lease_token'] is its current lease, return True if applied."""
+        q = lambda column: _quote(self.engine, column)
+        query = text(f"""
+            UPDATE {self.table} SET {assignments}, {q('updated_at')} = :now
+            WHERE {q('job_key')} = :job_key AND {q('lease_token')} = :lease_token AND {q('status')} = '{STATUS_RUNNING}'""")
+        with self.engine.begin() as connection:
+            result = connection.execute(query, {**parameters, 'now': _now(), 'job_key': job['job_key'],
+                                                'lease_token': job['lease_token']})
+        return result.rowcount == 1
+
+    def heartbeat(self, job):
+        """Extend the lease of a claimed job, return False if the lease was lost to another worker."""
+        q = lambda column: _quote(self.engine, column)
+        now = _now()
+        return self._update_leased(job, f"{q('lease_expires_at')} = :lease_expires_at, {q('heartbeat_at')} = :heartbeat_at",
+                                   {'lease_expires_at': now + timedelta(seconds=self.lease_seconds), 'heartbeat_at': now})
+
+    def complete(self, job):
+        """Mark a claimed job as done, return False if its lease was lost (another worker owns it now)."""
+        q = lambda column: _quote(self.engine, column)
+        done = self._update_leased(job, f"{q('status')} = '{STATUS_DONE}', {q('last_error')} = NULL", {})
+        if not done:
+            logging.warning(f"Work queue: lease of {job['job_key']} was lost, not marked as done")
+        return done
+
+    def fail(self, job, error):
+        """
+        Release a claimed job after an error: it is pending again while it has attempts left, else failed.
+
+        Returns:
+            bool: False if the lease was lost.
+        """
+        q = lambda column: _quote(self.engine, column)
+        status = STATUS_FAILED if job['attempts'] >= self.max_attempts else STATUS_PENDING
+        return self._update_leased(job, f"{q('status')} = :status, {q('last_error')} = :error, "
+                                        f"{q('lease_expires_at')} = NULL",
+                                   {'status': status, 'error': str(error)[:4000]})
+
+    def counts(self):
+        """Number of jobs per status."""
+        q = lambda column: _quote(self.engine, column)
+        with self.engine.connect() as connection:
+            rows = connection.execute(text(f"SELECT {q('status')}, COUNT(*) FROM {self.table} GROUP BY {q('status')}"))
+            return {status: count for status, count in rows}
+
+    def active_leases(self):
+        """Number of running jobs whose lease has not expired, i.e. still held by a live worker."""
+        q = lambda column: _quote(self.engine, column)
+        with self.engine.connect() as connection:
+            return connection.execute(
+                text(f"SELECT COUNT(*) FROM {self.table} "
+                     f"WHERE {q('status')} = '{STATUS_RUNNING}' AND {q('lease_expires_at')} >= :now"),
+                {'now': _now()}).scalar()
+
+    @contextmanager
+    def keep_alive(self, job, interval=None):
+        """
+        Send heartbeats for a claimed job from a background thread while the block runs.
+
+        Parameters:
+            job (dict): Job returned by claim.
+            interval (float, optional): Seconds between heartbeats, a third of the lease by default.
+        """
+        stop = threading.Event()
+        interval = interval or self.lease_seconds / 3
+
+        def beat():
+            while not stop.wait(interval):
+                try:
+                    if not self.heartbeat(job):
+                        logging.warning(f"Work queue: lease of {job['job_key']} was lost while processing it")
+                        return
+                except Exception as error:
+                    logging.error(f"Work queue: heartbeat of {job['job_key']} failed: {error}")
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield job
+        finally:
+            stop.set()
+            thread.join()
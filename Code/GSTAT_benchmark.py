@@ -0,0 +1,466 @@
+"""
+Benchmarks for the GSTAT ETL script.
+
+Usage:
+    python GSTAT_benchmark.py anchors "*.xlsx"
+    python GSTAT_benchmark.py bulk --url sqlite:///bench.db --rows 100000
+    python GSTAT_benchmark.py etl --files 8 --sections 21 --countries 200 --json results.json
+    python GSTAT_benchmark.py readers --files 4
+
+anchors: compares the row-wise df.apply anchor detection used before with locate_anchors on the sheets
+         of real ITR workbooks.
+bulk:    loads the same DataFrame with each bulk load method of ETL_com_functions and reports rows/s.
+         Use a SQLite file or a local PostgreSQL ('copy' method) / SQL Server URL as stand-in destination.
+etl:     generates synthetic ITR workbooks, then times the read, transform and load stages of the ETL
+         against a stand-in destination and reports rows/s, files/s and peak RSS of each stage.
+         No network and no SQL Server are needed, so runs on different commits can be compared.
+readers: transforms the same workbooks read with pd.read_excel and with the streaming openpyxl reader and
+         checks that the results are identical, values and dtypes.
+"""
+
+import argparse
+import glob
+import importlib
+import json
+import logging
+import os
+import random
+import subprocess
+import tempfile
+import threading
+import time
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import sqlalchemy
+
+import ETL_com_functions as e
+
+# The ETL script name has a dash, so it cannot be imported with an import statement
+etl = importlib.import_module('GSTAT_refactor-V2')
+
+logging.basicConfig(level=logging.INFO)
+
+# Anchors looked up by the transforms, per sheet
+SHEET_ANCHORS = {
+    '1.1': ['وصف القسم', 'الإجمالي'],
+    '2.1': ['وصف القسم', 'الإجمالي'],
+    '1.4': ['الربع', 'الدولة'],
+    '2.4': ['الربع', 'الدولة'],
+}
+
+
+def apply_locate_anchors(df, anchors):
+    """Row-wise anchor detection as the transforms did it before locate_anchors, returns the same dictionary."""
+    anchor_rows = {}
+    for anchor in anchors:
+        matches = df[df.apply(lambda row: row.astype(str).str.contains(anchor).any(), axis=1)]
+        anchor_rows[anchor] = df.index.get_loc(matches.index[0])
+    return anchor_rows
+
+
+def _best_time(function, repeat):
+    """Return the best wall-clock time in seconds of repeat calls of function."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def benchmark_anchor_detection(pattern, repeat=5):
+    """
+    Time the row-wise and the vectorized anchor detection on every target sheet of the matching workbooks.
+
+    Parameters:
+        pattern (str): Glob pattern of the ITR workbooks.
+        repeat (int): Number of runs per sheet, the best time is kept.
+
+    Returns:
+        list of dict: One row per (file, sheet) with both timings and the speedup.
+    """
+    results = []
+    for file, sheet_name, df in etl.read_workbooks(pattern, list(SHEET_ANCHORS)):
+        anchors = SHEET_ANCHORS[sheet_name]
+        if apply_locate_anchors(df, anchors) != etl.locate_anchors(df, anchors):
+            logging.warning(f"Anchor positions differ for {file} {sheet_name}")
+        apply_time = _best_time(lambda: apply_locate_anchors(df, anchors), repeat)
+        vectorized_time = _best_time(lambda: etl.locate_anchors(df, anchors), repeat)
+        results.append({'file': file, 'sheet': sheet_name, 'rows': len(df),
+                        'apply_ms': apply_time * 1000, 'vectorized_ms': vectorized_time * 1000,
+                        'speedup': apply_time / vectorized_time})
+    return results
+
+
+def benchmark_bulk_load(url, rows, methods, chunksize=None):
+    """
+    Load a DataFrame shaped like a departments table with each bulk load method and measure the throughput.
+
+    Parameters:
+        url (str): SQLAlchemy URL of the stand-in destination database.
+        rows (int): Number of rows to load.
+        methods (list): Bulk load methods to compare, see e.BULK_LOAD_METHODS.
+        chunksize (int, optional): Rows per batch.
+
+    Returns:
+        list of dict: One row per method with the duration and rows per second.
+    """
+    engine = sqlalchemy.create_engine(url)
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'Section_number': np.arange(rows) % 21 + 1,
+        'Section_description': [f"section {i % 21 + 1}" for i in range(rows)],
+        'Year': '2024',
+        'Quarter': 'Q1',
+        'Previous_Value': rng.random(rows) * 1e6,
+        'Previous_Quarter': 'الربع الرابع',
+        'Previous_Year': '2023',
+        'Current_Value': rng.random(rows) * 1e6,
+        'Current_Quarter': 'الربع الأول',
+        'Current_Year': '2024',
+    })
+
+    results = []
+    for method in methods:
+        duration = e.bulk_load_dataframe(df, f"bench_{method}", engine, method=method,
+                                         chunksize=chunksize, if_exists='replace')
+        results.append({'method': method, 'rows': rows, 'seconds': duration, 'rows_per_s': rows / duration})
+    engine.dispose()
+    return results
+
+
+# Arabic quarter headers of the synthetic workbooks, the reverse of etl.mapping_quarters
+QUARTER_NAMES = {1: 'الربع الأول', 2: 'الربع الثاني', 3: 'الربع الثالث', 4: 'الربع الرابع'}
+
+
+def write_synthetic_workbook(path, year, quarter, sections=21, countries=200, seed=0):
+    """
+    Write an ITR-style workbook with the layout expected by the transforms.
+
+    Sheets 1.1 and 2.1 hold a 'وصف القسم' header block (quarter names, years, 'القيمة') above one row per
+    section and a 'الإجمالي' row. Sheets 1.4 and 2.4 hold the 'الربع <quarter> <year>' title and a
+    'الأقسام الدولة' header with the section columns of etl.sections_columns_renamed above one row per country.
+
+    Parameters:
+        path (str): Path of the .xlsx file to write.
+        year (int), quarter (int): Quarter of the workbook.
+        sections (int): Rows of the departments sheets.
+        countries (int): Rows of the countries sheets.
+        seed (int): Seed of the random values, the same arguments always write the same values.
+    """
+    rng = random.Random(seed)
+    previous_year, previous_quarter = (year, quarter - 1) if quarter > 1 else (year - 1, 4)
+    # One source column per destination section column
+    section_names = list({target: source for source, target in etl.sections_columns_renamed.items()
+                          if not target.startswith('الدولة')}.values())
+
+    workbook = openpyxl.Workbook(write_only=True)
+    for sheet_name in ('1.1', '2.1'):
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append(['الفهرس'])
+        sheet.append(['التجارة الدولية حسب الأقسام'])
+        sheet.append([])
+        sheet.append([None, 'وصف القسم', f"{QUARTER_NAMES[quarter]} 1", f"{QUARTER_NAMES[previous_quarter]} 2",
+                      f"{QUARTER_NAMES[quarter]} 3"])
+        sheet.append([None, None, str(year - 1), str(previous_year), f"{year}*"])
+        sheet.append([None, None, 'القيمة', 'القيمة', 'القيمة'])
+        for number in range(1, sections + 1):
+            sheet.append([number, section_names[(number - 1) % len(section_names)],
+                          rng.random() * 1e6, rng.random() * 1e6, rng.random() * 1e6])
+        sheet.append([None, 'الإجمالي', 0, 0, 0])
+        sheet.append(['* بيانات أولية'])
+    for sheet_name in ('1.4', '2.4'):
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append(['التجارة الدولية حسب الدول'])
+        sheet.append([f"{QUARTER_NAMES[quarter]} {year}"])
+        sheet.append([])
+        sheet.append(['الأقسام الدولة', 'الإجمالي'] + section_names)
+        for number in range(countries):
+            sheet.append([f"دولة {number}", rng.random() * 1e7] + [rng.random() * 1e5 for _ in section_names])
+        sheet.append(['دول أخرى', 0] + [0] * len(section_names))
+        sheet.append(['المصدر: الهيئة العامة للإحصاء'])
+    workbook.save(path)
+
+
+def generate_synthetic_workbooks(directory, files, sections=21, countries=200):
+    """Write files workbooks named like the published ones for consecutive quarters, from Q1 2021."""
+    paths = []
+    for index in range(files):
+        year, quarter = 2021 + index // 4, index % 4 + 1
+        path = os.path.join(directory, f"ITR Q{quarter}{year}A.xlsx")
+        write_synthetic_workbook(path, year, quarter, sections, countries, seed=index)
+        paths.append(path)
+    return paths
+
+
+def _current_rss():
+    """Resident set size of this process in bytes, None if it cannot be read on this platform."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class PeakRss:
+    """
+    Context manager sampling the RSS of the process in a background thread and keeping the peak.
+
+    Unlike ru_maxrss, which is the peak of the whole process life, the peak is reset for each stage.
+    Memory of worker processes (read with --read-workers > 1) is not included.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while True:
+            rss = _current_rss()
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            if self._stop.wait(self.interval):
+                break
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def _git_commit():
+    """Short hash of the checked out commit, to label the results, or None outside a git repository."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _measure(stage, files, function):
+    """Run function and return (its result, the stage row with seconds, files/s and peak RSS)."""
+    with PeakRss() as rss:
+        started = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - started
+    return result, {'stage': stage, 'seconds': seconds, 'files': files, 'files_per_s': files / seconds,
+                    'peak_rss_mb': rss.peak / 2 ** 20 if rss.peak else None}
+
+
+def create_destination_tables(engine, transformed_dataframes):
+    """
+    Recreate empty stand-in destination tables with the column types of the staging tables.
+
+    The types are those load_table stages: NVARCHAR keys and labels, numeric value columns and a
+    datetime STG_CreatedDate. A table created from an empty frame has only text columns, and the
+    values stored as text never compare equal to the numbers of the staging table, so an identical
+    rerun would update every row.
+
+    Parameters:
+        engine (sqlalchemy.engine.Engine): Stand-in destination database.
+        transformed_dataframes (dict): Sheet name -> list of transformed DataFrames.
+    """
+    with engine.begin() as connection:
+        for sheet_name, dfs in transformed_dataframes.items():
+            table_name = etl.table_mappings[sheet_name]
+            df, datatypes = etl.prepare_load_frame(sheet_name, dfs)
+            connection.execute(sqlalchemy.text(f'DROP TABLE IF EXISTS "{table_name}"'))
+            connection.execute(sqlalchemy.text(pd.io.sql.get_schema(df, table_name, con=connection,
+                                                                     dtype=datatypes)))
+
+
+def benchmark_etl(files, sections, countries, url, directory=None, read_workers=1, streaming=True,
+                  bulk_method='default', compact=False, batch=False):
+    """
+    Time the read, transform and load stages of the ETL on synthetic workbooks.
+
+    Parameters:
+        files (int): Number of workbooks to generate.
+        sections (int): Rows of the departments sheets.
+        countries (int): Rows of the countries sheets.
+        url (str): SQLAlchemy URL of the stand-in destination (SQLite file or local PostgreSQL).
+        directory (str, optional): Directory of the workbooks, a temporary one if None.
+        read_workers (int): Worker processes of read_workbook_sheets.
+        streaming (bool): Read with the bounded openpyxl reader instead of pd.read_excel.
+        bulk_method (str): Bulk load method of the staging tables, see e.BULK_LOAD_METHODS.
+        compact (bool): Run the transforms in compact mode (see etl.compact_frame).
+        batch (bool): Transform each sheet of all the files at once (see etl.transform_departments_batch).
+
+    Returns:
+        list of dict: One row per stage with seconds, rows, rows/s, files/s, peak RSS in MB and
+        the memory of the DataFrames the stage returns in MB.
+    """
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        directory = directory or temporary_directory
+        os.makedirs(directory, exist_ok=True)
+        generate_synthetic_workbooks(directory, files, sections, countries)
+        pattern = os.path.join(directory, 'ITR Q*.xlsx')
+        etl.stage_timer = etl.StageTimer('benchmark')
+
+        sheets_data, read_row = _measure('read', files, lambda: etl.read_workbook_sheets(
+            pattern, max_workers=read_workers, streaming=streaming, with_files=batch))
+        read_row['rows'] = sum(len(sheet[-1]) for group in sheets_data.values() for sheet in group)
+        read_row['frames_mb'] = sum(sheet[-1].memory_usage(deep=True).sum()
+                                    for group in sheets_data.values() for sheet in group) / 2 ** 20
+
+        if batch:
+            transform_departments, transform_countries = etl.transform_departments_batch, etl.transform_countries_batch
+        else:
+            transform_departments, transform_countries = etl.transform_by_departments_data, etl.transform_by_countries_data
+        transform_dfs, transform_row = _measure('transform', files, lambda: {
+            **transform_departments(sheets_data['departments'], compact),
+            **transform_countries(sheets_data['countries'], compact)})
+        transform_row['rows'] = sum(len(df) for dfs in transform_dfs.values() for df in dfs)
+        transform_row['frames_mb'] = sum(df.memory_usage(deep=True).sum()
+                                         for dfs in transform_dfs.values() for df in dfs) / 2 ** 20
+
+        engine = sqlalchemy.create_engine(url)
+        create_destination_tables(engine, transform_dfs)
+        (_, table_stats), load_row = _measure('load', files, lambda: etl.load_transformed_dataframes(
+            transform_dfs, engine, None, bulk_method))
+        load_row['rows'] = sum(stats['rows'] for stats in table_stats.values())
+        load_row['frames_mb'] = 0.0
+        engine.dispose()
+
+    results = [read_row, transform_row, load_row]
+    for row in results:
+        row['rows_per_s'] = row['rows'] / row['seconds']
+    return results
+
+
+def compare_readers(pattern, compact=False, batch=False):
+    """
+    Transform the workbooks read with pd.read_excel and with read_sheet_block and compare the DataFrames.
+
+    The streaming reader only keeps the block of each sheet, so the raw sheets differ, but the transformed
+    DataFrames must be identical: same values and same dtypes. A dtype difference in a key column (e.g.
+    Section_number 1.0 instead of 1) is written as a different NVARCHAR key and duplicates rows on upsert.
+
+    Parameters:
+        pattern (str): Glob pattern of the workbooks.
+        compact (bool): Run the transforms in compact mode (see etl.compact_frame).
+        batch (bool): Use the batch transforms (see etl.transform_departments_batch).
+
+    Returns:
+        list of dict: One row per sheet with the number of DataFrames, 'equal' and the first difference found.
+    """
+    if batch:
+        transform_departments, transform_countries = etl.transform_departments_batch, etl.transform_countries_batch
+    else:
+        transform_departments, transform_countries = etl.transform_by_departments_data, etl.transform_by_countries_data
+    transformed = {}
+    for streaming in (False, True):
+        sheets_data = etl.read_workbook_sheets(pattern, streaming=streaming, with_files=batch)
+        transformed[streaming] = {**transform_departments(sheets_data['departments'], compact),
+                                  **transform_countries(sheets_data['countries'], compact)}
+
+    results = []
+    for sheet_name in sorted(set(transformed[False]) | set(transformed[True])):
+        pandas_dfs, streaming_dfs = transformed[False].get(sheet_name, []), transformed[True].get(sheet_name, [])
+        difference = None
+        if len(pandas_dfs) != len(streaming_dfs):
+            difference = f"{len(pandas_dfs)} DataFrames with pd.read_excel, {len(streaming_dfs)} streaming"
+        for pandas_df, streaming_df in zip(pandas_dfs, streaming_dfs):
+            try:
+                # The row index holds sheet row numbers, which the streaming reader does not keep, and is not loaded
+                pd.testing.assert_frame_equal(pandas_df.reset_index(drop=True), streaming_df.reset_index(drop=True),
+                                              check_dtype=True, check_exact=True)
+            except AssertionError as error:
+                difference = difference or ' '.join(str(error).split())
+        results.append({'sheet': sheet_name, 'frames': len(pandas_dfs), 'equal': difference is None,
+                        'difference': difference})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    anchors_parser = subparsers.add_parser('anchors', help='row-wise vs vectorized anchor detection')
+    anchors_parser.add_argument('pattern', help='glob pattern of the ITR workbooks, e.g. "*.xlsx"')
+    anchors_parser.add_argument('--repeat', type=int, default=5)
+
+    bulk_parser = subparsers.add_parser('bulk', help='bulk load throughput per method')
+    bulk_parser.add_argument('--url', default='sqlite:///gstat_benchmark.db', help='SQLAlchemy URL of the destination')
+    bulk_parser.add_argument('--rows', type=int, default=100000)
+    bulk_parser.add_argument('--methods', nargs='+', default=['default', 'multirow', 'fast_executemany'],
+                             choices=e.BULK_LOAD_METHODS)
+    bulk_parser.add_argument('--chunksize', type=int)
+
+    etl_parser = subparsers.add_parser('etl', help='read, transform and load stages on synthetic workbooks')
+    etl_parser.add_argument('--files', type=int, default=8, help='number of synthetic workbooks')
+    etl_parser.add_argument('--sections', type=int, default=21, help='rows of the departments sheets')
+    etl_parser.add_argument('--countries', type=int, default=200, help='rows of the countries sheets')
+    etl_parser.add_argument('--url', default='sqlite:///gstat_benchmark.db', help='SQLAlchemy URL of the destination')
+    etl_parser.add_argument('--directory', help='keep the generated workbooks in this directory')
+    etl_parser.add_argument('--read-workers', type=int, default=1)
+    etl_parser.add_argument('--pandas-reader', action='store_true', help='read with pd.read_excel instead of openpyxl')
+    etl_parser.add_argument('--method', default='default', choices=e.BULK_LOAD_METHODS)
+    etl_parser.add_argument('--compact', action='store_true', help='compact transforms (categories, downcast values)')
+    etl_parser.add_argument('--batch', action='store_true', help='transform all the files of a sheet at once')
+    etl_parser.add_argument('--json', help='append the results with the commit hash to this JSON lines file')
+
+    readers_parser = subparsers.add_parser('readers', help='pd.read_excel and streaming reader give the same data')
+    readers_parser.add_argument('--pattern', help='glob pattern of ITR workbooks, synthetic ones are generated if not given')
+    readers_parser.add_argument('--files', type=int, default=4, help='number of synthetic workbooks')
+    readers_parser.add_argument('--compact', action='store_true', help='compact transforms (categories, downcast values)')
+    readers_parser.add_argument('--batch', action='store_true', help='transform all the files of a sheet at once')
+
+    args = parser.parse_args()
+
+    if args.benchmark == 'anchors':
+        results = benchmark_anchor_detection(args.pattern, args.repeat)
+        print(f"{'file':40} {'sheet':6} {'rows':>6} {'apply ms':>10} {'vector ms':>10} {'speedup':>8}")
+        for row in results:
+            print(f"{row['file'][-40:]:40} {row['sheet']:6} {row['rows']:>6} "
+                  f"{row['apply_ms']:>10.2f} {row['vectorized_ms']:>10.2f} {row['speedup']:>7.1f}x")
+    elif args.benchmark == 'bulk':
+        results = benchmark_bulk_load(args.url, args.rows, args.methods, args.chunksize)
+        print(f"{'method':18} {'rows':>9} {'seconds':>9} {'rows/s':>10}")
+        for row in results:
+            print(f"{row['method']:18} {row['rows']:>9} {row['seconds']:>9.2f} {row['rows_per_s']:>10.0f}")
+    elif args.benchmark == 'etl':
+        logging.getLogger().setLevel(logging.WARNING)
+        results = benchmark_etl(args.files, args.sections, args.countries, args.url, args.directory,
+                                args.read_workers, not args.pandas_reader, args.method, args.compact, args.batch)
+        print(f"{'stage':10} {'rows':>9} {'seconds':>9} {'rows/s':>10} {'files/s':>8} {'peak RSS MB':>12} "
+              f"{'frames MB':>10}")
+        for row in results:
+            peak = f"{row['peak_rss_mb']:.1f}" if row['peak_rss_mb'] is not None else 'n/a'
+            print(f"{row['stage']:10} {row['rows']:>9} {row['seconds']:>9.2f} {row['rows_per_s']:>10.0f} "
+                  f"{row['files_per_s']:>8.2f} {peak:>12} {row['frames_mb']:>10.2f}")
+        if args.json:
+            with open(args.json, 'a', encoding='utf-8') as output:
+                output.write(json.dumps({'commit': _git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                                         'args': vars(args), 'stages': results}) + '\n')
+    elif args.benchmark == 'readers':
+        logging.getLogger().setLevel(logging.WARNING)
+        etl.stage_timer = etl.StageTimer('benchmark')
+        with tempfile.TemporaryDirectory() as directory:
+            pattern = args.pattern
+            if pattern is None:
+                generate_synthetic_workbooks(directory, args.files)
+                pattern = os.path.join(directory, 'ITR Q*.xlsx')
+            results = compare_readers(pattern, args.compact, args.batch)
+        print(f"{'sheet':6} {'frames':>6} {'equal':>6}  difference")
+        for row in results:
+            print(f"{row['sheet']:6} {row['frames']:>6} {str(row['equal']):>6}  {row['difference'] or ''}")
+        if not all(row['equal'] for row in results):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
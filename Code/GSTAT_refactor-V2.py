@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 from datetime import datetime
 import time
 import re
@@ -7,14 +8,25 @@ import sqlalchemy
 from sqlalchemy import text  #used when create temp table
 from sqlalchemy.exc import SQLAlchemyError
 import os #to get the current working directory
-import shutil # to move file to another directory
 import glob #module to find all files matching the pattern
+import hashlib #to key the parse cache by file content
+import io #to parse workbooks downloaded in memory
+import openpyxl #to stream only the needed rows of a sheet
+import sqlite3 #local state store of the incremental mode
+from concurrent.futures import ProcessPoolExecutor #to parse Excel files on several cores
+from concurrent.futures import ThreadPoolExecutor #to load independent tables concurrently
+import queue #bounded queues between the stages of the streaming pipeline
+import threading
 #to identify columns with Arabic chars with NVARCHAR datatype
 from sqlalchemy.dialects.mssql import NVARCHAR 
 
 # Import custom modules
 import ETL_Config as c
 import ETL_com_functions as e
+import Scraping_GSTAT_Data as s
+from ETL_timing import StageTimer
+from ETL_archive import ArchiveStore
+from ETL_work_queue import WorkQueue, JOBS_TABLE, default_worker_id
 
 """
 We configure logging using basicConfig() to set the logging level to INFO. 
@@ -23,7 +35,9 @@ This means that only messages with severity level INFO and higher will be logged
 logging.basicConfig(level=logging.INFO)
 
 # Initialize global variables for database connections and configurations
-Engine_DMDQ, Engine, SchemaName, database_name, num_src, start_time = None, None, None, None, None, None
+Engine_DMDQ, Engine, SchemaName, database_name, num_src = None, None, None, None, None
+# Spans of the current run (read, transform, stage, merge, load, audit), replaced by main for each run
+stage_timer = StageTimer('GSTAT')
 
 def get_database_config(config_key):
     """Retrieve database configuration from ETL configuration module."""
@@ -33,14 +47,15 @@ def get_database_config(config_key):
         logging.error(f"Configuration key {config_key} not found: {error}")
         raise
 
-def establish_connections(dest_config_key, dmdq_config_key):
+def establish_connections(dest_config_key, dmdq_config_key, pool_size=5):
     """
     Establishes database connections based on provided configuration keys.
+    pool_size is the number of pooled connections of the destination engine, at least the number of tables loaded concurrently.
     """
     global Engine_DMDQ, Engine, SchemaName, database_name
     try:
         # Establish connections to the destination and DM_Quality databases
-        Engine_DMDQ, Engine = e.connect_to_databases(dest_config_key, dmdq_config_key)
+        Engine_DMDQ, Engine = e.connect_to_databases(dest_config_key, dmdq_config_key, pool_size)
         # Retrieve schema and database name from configuration
         SchemaName = get_database_config(dest_config_key)["schema"]
         database_name = get_database_config(dest_config_key)["database"]
@@ -49,12 +64,36 @@ def establish_connections(dest_config_key, dmdq_config_key):
         logging.error(f"Error establishing database connections: {error}")
         raise
 
-def move_file_to_archive(file_path):
+# Archive stores opened by get_archive_store, one per archive directory for the whole process
+_archive_stores = {}
+_archive_stores_lock = threading.Lock()
+
+def get_archive_store(archive_directory=None):
+    """
+    Return the ArchiveStore of an archive directory, 'Archive' in the current working directory by default.
+
+    The store is opened once per directory. On first use, the workbooks of the flat 'Archive' folder used before
+    the store existed are moved into it.
     """
-    Move files with names matching 'Monthly_Bulletin_*xlsx' to the 'Archive' directory.
+    archive_directory = os.path.abspath(archive_directory or os.path.join(os.getcwd(), 'Archive'))
+    with _archive_stores_lock:
+        store = _archive_stores.get(archive_directory)
+        if store is None:
+            store = ArchiveStore(archive_directory)
+            store.import_flat_files(describe=s.archive_description)
+            _archive_stores[archive_directory] = store
+    return store
+
+def move_file_to_archive(file_path, archive_directory=None):
+    """
+    Move files with names matching the pattern into the archive store of the 'Archive' directory.
+
+    Each file is stored once under its SHA-256 (see ETL_archive.ArchiveStore) and indexed with its URL,
+    year and quarter, then removed from the current working directory.
 
     Parameters:
     file_path (str): The pattern file name we need to look for inside current working dir.
+    archive_directory (str, optional): Archive directory, 'Archive' in the current working directory by default.
 
     Returns:
     None
@@ -66,7 +105,6 @@ def move_file_to_archive(file_path):
     """
     try:
         save_directory = os.getcwd()
-        archive_directory = os.path.join(save_directory, 'Archive') # Join the current working directory with the subdirectory 'Archive'
         # Find all files matching the pattern
         pattern = os.path.join(save_directory, file_path)
         files = glob.glob(pattern)
@@ -75,9 +113,11 @@ def move_file_to_archive(file_path):
             logging.info("No files matching the pattern were found.")
             return
         
+        store = get_archive_store(archive_directory)
         for file_path in files:
-            shutil.move(file_path, archive_directory)
-            logging.info(f"File moved to: {archive_directory}")
+            # A republished workbook replaces its older copy in the archive, identical content is stored once
+            store.put_file(file_path, **s.archive_description(os.path.basename(file_path)))
+            logging.info(f"File moved to: {store.archive_directory}")
 
     except FileNotFoundError as e:
         logging.error(f"File not found: {file_path}. Exception: {e}")
@@ -86,94 +126,393 @@ def move_file_to_archive(file_path):
     except Exception as e:
         logging.error(f"An error occurred while moving the file: {file_path}. Exception: {e}")
 
-def read_departments_sheets(pattern):
+def write_to_archive(file_name, content, archive_directory=None):
     """
-    Read sheets: 1.1, 2.1 in an Excel file and return them as a list of tuples.
+    Write the bytes of a workbook parsed in memory to the archive store, replacing an older copy.
+
+    The blob is written to a '.part' file renamed once complete, then indexed, so the scraper never finds
+    a truncated archive copy.
 
     Parameters:
-        pattern (str): Glob pattern to match the Excel files.
+    file_name (str): Name of the workbook, e.g. 'ITR Q12024A.xlsx'.
+    content (bytes): Bytes of the workbook.
+    archive_directory (str, optional): Archive directory, 'Archive' in the current working directory by default.
 
     Returns:
-        list of tuples: sheets_data, a tuple where the first elements are sheet names and the second values are corresponding DataFrames.
+    None
     """
-    global start_time
-    sheets_data = []
-
     try:
-        start_time = time.time()
-        # 1. Find all files matching the pattern which is '*.xlsx'
-        files = glob.glob(pattern)
-        if not files:
-            print("No files matching the pattern were found.")
-            return sheets_data
-        
-        logging.info(f"Started reading Departments data")
-        # 2. Read all sheets into a dictionary of DataFrames, key is sheet_name and value the sheet data
-        for file in files:
+        store = get_archive_store(archive_directory)
+        store.put(content, file_name, **s.archive_description(os.path.basename(file_name)))
+        logging.info(f"File written to: {store.archive_directory}")
+    except Exception as e:
+        logging.error(f"An error occurred while archiving the file: {file_name}. Exception: {e}")
+
+# Sheets read from every workbook, grouped by the transform that consumes them
+SHEET_GROUPS = {
+    'departments': ['1.1', '2.1'],
+    'countries': ['1.4', '2.4'],
+}
+
+# Bump PARSER_VERSION whenever the way sheets are parsed changes, it invalidates every cached sheet
+PARSER_VERSION = '2'
+PARSE_CACHE_DIR = '.parse_cache'
+PARSE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+def file_sha256(file_path):
+    """Return the SHA-256 hex digest of a file, read in 1 MB blocks."""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def _parse_cache_path(cache_dir, file_hash, sheet_name):
+    """Base path (without extension) of a cached sheet, keyed by file hash, sheet name and parser version."""
+    return os.path.join(cache_dir, f"{file_hash}_{sheet_name}_v{PARSER_VERSION}")
+
+def read_cached_sheet(cache_dir, file_hash, sheet_name):
+    """
+    Return the cached DataFrame of a parsed sheet, or None if it is not in the cache.
+
+    The cache file modification time is refreshed on every hit, evict_parse_cache uses it as the LRU order.
+    """
+    base_path = _parse_cache_path(cache_dir, file_hash, sheet_name)
+    for extension, reader in (('.parquet', pd.read_parquet), ('.pkl', pd.read_pickle)):
+        cache_path = base_path + extension
+        if os.path.exists(cache_path):
             try:
-                excel_data = pd.read_excel(file, sheet_name=['1.1', '2.1'])
-                
-                # 3. Convert dictionary to a list of tuples, first element of each tuple is sheet name and second sheet data
-                for sheet_name in excel_data:
-                    sheets_data.append((sheet_name, excel_data[sheet_name]))
-                    
-                logging.info(f"Finished reading {file}")
-                    
-            except FileNotFoundError:
-                logging.error(f"File {file} not found.")
-                continue
+                df = reader(cache_path)
+                os.utime(cache_path)
+                return df
             except Exception as e:
-                logging.error(f"An error occurred while reading Excel file {file}: {str(e)}")
+                logging.warning(f"Ignoring unreadable cache file {cache_path}: {e}")
+    return None
+
+def write_cached_sheet(cache_dir, file_hash, sheet_name, df):
+    """
+    Store a parsed sheet in the cache as Parquet.
+
+    Raw sheets often mix numbers and text in the same column, or have non-text column names, which Parquet
+    cannot store as is. When writing fails or the sheet does not read back identical, it is pickled instead.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    base_path = _parse_cache_path(cache_dir, file_hash, sheet_name)
+    temp_path = f"{base_path}.{os.getpid()}.tmp"
+    try:
+        try:
+            df.to_parquet(temp_path, index=True)
+            if pd.read_parquet(temp_path).equals(df):
+                os.replace(temp_path, base_path + '.parquet')
+                return
+        except Exception:
+            pass
+        df.to_pickle(temp_path)
+        os.replace(temp_path, base_path + '.pkl')
+    except Exception as e:
+        logging.warning(f"Could not cache sheet {sheet_name}: {e}")
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def evict_parse_cache(cache_dir, max_bytes=PARSE_CACHE_MAX_BYTES):
+    """Delete the least recently used cached sheets until the cache directory is not larger than max_bytes."""
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total_size -= size
+        except OSError as e:
+            logging.warning(f"Could not evict cache file {path}: {e}")
+
+# Anchors (start, end) of the rows each transform needs, used by the streaming reader.
+# The block starts at the first row containing the start anchor and ends with the row containing the end anchor,
+# which is kept because the transforms look it up.
+SHEET_BLOCKS = {
+    '1.1': ('وصف القسم', 'الإجمالي'),
+    '2.1': ('وصف القسم', 'الإجمالي'),
+    '1.4': ('الربع', None), # the quarter row is above the 'الدولة' header row, countries run to the end of the sheet
+    '2.4': ('الربع', None),
+}
+
+def _convert_cell(value):
+    """Convert an openpyxl cell value the way pd.read_excel does: empty -> NaN, whole floats -> int."""
+    if value is None:
+        return float('nan')
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def _contains_anchor(row, anchor):
+    """True if any cell of the row contains the anchor text."""
+    return any(anchor in str(value) for value in row if value is not None)
+
+def read_sheet_block(worksheet, start_anchor=None, end_anchor=None):
+    """
+    Read only the bounded data block of a worksheet opened with openpyxl in read-only mode.
+
+    Rows are streamed with values_only, rows before the start anchor are skipped and reading stops after
+    the end anchor row, so trailing notes and formatting rows are never materialised.
+
+    Parameters:
+        worksheet: openpyxl read-only worksheet.
+        start_anchor (str, optional): Text of the first row to keep, None keeps every row after the header.
+        end_anchor (str, optional): Text of the last row to keep, None reads to the end of the sheet.
+
+    Returns:
+        pd.DataFrame: The block with a 0-based index and the column names pd.read_excel would give the sheet
+        (first sheet row, empty cells named 'Unnamed: <position>', duplicates suffixed '.1', '.2', ...),
+        so transform_by_departments_data and transform_by_countries_data can use it as is.
+        Every column is kept as object like pd.read_excel reads the ITR sheets, whose columns all hold
+        some text outside the block: whole numbers stay int (Section_number 1, not 1.0).
+    """
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame()
+
+    block = []
+    started = start_anchor is None
+    for row in rows:
+        if not started:
+            if not _contains_anchor(row, start_anchor):
                 continue
-                
-        return sheets_data
-    
+            started = True
+        elif end_anchor is not None and _contains_anchor(row, end_anchor):
+            block.append(row)
+            break
+        block.append(row)
+
+    # Drop trailing empty cells, then pad every row to the widest one like pd.read_excel
+    def trim(row):
+        row = list(row)
+        while row and row[-1] is None:
+            row.pop()
+        return row
+    header = trim(header)
+    block = [trim(row) for row in block]
+    width = max([len(header)] + [len(row) for row in block])
+
+    columns, seen = [], {}
+    for position in range(width):
+        name = _convert_cell(header[position]) if position < len(header) and header[position] is not None else f"Unnamed: {position}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+
+    data = [[_convert_cell(value) for value in row] + [float('nan')] * (width - len(row)) for row in block]
+    # Without the text rows around the block, pandas would infer float64 for number columns with empty cells
+    return pd.DataFrame(data, columns=columns, dtype=object)
+
+def read_workbook(file, sheet_names, cache_dir=None, streaming=False, content=None):
+    """
+    Open one Excel file and parse the given sheets from it.
+
+    This is a module level function so it can run in a worker process of read_workbooks.
+
+    Parameters:
+        file (str): Path of the Excel file.
+        sheet_names (list): Names of the sheets to parse.
+        cache_dir (str, optional): Parse cache directory. Sheets already cached for the same file content
+            are loaded from there, and the workbook is only opened if some sheets are missing.
+        streaming (bool): Read the sheets with read_sheet_block instead of pd.read_excel, keeping only
+            the rows between the SHEET_BLOCKS anchors.
+        content (bytes, optional): Bytes of the workbook, parsed from memory instead of reading file,
+            which is then only the name used in the logs and the results.
+
+    Returns:
+        list of tuples: (file, sheet_name, DataFrame) in the order of sheet_names, missing sheets are skipped.
+    """
+    sheets = {}
+    try:
+        if content is not None:
+            file_hash = hashlib.sha256(content).hexdigest() if cache_dir else None
+        else:
+            file_hash = file_sha256(file) if cache_dir else None
+        # openpyxl and pandas read a file-like object the same way as a path
+        source = io.BytesIO(content) if content is not None else file
+        # Whole sheets and bounded blocks are different results, they are cached under different keys
+        cache_keys = {sheet_name: f"{sheet_name}_block" if streaming else sheet_name for sheet_name in sheet_names}
+        if cache_dir:
+            for sheet_name in sheet_names:
+                with stage_timer.span('read_sheet', file=file, sheet=sheet_name, source='cache'):
+                    df = read_cached_sheet(cache_dir, file_hash, cache_keys[sheet_name])
+                if df is not None:
+                    sheets[sheet_name] = df
+
+        missing_sheets = [sheet_name for sheet_name in sheet_names if sheet_name not in sheets]
+        if missing_sheets and streaming:
+            # Stream the rows in read-only mode and keep only the block each transform needs
+            workbook = openpyxl.load_workbook(source, read_only=True, data_only=True, keep_links=False)
+            try:
+                for sheet_name in missing_sheets:
+                    if sheet_name not in workbook.sheetnames:
+                        logging.error(f"Sheet {sheet_name} not found in {file}")
+                        continue
+                    start_anchor, end_anchor = SHEET_BLOCKS.get(sheet_name, (None, None))
+                    with stage_timer.span('read_sheet', file=file, sheet=sheet_name, source='openpyxl'):
+                        sheets[sheet_name] = read_sheet_block(workbook[sheet_name], start_anchor, end_anchor)
+                    if cache_dir:
+                        write_cached_sheet(cache_dir, file_hash, cache_keys[sheet_name], sheets[sheet_name])
+            finally:
+                workbook.close()
+            logging.info(f"Finished reading {file}")
+        elif missing_sheets:
+            # Unzip the workbook and parse its shared strings only once for all sheets
+            with pd.ExcelFile(source) as workbook:
+                for sheet_name in missing_sheets:
+                    try:
+                        with stage_timer.span('read_sheet', file=file, sheet=sheet_name, source='pandas'):
+                            sheets[sheet_name] = workbook.parse(sheet_name)
+                    except ValueError as e:
+                        logging.error(f"Sheet {sheet_name} not found in {file}: {e}")
+                        continue
+                    if cache_dir:
+                        write_cached_sheet(cache_dir, file_hash, cache_keys[sheet_name], sheets[sheet_name])
+            logging.info(f"Finished reading {file}")
+        else:
+            logging.info(f"Loaded {file} from the parse cache")
+
+    except FileNotFoundError:
+        logging.error(f"File {file} not found.")
     except Exception as e:
-        logging.error(f"An error occurred while processing the pattern: {str(e)}")
-        
+        logging.error(f"An error occurred while reading Excel file {file}: {str(e)}")
+    return [(file, sheet_name, sheets[sheet_name]) for sheet_name in sheet_names if sheet_name in sheets]
 
-def read_countries_sheets(pattern):
+def _read_workbook_in_worker(file, sheet_names, cache_dir=None, streaming=False):
     """
-    Read sheets: 1.4, 2.4 in an Excel file and return them as a list of tuples.
+    Run read_workbook in a worker process of read_workbooks with a timer of its own.
+
+    Returns:
+        tuple: (read_workbook result, spans of the worker timer), the spans are recorded by the main process.
+    """
+    global stage_timer
+    stage_timer = StageTimer('GSTAT', log_spans=False)
+    return read_workbook(file, sheet_names, cache_dir, streaming), stage_timer.spans
+
+def read_workbooks(pattern, sheet_names, max_workers=1, cache_dir=None, streaming=False, skip=None):
+    """
+    Parse the given sheets of every Excel file matching the pattern, optionally in parallel processes.
 
     Parameters:
         pattern (str): Glob pattern to match the Excel files.
+        sheet_names (list): Names of the sheets to parse from each file.
+        max_workers (int): Number of worker processes, 1 parses the files in the current process.
+            Parsing with openpyxl is CPU bound, so processes (not threads) are used to run on several cores.
+            The read_sheet spans timed in the workers are recorded in stage_timer of this process.
+        cache_dir (str, optional): Parse cache directory (see read_workbook), trimmed to PARSE_CACHE_MAX_BYTES afterwards.
+        streaming (bool): Read only the SHEET_BLOCKS rows with read_sheet_block (see read_workbook).
+        skip (set, optional): (file, sheet_name) pairs not to parse, files with no sheet left are not opened.
 
     Returns:
-        list of tuples: sheets_data, A tuple where first elements are sheet names and second values are corresponding DataFrames.
+        list of tuples: (file, sheet_name, DataFrame) sorted by file name then in the order of sheet_names,
+        whatever the number of workers.
     """
-    sheets_data = []
+    skip = skip or set()
+    # Sort so the output order does not depend on the file system or on which worker finishes first
+    files_sheets = [(file, [sheet_name for sheet_name in sheet_names if (file, sheet_name) not in skip])
+                    for file in sorted(glob.glob(pattern))]
+    files_sheets = [(file, file_sheet_names) for file, file_sheet_names in files_sheets if file_sheet_names]
+    if not files_sheets:
+        return []
+    files, files_sheet_names = zip(*files_sheets)
+
+    if max_workers <= 1 or len(files) == 1:
+        results = [read_workbook(file, file_sheet_names, cache_dir, streaming)
+                   for file, file_sheet_names in files_sheets]
+    else:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+            # executor.map returns the results in the order of files
+            results = []
+            for file_sheets, spans in executor.map(_read_workbook_in_worker, files, files_sheet_names,
+                                                   [cache_dir] * len(files), [streaming] * len(files)):
+                stage_timer.record_spans(spans)
+                results.append(file_sheets)
+
+    if cache_dir:
+        evict_parse_cache(cache_dir)
+
+    return [sheet for file_sheets in results for sheet in file_sheets]
+
+def read_workbook_sheets(pattern, sheet_groups=SHEET_GROUPS, max_workers=1, cache_dir=None, streaming=False,
+                         skip=None, read_log=None, with_files=False):
+    """
+    Open each Excel file matching the pattern once and read all the configured sheets from it.
+
+    Parameters:
+        pattern (str): Glob pattern to match the Excel files.
+        sheet_groups (dict): Group name -> list of sheet names, e.g. SHEET_GROUPS.
+        max_workers (int): Number of processes parsing files in parallel (see read_workbooks).
+        cache_dir (str, optional): Parse cache directory (see read_workbook).
+        streaming (bool): Read only the bounded data block of each sheet (see read_sheet_block).
+        skip (set, optional): (file, sheet_name) pairs not to parse, e.g. from plan_incremental_load.
+        read_log (list, optional): If given, the (file, sheet_name) pair of every sheet read is appended to it.
+        with_files (bool): Return (file, sheet_name, DataFrame) tuples, as taken by the batch transforms.
+
+    Returns:
+        dict: Group name -> list of tuples (sheet_name, DataFrame), in file order then sheet order,
+              the same structure returned by read_departments_sheets and read_countries_sheets.
+    """
+    sheets_data = {group: [] for group in sheet_groups}
 
     try:
-        # 1. Find all files matching the pattern
-        files = glob.glob(pattern)
-        if not files:
+        # Sheet name -> group, to dispatch the parsed sheets back to their group
+        sheet_group = {sheet_name: group for group, sheet_names in sheet_groups.items() for sheet_name in sheet_names}
+
+        logging.info(f"Started reading {', '.join(sheet_groups)} data")
+        with stage_timer.span('read', pattern=pattern, workers=max_workers):
+            sheets = read_workbooks(pattern, list(sheet_group), max_workers, cache_dir, streaming, skip)
+        if not sheets:
             print("No files matching the pattern were found.")
             return sheets_data
 
-        logging.info("Started reading Countries data")
-        
-        # 2. Read all sheets into a dictionary of DataFrames
-        for file in files:
-            try:
-                excel_data = pd.read_excel(file, sheet_name=['1.4', '2.4'])
-
-                # 3. Convert dictionary to a list of tuples
-                for sheet_name in excel_data:
-                    sheets_data.append((sheet_name, excel_data[sheet_name]))
-                
-                logging.info(f"Finished reading {file}")
-
-            except FileNotFoundError:
-                logging.error(f"File {file} not found.")
-                continue
-            except Exception as e:
-                logging.error(f"An error occurred while reading Excel file {file}: {str(e)}")
-                continue
+        for file, sheet_name, df in sheets:
+            sheets_data[sheet_group[sheet_name]].append((file, sheet_name, df) if with_files else (sheet_name, df))
+            if read_log is not None:
+                read_log.append((file, sheet_name))
 
         return sheets_data
+
     except Exception as e:
         logging.error(f"An error occurred while processing the pattern: {str(e)}")
+        return sheets_data
+
+def read_departments_sheets(pattern):
+    """
+    Read sheets: 1.1, 2.1 in an Excel file and return them as a list of tuples.
+
+    Parameters:
+        pattern (str): Glob pattern to match the Excel files.
+
+    Returns:
+        list of tuples: sheets_data, a tuple where the first elements are sheet names and the second values are corresponding DataFrames.
+    """
+    return read_workbook_sheets(pattern, {'departments': SHEET_GROUPS['departments']})['departments']
+        
+
+def read_countries_sheets(pattern):
+    """
+    Read sheets: 1.4, 2.4 in an Excel file and return them as a list of tuples.
+
+    Parameters:
+        pattern (str): Glob pattern to match the Excel files.
+
+    Returns:
+        list of tuples: sheets_data, A tuple where first elements are sheet names and second values are corresponding DataFrames.
+    """
+    return read_workbook_sheets(pattern, {'countries': SHEET_GROUPS['countries']})['countries']
 
 
 # Function to remove digits from a string, for ex: 1.الربع الأول -> الربع الأول
@@ -191,18 +530,88 @@ def extract_year(column_name):
     else:
         return column_name
 
+def locate_anchors(df, anchors):
+    """
+    Find the first row of a DataFrame where any cell contains each anchor text.
+
+    The frame is converted to a NumPy string array once ('nan' for empty cells, like astype(str)),
+    then every anchor is searched over the whole array with np.char.find, instead of a row-wise
+    df.apply that converts every row again for each anchor.
+
+    Args:
+        df (pd.DataFrame): Sheet data.
+        anchors (list): Texts to look for, e.g. ['وصف القسم', 'الإجمالي'].
+
+    Returns:
+        dict: anchor -> position (0-based, usable with iloc) of the first row containing it.
+
+    Raises:
+        ValueError: If an anchor is not found in any row.
+    """
+    values = df.to_numpy(dtype=str)
+    anchor_rows = {}
+    for anchor in anchors:
+        rows = np.flatnonzero((np.char.find(values, anchor) >= 0).any(axis=1))
+        if rows.size == 0:
+            raise ValueError(f"Anchor '{anchor}' not found")
+        anchor_rows[anchor] = int(rows[0])
+    return anchor_rows
+
 mapping_quarters = {
     "الربع الأول": "Q1",
     "الربع الثاني": "Q2",
     "الربع الثالث": "Q3",
     "الربع الرابع": "Q4"}
 
-def transform_by_departments_data(sheets_data):
+# Columns holding one value per sheet, repeated on every row, stored as categories by compact_frame
+CATEGORY_COLUMNS = ['Year', 'Quarter', 'Section_description',
+                    'Current_Quarter_Of_Pevious_Year_Quarter', 'Current_Quarter_Of_Pevious_Year_Year',
+                    'Previous_Quarter', 'Previous_Year', 'Current_Quarter', 'Current_Year']
+
+def _downcast_values(series):
+    """
+    Return a value column as the smallest numeric dtype holding exactly the same values:
+    Int64 if all the values are whole numbers, else float32 if the float64 values survive the round trip,
+    else float64. Columns with non numeric values are returned unchanged.
+    """
+    numeric = pd.to_numeric(series, errors='coerce')
+    if numeric.notna().sum() != series.notna().sum():
+        return series
+    numeric = numeric.astype('float64')
+    values = numeric.dropna().to_numpy()
+    if np.all(np.mod(values, 1) == 0) and np.all(np.abs(values) < 2 ** 53):
+        return numeric.astype('Int64')
+    single = numeric.astype('float32')
+    if np.array_equal(single.astype('float64').to_numpy(), numeric.to_numpy(), equal_nan=True):
+        return single
+    return numeric
+
+def compact_frame(df, key_columns=()):
+    """
+    Build the compact copy of a transformed DataFrame, the only copy made of the sheet slice:
+    CATEGORY_COLUMNS become categorical, value columns are downcast with _downcast_values and
+    key_columns are kept as they are, so they still match the keys of the destination rows.
+    """
+    columns = {}
+    for column in df.columns:
+        if column in key_columns:
+            columns[column] = df[column]
+        elif column in CATEGORY_COLUMNS:
+            columns[column] = df[column].astype('category')
+        else:
+            columns[column] = _downcast_values(df[column])
+    return pd.DataFrame(columns, index=df.index)
+
+# Columns of the departments sheets renamed by the transforms
+departments_columns_renamed = {'الفهرس':'Section_number', 'Unnamed: 0': 'Section_number', 'Unnamed: 1':'Section_description'}
+
+def transform_by_departments_data(sheets_data, compact=False):
     """
     Transforms data from multiple sheets by extracting specific columns and values, renaming columns, and organizing the data into a dictionary.
 
     Args:
         sheets_data (dict): A dictionary where keys are sheet names and values are DataFrames containing the sheet data.
+        compact (bool): Return compact DataFrames (see compact_frame) using less memory, with the same values.
 
     Returns:
         dict: A dictionary where keys are sheet names and values are lists of transformed DataFrames.
@@ -230,18 +639,19 @@ def transform_by_departments_data(sheets_data):
     """
     departments_transformed_data = {}
     # Dictionary to rename specific columns
-    rename_dict = {'الفهرس':'Section_number', 'Unnamed: 0': 'Section_number', 'Unnamed: 1':'Section_description'}
+    rename_dict = departments_columns_renamed
 
     try:
         logging.info("Transforming By Departments data...")
         for sheet_name, df in sheets_data:
             try:
-                 # Get the index of the row where any column contains the value 'وصف القسم' & 'الإجمالي
-                start_index = df[df.apply(lambda row: row.astype(str).str.contains('وصف القسم').any(), axis=1)].index[0]
-                end_index = df[df.apply(lambda row: row.astype(str).str.contains('الإجمالي').any(), axis=1)].index[0]-1
+                 # Get the position of the row where any column contains the value 'وصف القسم' & 'الإجمالي
+                anchor_rows = locate_anchors(df, ['وصف القسم', 'الإجمالي'])
+                start_index = anchor_rows['وصف القسم']
+                end_index = anchor_rows['الإجمالي']-1
        
-                # Select rows start and end  from these indexes
-                df = df.loc[start_index:end_index].reset_index(drop=True)
+                # Select rows start and end  from these positions
+                df = df.iloc[start_index:end_index+1].reset_index(drop=True)
                 #drop columns which has all empty values
                 df.dropna(axis=1, how='all', inplace=True)
                 #rename columns
@@ -294,6 +704,8 @@ def transform_by_departments_data(sheets_data):
                 unneeded_columns = [col for col in df.columns if 'Unnamed' in col]
                 df.drop(unneeded_columns, axis=1, inplace=True)
                 df = df.iloc[3:] #filter dataframe to have from the fourth row to the end
+                if compact:
+                    df = compact_frame(df, key_columns=['Section_number'])
 
                 """
                     Add the transformed DataFrame to the dictionary
@@ -376,12 +788,13 @@ def extract_quarter_year(text):
 
     return quarter, year
 
-def transform_by_countries_data(sheets_data2):
+def transform_by_countries_data(sheets_data2, compact=False):
     """
     Transforms data from multiple sheets by extracting specific columns and values, renaming columns, and organizing the data into a dictionary.
 
     Args:
         sheets_data2 (dict): A dictionary where keys are sheet names and values are DataFrames containing the sheet data.
+        compact (bool): Return compact DataFrames (see compact_frame) using less memory, with the same values.
 
     Returns:
         dict: A dictionary where keys are sheet names and values are lists of transformed DataFrames.
@@ -410,20 +823,18 @@ def transform_by_countries_data(sheets_data2):
         logging.info("Transforming By Countries data...")
         for sheet_name, df in sheets_data2:
             try:
+                anchor_rows = locate_anchors(df, ['الربع', 'الدولة'])
                 """Get the row which has 'الربع' in its value and pass row to extract_quarter_year()"""
-                y_Q_row = df[df.apply(lambda row: row.astype(str).str.contains('الربع').any(), axis=1)]
-                y_Q_row = y_Q_row.iloc[0,0]
+                y_Q_row = df.iloc[anchor_rows['الربع'], 0]
                 quarter, year = extract_quarter_year(y_Q_row)
 
-                # Get the index of the row where any column contains the value: 'الدولة'
-                start_index = df[df.apply(lambda row: row.astype(str).str.contains('الدولة').any(), axis=1)].index[0]
+                # Get the position of the row where any column contains the value: 'الدولة'
+                start_index = anchor_rows['الدولة']
                
                 # Set new column names from the specified row
                 df.columns = df.iloc[start_index].tolist()
-                #filter dataframe with needed rows
-                df= df.iloc[start_index+1:]
-                #rename columns
-                df.rename(columns=sections_columns_renamed, inplace=True)
+                #filter dataframe with needed rows and rename columns, rename makes the one copy of the slice
+                df = df.iloc[start_index+1:].rename(columns=sections_columns_renamed)
                 # Drop rows where the specified column 'الإجمالي' has empty values
                 df.dropna(subset=['الإجمالي'], inplace=True)
                 """
@@ -439,6 +850,9 @@ def transform_by_countries_data(sheets_data2):
                 except Exception as i:
                     logging.warning(f"An error occured while insert columns: {i}")  
 
+                if compact:
+                    df = compact_frame(df, key_columns=['الدولة'])
+
                 """
                     Add the transformed DataFrame to the dictionary
                         if sheet name already in dictionary add dataframe to its list value to prevent override the value of the same key
@@ -460,109 +874,467 @@ def transform_by_countries_data(sheets_data2):
     return countries_transformed_data
     
     
-def load_transformed_dataframes(transformed_dataframes, dest_engine, schema_name):
+def extract_years(values):
+    """Vectorized extract_year over a Series: the 4 digits of every text value, other values as they are."""
+    is_text = values.map(type).eq(str)
+    years = values.astype(str).str.extract(r'(\d{4})', expand=False)
+    return years.where(is_text & years.notna(), values)
+
+def _concat_batch(frames, files):
+    """Concatenate the blocks of the files of one sheet, tagged with their file in the 'Source_file' index level."""
+    return pd.concat(frames, keys=files, names=['Source_file', None])
+
+def _broadcast(per_file, batch):
+    """Repeat the one row per file of per_file on every row of that file in batch, with the index of batch."""
+    return per_file.reindex(batch.index.get_level_values('Source_file')).set_axis(batch.index)
+
+def transform_departments_batch(sheets, compact=False):
+    """
+    Transform the departments sheets of a whole batch of workbooks into one DataFrame per sheet.
+
+    Each sheet's block is located and sliced as in transform_by_departments_data, and its last three columns are
+    renamed to Current_Quarter_Of_Pevious_Year_Value, Previous_Value and Current_Value. The blocks of all the
+    files of a sheet are concatenated once, tagged with their file in the 'Source_file' index level, then the
+    Year, Quarter, Previous_* and Current_* columns are derived from the header cells of all the files with
+    vectorized string operations and broadcast to the rows of each file.
+
+    Args:
+        sheets (list): (file, sheet_name, DataFrame) tuples, e.g. read_workbook_sheets(..., with_files=True)['departments'].
+        compact (bool): Return compact DataFrames (see compact_frame), categories are shared by the whole batch.
+
+    Returns:
+        dict: Sheet name -> list holding the one DataFrame of the sheet. It has the columns and values of
+              the DataFrames of transform_by_departments_data, so it is loaded and audited the same way.
+
+    A sheet that cannot be transformed is logged and left out of the batch.
+    """
+    blocks, headers = {}, {}
+    value_columns = ['Current_Quarter_Of_Pevious_Year_Value', 'Previous_Value', 'Current_Value']
+
+    logging.info("Transforming By Departments data in batch...")
+    for file, sheet_name, df in sheets:
+        try:
+            # Rows from 'وصف القسم' down to the row before 'الإجمالي', without the empty columns
+            anchor_rows = locate_anchors(df, ['وصف القسم', 'الإجمالي'])
+            block = df.iloc[anchor_rows['وصف القسم']:anchor_rows['الإجمالي']].dropna(axis=1, how='all')
+            block = block.rename(columns=departments_columns_renamed)
+            if not isinstance(block.iloc[0, -1], str):
+                raise ValueError(f"Quarter header {block.iloc[0, -1]!r} is not text")
+
+            # Quarter (first row) and year (second row) headers of the last three columns
+            headers.setdefault(sheet_name, []).append({
+                'Source_file': file,
+                'Current_Quarter_Of_Pevious_Year_Quarter': block.iloc[0, -3], 'Current_Quarter_Of_Pevious_Year_Year': block.iloc[1, -3],
+                'Previous_Quarter': block.iloc[0, -2], 'Previous_Year': block.iloc[1, -2],
+                'Current_Quarter': block.iloc[0, -1], 'Current_Year': block.iloc[1, -1]})
+
+            # Data rows start at the fourth row of the block
+            rows = block.iloc[3:]
+            named_columns = [column for column in rows.columns if 'Unnamed' not in column]
+            values = rows.iloc[:, -3:].set_axis(value_columns, axis=1)
+            blocks.setdefault(sheet_name, []).append((file, pd.concat([rows[named_columns], values], axis=1)))
+        except Exception as e:
+            logging.error(f"An Error occurred while transforming by Departments data in {sheet_name} of {file}: {e}")
+
+    departments_transformed_data = {}
+    for sheet_name, file_blocks in blocks.items():
+        try:
+            files, frames = zip(*file_blocks)
+            batch = _concat_batch(frames, files)
+
+            # One row per file, derived column by column for the whole batch
+            header = pd.DataFrame(headers[sheet_name]).set_index('Source_file')
+            current_quarter = header['Current_Quarter'].str.replace(r'.\d', '', regex=True)
+            current_year = extract_years(header['Current_Year'])
+            derived = _broadcast(pd.DataFrame({
+                'Year': current_year,
+                'Quarter': current_quarter.map(mapping_quarters),
+                'Current_Quarter_Of_Pevious_Year_Quarter': header['Current_Quarter_Of_Pevious_Year_Quarter'],
+                'Current_Quarter_Of_Pevious_Year_Year': extract_years(header['Current_Quarter_Of_Pevious_Year_Year']),
+                'Previous_Quarter': header['Previous_Quarter'],
+                'Previous_Year': extract_years(header['Previous_Year']),
+                'Current_Quarter': current_quarter,
+                'Current_Year': current_year}), batch)
+
+            # Same column order as transform_by_departments_data
+            named_columns = [column for column in batch.columns if column not in value_columns]
+            df = pd.concat([batch[named_columns], derived[['Year', 'Quarter']],
+                            batch[['Current_Quarter_Of_Pevious_Year_Value']],
+                            derived[['Current_Quarter_Of_Pevious_Year_Quarter', 'Current_Quarter_Of_Pevious_Year_Year']],
+                            batch[['Previous_Value']], derived[['Previous_Quarter', 'Previous_Year']],
+                            batch[['Current_Value']], derived[['Current_Quarter', 'Current_Year']]], axis=1)
+            if compact:
+                df = compact_frame(df, key_columns=['Section_number'])
+            departments_transformed_data[sheet_name] = [df]
+        except Exception as e:
+            logging.error(f"An Error occurred while transforming by Departments data in {sheet_name}: {e}")
+
+    logging.info("Finished Transforming By Departments data in batch")
+    return departments_transformed_data
+
+def transform_countries_batch(sheets, compact=False):
+    """
+    Transform the countries sheets of a whole batch of workbooks into one DataFrame per sheet.
+
+    Each sheet's block is located as in transform_by_countries_data: the 'الدولة' row gives the column names
+    and the rows below it with a 'الإجمالي' value are kept. The blocks of all the files of a sheet are
+    concatenated once, tagged with their file in the 'Source_file' index level, then the Year and Quarter
+    of every file are extracted from its 'الربع' title with vectorized string operations and broadcast to its rows.
+
+    Args:
+        sheets (list): (file, sheet_name, DataFrame) tuples, e.g. read_workbook_sheets(..., with_files=True)['countries'].
+        compact (bool): Return compact DataFrames (see compact_frame), categories are shared by the whole batch.
+
+    Returns:
+        dict: Sheet name -> list holding the one DataFrame of the sheet, with the columns and values of
+              the DataFrames of transform_by_countries_data.
+
+    A sheet that cannot be transformed, or whose title has no quarter, is logged and left out of the batch.
+    """
+    blocks, titles = {}, {}
+
+    logging.info("Transforming By Countries data in batch...")
+    for file, sheet_name, df in sheets:
+        try:
+            anchor_rows = locate_anchors(df, ['الربع', 'الدولة'])
+            start_index = anchor_rows['الدولة']
+            # The 'الدولة' row names the columns, dropna makes the one copy of the rows below it
+            block = df.iloc[start_index+1:]
+            block.columns = [sections_columns_renamed.get(column, column) for column in df.iloc[start_index]]
+            block = block.dropna(subset=['الإجمالي'])
+            titles.setdefault(sheet_name, []).append((file, str(df.iloc[anchor_rows['الربع'], 0])))
+            blocks.setdefault(sheet_name, []).append((file, block))
+        except Exception as e:
+            logging.error(f"An error occured while transforming by Countries data in {sheet_name} of {file}: {e}")
+
+    countries_transformed_data = {}
+    for sheet_name, file_blocks in blocks.items():
+        try:
+            # One row per file: quarter and year of its title, e.g. 'الربع الأول 2024' -> Q1, 2024
+            files, sheet_titles = zip(*titles[sheet_name])
+            sheet_titles = pd.Series(sheet_titles, index=pd.Index(files, name='Source_file'))
+            header = pd.DataFrame({'Year': sheet_titles.str.extract(r'(\d{4})', expand=False),
+                                   'Quarter': sheet_titles.str.extract(r'(الربع\s\w+)', expand=False).map(mapping_quarters)})
+            for file in header.index[header['Quarter'].isna()]:
+                logging.error(f"An error occured while transforming by Countries data in {sheet_name} of {file}: "
+                              f"no quarter in '{sheet_titles[file]}'")
+            file_blocks = [(file, block) for file, block in file_blocks if pd.notna(header.at[file, 'Quarter'])]
+            if not file_blocks:
+                continue
+
+            files, frames = zip(*file_blocks)
+            df = _concat_batch(frames, files)
+            derived = _broadcast(header, df)
+            try:
+                # allow_duplicates=False parameter prevents inserting a column with the same name as an existing column.
+                df.insert(2, 'Year', derived['Year'], allow_duplicates=False)
+                df.insert(3, 'Quarter', derived['Quarter'], allow_duplicates=False)
+            except Exception as i:
+                logging.warning(f"An error occured while insert columns: {i}")
+
+            if compact:
+                df = compact_frame(df, key_columns=['الدولة'])
+            countries_transformed_data[sheet_name] = [df]
+        except Exception as e:
+            logging.error(f"An error occured while transforming by Countries data in {sheet_name}: {e}")
+
+    logging.info("Finished transformations By countries data in batch")
+    return countries_transformed_data
+    
+    
+# Destination table of each sheet
+table_mappings = {
+    '1.1': 'Exports_by_departments',
+    '2.1': 'Imports_by_departments',
+    '1.4': 'Non_oil_exports_by_country_and_major_divisions',
+    '2.4': 'Imports_by_major_countries_and_divisions'
+}
+
+# Columns identifying a row in each destination table
+table_keys = {
+    '1.1': ['Section_number', 'Year', 'Quarter'],
+    '2.1': ['Section_number', 'Year', 'Quarter'],
+    '1.4': ['الدولة', 'Year', 'Quarter'],
+    '2.4': ['الدولة', 'Year', 'Quarter']
+}
+
+# Local state store of the incremental mode, next to the workbooks
+LOAD_STATE_FILE = 'load_state.db'
+LOAD_STATUS_LOADED = 'loaded'
+
+def open_load_state(state_path=LOAD_STATE_FILE):
+    """
+    Open the SQLite state store of the incremental mode, creating its table if needed.
+
+    The load_state table has one row per (file_hash, sheet) with the year and quarter of the workbook,
+    its load status, the file name it was seen under and the time of the last update.
+
+    Returns:
+        sqlite3.Connection: Connection to the state store.
+    """
+    state = sqlite3.connect(state_path)
+    state.execute("""
+        CREATE TABLE IF NOT EXISTS load_state (
+            file_hash TEXT NOT NULL,
+            sheet TEXT NOT NULL,
+            year TEXT,
+            quarter TEXT,
+            status TEXT NOT NULL,
+            file_name TEXT,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (file_hash, sheet)
+        )""")
+    state.commit()
+    return state
+
+def file_year_quarter(file):
+    """
+    Year and quarter of a workbook from its name, e.g. 'ITR Q22024A.xlsx' -> ('2024', 'Q2').
+
+    Returns:
+        tuple: (year, quarter) as stored in the destination tables, or (None, None) for other names.
+    """
+    match = re.search(r'Q([1-4])(\d{4})', os.path.basename(file))
+    return (match.group(2), f"Q{match.group(1)}") if match else (None, None)
+
+def loaded_year_quarters(dest_engine, schema_name, table_name):
+    """Set of the (Year, Quarter) keys already present in a destination table, empty if it cannot be read."""
+    try:
+        table = e.qualified_name(dest_engine, schema_name, table_name)
+        with dest_engine.connect() as connection:
+            year_quarter = f"{e.quote_identifier(dest_engine, 'Year')}, {e.quote_identifier(dest_engine, 'Quarter')}"
+            rows = connection.execute(text(f"SELECT DISTINCT {year_quarter} FROM {table}")).fetchall()
+        return {(str(year), str(quarter)) for year, quarter in rows}
+    except SQLAlchemyError as error:
+        logging.error(f"Could not read the loaded quarters of {table_name}: {error}")
+        return set()
+
+def plan_incremental_load(pattern, state, dest_engine, schema_name, sheet_groups=SHEET_GROUPS):
+    """
+    Decide which sheets of the matching workbooks have to be read, before parsing any of them.
+
+    A sheet is skipped when the state store has it as loaded for the same file content (SHA-256)
+    and the destination table still has the (Year, Quarter) of the workbook. A republished workbook
+    has a new hash, so its sheets are read and merged again.
+
+    Parameters:
+        pattern (str): Glob pattern of the Excel files.
+        state (sqlite3.Connection): State store from open_load_state.
+        dest_engine (sqlalchemy.engine.base.Engine): Destination database engine.
+        schema_name (str): Schema of the destination tables.
+        sheet_groups (dict): Group name -> list of sheet names, e.g. SHEET_GROUPS.
+
+    Returns:
+        tuple: (skip, pending) where skip is the set of (file, sheet) pairs not to read and pending maps
+               every (file, sheet) pair to read to its (file_hash, year, quarter).
+    """
+    sheet_names = [sheet_name for sheet_names in sheet_groups.values() for sheet_name in sheet_names]
+    loaded = {}
+    skip, pending = set(), {}
+    for file in sorted(glob.glob(pattern)):
+        file_hash = file_sha256(file)
+        year, quarter = file_year_quarter(file)
+        rows = state.execute("SELECT sheet FROM load_state WHERE file_hash = ? AND status = ?",
+                             (file_hash, LOAD_STATUS_LOADED)).fetchall()
+        loaded_sheets = {row[0] for row in rows}
+        for sheet_name in sheet_names:
+            table_name = table_mappings[sheet_name]
+            if sheet_name in loaded_sheets and year:
+                # Only query each destination table once per run
+                if table_name not in loaded:
+                    loaded[table_name] = loaded_year_quarters(dest_engine, schema_name, table_name)
+                if (year, quarter) in loaded[table_name]:
+                    skip.add((file, sheet_name))
+                    continue
+            pending[(file, sheet_name)] = (file_hash, year, quarter)
+
+    logging.info(f"Incremental load: {len(skip)} sheets already loaded, {len(pending)} sheets to read")
+    return skip, pending
+
+def mark_sheets_loaded(state, pending, read_log, transformed_dataframes, table_stats):
+    """
+    Record the sheets of this run that reached their destination table as loaded in the state store.
+
+    A sheet is recorded if it was read, its table was loaded without error and, when the workbook name
+    gives its year and quarter, the loaded DataFrames contain that (Year, Quarter).
+
+    Parameters:
+        state (sqlite3.Connection): State store from open_load_state.
+        pending (dict): (file, sheet) -> (file_hash, year, quarter), from plan_incremental_load.
+        read_log (list): (file, sheet) pairs read by read_workbook_sheets.
+        transformed_dataframes (dict): Sheet name -> list of loaded DataFrames.
+        table_stats (dict): Sheet name -> load statistics of the tables loaded successfully.
+
+    Returns:
+        int: Number of sheets recorded.
+    """
+    loaded_keys = {sheet_name: {(str(year), str(quarter))
+                                for df in transformed_dataframes.get(sheet_name, [])
+                                for year, quarter in zip(df['Year'], df['Quarter'])}
+                   for sheet_name in table_stats}
+    now = datetime.now().isoformat(timespec='seconds')
+    rows = []
+    for file, sheet_name in read_log:
+        if sheet_name not in table_stats or (file, sheet_name) not in pending:
+            continue
+        file_hash, year, quarter = pending[(file, sheet_name)]
+        if year and (year, quarter) not in loaded_keys[sheet_name]:
+            continue
+        rows.append((file_hash, sheet_name, year, quarter, LOAD_STATUS_LOADED, os.path.basename(file), now))
+
+    with state:
+        state.executemany("INSERT OR REPLACE INTO load_state VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    logging.info(f"Incremental load: {len(rows)} sheets recorded as loaded")
+    return len(rows)
+
+# pandas inferred types of the value columns staged as FLOAT by prepare_load_frame
+NUMERIC_INFERRED_TYPES = ('integer', 'floating', 'mixed-integer-float', 'decimal')
+
+def prepare_load_frame(sheet_name, dfs):
+    """
+    Concatenate the transformed DataFrames of one sheet into the frame staged by load_table.
+
+    Parameters:
+        sheet_name (str): Sheet name, mapped to the destination table with table_mappings.
+        dfs (list): Transformed DataFrames of the sheet.
+
+    Returns:
+        tuple: (DataFrame, dict) the rows to load with their 'STG_CreatedDate', and the SQLAlchemy types
+               of the text and value columns, the other column types are inferred by pandas.
+    """
+    # One staging load and one merge per table instead of one per file
+    df = pd.concat(dfs, ignore_index=True)
+    # Categorical columns (compact transforms) only accept 0.0 once it is one of their categories
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype) and 0.0 not in df[column].cat.categories:
+            df[column] = df[column].cat.add_categories([0.0])
+    df.fillna(0.0, inplace=True)
+    # Add 'STG_CreatedDate' column with the current datetime
+    df['STG_CreatedDate'] = datetime.now()
+
+    # Use NVARCHAR(None) for NVARCHAR(MAX)
+    if 'departments' in table_mappings[sheet_name]:
+        datatypes={'Section_number':NVARCHAR(None), 'Section_description':NVARCHAR(None),
+                   'Current_Quarter_Of_Pevious_Year_Quarter':NVARCHAR(None), 
+                   'Previous_Quarter':NVARCHAR(None), 'Current_Quarter':NVARCHAR(None)}
+    else:
+        datatypes={'الدولة':NVARCHAR(None)}
+    # to_sql stages a column mixing whole and decimal numbers as text, so the value columns are given as FLOAT
+    for column in df.columns:
+        if column not in datatypes and pd.api.types.infer_dtype(df[column]) in NUMERIC_INFERRED_TYPES:
+            datatypes[column] = sqlalchemy.Float()
+    return df, datatypes
+
+def load_table(sheet_name, dfs, dest_engine, schema_name, bulk_method='default', chunksize=None, staging_suffix=None):
+    """
+    Stage and merge all the DataFrames of one sheet into its destination table in a single transaction.
+
+    Parameters:
+        sheet_name (str): Sheet name, mapped to the destination table with table_mappings.
+        dfs (list): Transformed DataFrames of the sheet.
+        dest_engine (sqlalchemy.engine.base.Engine): SQLAlchemy engine object for the destination database.
+        schema_name (str): Name of the schema where the destination tables are located.
+        bulk_method (str): How the temporary table is filled, one of e.BULK_LOAD_METHODS.
+        chunksize (int, optional): Number of rows sent per batch by the bulk load.
+        staging_suffix (str, optional): Suffix of the staging table name, so workers loading the same table
+            at the same time do not share temp_<table>.
+
+    Returns:
+        dict: {'table', 'rows', 'inserted', 'updated', 'skipped', 'seconds', 'finished_at'} for the table,
+              seconds is the load time of the table and finished_at the run time (stage_timer) when it was loaded.
+    """
+    table_name = table_mappings[sheet_name]
+    started = time.perf_counter()
+    df, datatypes = prepare_load_frame(sheet_name, dfs)
+
+    # begin() commits staging, merge and drop together, or rolls all of them back if one fails
+    with stage_timer.span('load', table=table_name), dest_engine.begin() as connection:
+        counts = e.upsert_dataframe(df, table_name, table_keys[sheet_name], connection, schema_name,
+                                    dtype=datatypes, bulk_method=bulk_method, chunksize=chunksize,
+                                    timer=stage_timer,
+                                    staging_name=f"temp_{table_name}_{staging_suffix}" if staging_suffix else None)
+
+    stats = {'table': table_name, 'rows': len(df), **counts, 'seconds': time.perf_counter() - started,
+             'finished_at': stage_timer.elapsed()}
+    logging.info(f"Successfully loaded into {table_name}: {counts['inserted']} inserted, "
+                 f"{counts['updated']} updated, {counts['skipped']} unchanged in {stats['seconds']:.2f} seconds")
+    return stats
+
+def load_transformed_dataframes(transformed_dataframes, dest_engine, schema_name, bulk_method='default', chunksize=None,
+                                max_workers=1, staging_suffix=None):
     """
         Load the transformed DataFrames into database tables.
 
         This function takes a dictionary of transformed DataFrames, a SQLAlchemy engine object for the destination database, 
-        and the schema name of the destination tables. It loads each DataFrame into a corresponding table in the database. 
-        If a table already contains a record with the same unique key combination, the record is not inserted.
+        and the schema name of the destination tables. All the DataFrames of a table are staged once and merged into it
+        in one transaction (see load_table): new unique key combinations are inserted, and existing ones are updated
+        when a republished quarter changed them. The tables are independent, so they can be loaded concurrently.
 
         Parameters:
-            transformed_dataframes (dict): A dictionary where keys are sheet names and values are corresponding transformed DataFrames.
-            dest_engine (sqlalchemy.engine.base.Engine): SQLAlchemy engine object for the destination database.
+            transformed_dataframes (dict): A dictionary where keys are sheet names and values are lists of transformed DataFrames.
+            dest_engine (sqlalchemy.engine.base.Engine): SQLAlchemy engine object for the destination database,
+                its pool should hold at least max_workers connections.
             schema_name (str): Name of the schema where the destination tables are located.
+            bulk_method (str): How the temporary tables are filled, one of e.BULK_LOAD_METHODS
+                ('default', 'multirow', 'fast_executemany' for SQL Server, 'copy' for PostgreSQL).
+            chunksize (int, optional): Number of rows sent per batch by the bulk load.
+            max_workers (int): Number of tables loaded at the same time, 1 loads them one after another.
+            staging_suffix (str, optional): Suffix of the staging table names (see load_table).
 
         Returns:
-            float: Total execution time in seconds from the start of reading data until loading to the database tables.
+            tuple: (run time in seconds from the start of stage_timer until all the tables are loaded,
+                    dict sheet name -> load_table statistics of every table loaded successfully).
 
         The function performs the following steps:
-        1. Maps sheet names to their corresponding destination table names.
-        2. For each DataFrame in the transformed_dataframes dictionary:
-            a. Creates a temporary table to hold the new data.
+        1. Maps sheet names to their corresponding destination table names and key columns.
+        2. For each table in the transformed_dataframes dictionary, on its own pooled connection and transaction:
+            a. Concatenates all its DataFrames into one.
             b. Adds a 'STG_CreatedDate' column with the current datetime.
-            c. Loads the DataFrame into the temporary table.
-            d. Inserts new records into the destination table where the unique key combination does not exist.
-            e. Drops the temporary table after the insertion.
-    """
-    global table_mappings #to used in log()
-    execution_times = []
-    # Specify the list of table names for each DataFrame
-    table_mappings = {
-        '1.1': 'Exports_by_departments',
-        '2.1': 'Imports_by_departments',
-        '1.4': 'Non_oil_exports_by_country_and_major_divisions',
-        '2.4': 'Imports_by_major_countries_and_divisions'
-    }
+            c. Stages the rows once in a temporary table.
+            d. Merges the temporary table into the destination table on (Section_number | الدولة, Year, Quarter)
+               and logs the inserted, updated and skipped counts.
+            e. Drops the temporary table after the merge.
+    """
+    total_execution_time = 0
+    table_stats = {}
     try:
         logging.info("loading Transformed dataframes to database...")
-        for sheet_name, dfs in transformed_dataframes.items():
-            table_name = table_mappings[sheet_name]
-            # Create a temporary table to hold the new data
-            temp_table_name = f"temp_{table_name}"
+        sheets = {sheet_name: dfs for sheet_name, dfs in transformed_dataframes.items() if dfs}
 
-            try:
-                for df in dfs:
-                    df.fillna(0.0, inplace=True)
-                    #df =df.convert_dtypes() #to load data correctly in temp table
-                    # Add 'STG_CreatedDate' column with the current datetime
-                    df['STG_CreatedDate'] = datetime.now()
-     
-                     # Use NVARCHAR(None) for NVARCHAR(MAX)
-                    if 'departments' in table_name:   
-                        datatypes={'Section_number':NVARCHAR(None), 'Section_description':NVARCHAR(None),
-                                   'Current_Quarter_Of_Pevious_Year_Quarter':NVARCHAR(None), 
-                                   'Previous_Quarter':NVARCHAR(None), 'Current_Quarter':NVARCHAR(None)}
-                        df.to_sql(temp_table_name, con=dest_engine, schema=schema_name, if_exists='replace', index=False, dtype=datatypes)
-                        # Insert new records where the combination of 'Section_number', 'Year' and 'Quarter' does not exist
-                        insert_query = f"""
-                            INSERT INTO {schema_name}.{table_name} ({', '.join(df.columns)})
-                            SELECT {', '.join(df.columns)}
-                            FROM {schema_name}.{temp_table_name} AS temp
-                            WHERE NOT EXISTS (
-                                SELECT 1
-                                FROM {schema_name}.{table_name} AS main
-                                WHERE main.Section_number = temp.Section_number
-                                AND main.Year = temp.Year
-                                AND main.Quarter = temp.Quarter
-                            )
-                            """
-                    else:
-                        df.to_sql(temp_table_name, con=dest_engine, schema=schema_name, if_exists='replace', index=False, dtype={'الدولة':NVARCHAR(None)})
-                        # Insert new records where 
-                        insert_query = f"""
-                        INSERT INTO {schema_name}.{table_name} ({', '.join([f'[{col}]' if ' ' in col or not col.isalnum() else col for col in df.columns])})
-                        SELECT {', '.join([f'[{col}]' if ' ' in col or not col.isalnum() else col for col in df.columns])}
-                        FROM {schema_name}.{temp_table_name} AS temp
-                        WHERE NOT EXISTS (
-                            SELECT 1
-                            FROM {schema_name}.{table_name} AS main
-                            WHERE main.الدولة = temp.الدولة
-                            AND main.Year = temp.Year
-                            AND main.Quarter = temp.Quarter
-                        )
-                    """
-
-                    with dest_engine.connect() as connection:
-                        connection.execute(insert_query)
-            
-                    # Drop the temporary table
-                    with dest_engine.connect() as conn:
-                        conn.execute(f"DROP TABLE IF EXISTS {schema_name}.{temp_table_name}")
-                     # Calculate load time
-                    load_time = time.time() - start_time
-                    execution_times.append(load_time)
-                    logging.info(f"Successfully loaded into {table_name}")
-
-            except Exception as ei:
-                logging.error(f"Error while loading to {table_name}: {ei}")
-        total_execution_time = sum(execution_times)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {sheet_name: executor.submit(load_table, sheet_name, dfs, dest_engine, schema_name,
+                                                   bulk_method, chunksize, staging_suffix)
+                       for sheet_name, dfs in sheets.items()}
+
+            for sheet_name, future in futures.items():
+                try:
+                    table_stats[sheet_name] = future.result()
+                except Exception as ei:
+                    logging.error(f"Error while loading to {table_mappings[sheet_name]}: {ei}")
+
+        # Wall-clock time of the run so far, on the monotonic clock of stage_timer
+        total_execution_time = stage_timer.elapsed()
         logging.info(f"Successfully loaded Transformed data into {schema_name} database in {total_execution_time:.2f} seconds.")
 
     except Exception as error:
         logging.error(f"Error while loading dataframes to database destination: {error}")
 
-    return format(total_execution_time, ".2f")
+    return format(total_execution_time, ".2f"), table_stats
+
+def loaded_tables(transformed_dataframes, table_stats):
+    """
+    Tables to audit with log_data_load: the ones loaded successfully, in the order of transformed_dataframes.
+
+    Parameters:
+        transformed_dataframes (dict): Sheet name -> list of transformed DataFrames.
+        table_stats (dict): Sheet name -> load_table statistics, from load_transformed_dataframes.
+
+    Returns:
+        tuple: (list of table names, list of the DataFrame lists of these tables).
+    """
+    sheets = [sheet_name for sheet_name in transformed_dataframes if sheet_name in table_stats]
+    return ([table_stats[sheet_name]['table'] for sheet_name in sheets],
+            [transformed_dataframes[sheet_name] for sheet_name in sheets])
 
 def log_data_load(engine_dmdq, db_name, schema_name, table_names, src_table, execution_time, data_frames):
     """
@@ -574,13 +1346,16 @@ def log_data_load(engine_dmdq, db_name, schema_name, table_names, src_table, exe
     - schema_name: The name of the schema where the logging table resides.
     - table_names: A list of table names for which data loading is being logged.
     - src_table: The name of the source table (or file) for logging purposes.
-    - execution_time: The total execution time for the data load process.
-    - data_frames: The list of DataFrames that were loaded into the database.
+    - execution_time: The total execution time for the data load process, or a dictionary
+                      table name -> execution time of that table written to Time_of_execution.
+    - data_frames: The list of DataFrames that were loaded into the database, per table. (rows, cols) shape
+                   tuples can be given instead of DataFrames that are no longer in memory.
     
     Raises:
     - Exception: If there is an error during the logging of data load details.
     """
     try:
+        records = []
         for table_name, dataframes in zip(table_names, data_frames):
             """
             Because we have list of dataframes for each table ('table1',[df1, df2,..]):
@@ -589,17 +1364,151 @@ def log_data_load(engine_dmdq, db_name, schema_name, table_names, src_table, exe
             2. Sum rows to get total rows inserted in each table
             3. Get the first elemnt in cols tuple, as number of cols the same for all dataframes of the same table
             """
-            rows, cols = zip(*(df.shape for df in dataframes))
+            rows, cols = zip(*(df.shape if hasattr(df, 'shape') else df for df in dataframes))
             rows = sum(rows)
             cols = cols[0]
-            count = e.Generate_Frequency_of_load(engine_dmdq, table_name)
             src_type = "EXCEL"
             rejected_rows = 0       # num_src - count_of_dest
-            e.Insert_TO_DMDQ(engine_dmdq, db_name, schema_name, table_name, execution_time, cols, rows, count, datetime.now(), src_table, src_type, rejected_rows)
-            logging.info(f"Data load logged successfully for {table_name}.")
+            time_of_execution = execution_time.get(table_name) if isinstance(execution_time, dict) else execution_time
+            records.append({'DB_Name': db_name, 'DB_Schema': schema_name, 'DB_Table': table_name,
+                            'Time_of_execution': time_of_execution, 'Number_of_Columns': cols, 'Number_of_Rows': rows,
+                            'STG_CreatedDate': datetime.now(), 'SRC_Table': src_table, 'SRC_Type': src_type,
+                            'Number_of_Rejected_Rows': rejected_rows})
+
+        # One MERGE bumps all the load counters and one executemany inserts all the rows, in one transaction
+        counts = e.Insert_TO_DMDQ_batch(engine_dmdq, records)
+        for table_name, count in counts.items():
+            logging.info(f"Data load logged successfully for {table_name} (load {count}).")
     except Exception as error:
         logging.error(f"Error logging data load: {error}")
         raise
+# Workbooks waiting between two stages of the streaming pipeline, it bounds the memory to a few workbooks
+PIPELINE_QUEUE_SIZE = 2
+# End of stream marker passed from stage to stage
+_PIPELINE_DONE = object()
+
+def _pipeline_stage(name, function, input_queue, output_queue=None):
+    """
+    Run one stage of the streaming pipeline: apply function to every (file, data) item of input_queue
+    and put its result in output_queue, until the end marker, which is passed on to the next stage.
+    A failing file is logged and dropped, the stage continues with the next one.
+    """
+    while True:
+        item = input_queue.get()
+        if item is _PIPELINE_DONE:
+            break
+        try:
+            result = function(item)
+        except Exception as error:
+            logging.error(f"Pipeline {name} failed for {item[0]}: {error}")
+            continue
+        if result is not None and output_queue is not None:
+            # Blocks while the next stage is busy and its queue is full
+            output_queue.put(result)
+    if output_queue is not None:
+        output_queue.put(_PIPELINE_DONE)
+
+def run_pipeline(source, dest_engine, schema_name, sheet_groups=SHEET_GROUPS, bulk_method='default', chunksize=None,
+                 cache_dir=None, queue_size=PIPELINE_QUEUE_SIZE, archive=True, compact=False):
+    """
+    Stream each workbook through parse, transform and load as soon as it is available.
+
+    The parse, transform and load stages run in their own threads, connected by bounded queues of queue_size
+    workbooks, so downloading, parsing and loading overlap and only a few workbooks are in memory at a time.
+    Each workbook is merged into the destination tables on its own (see load_transformed_dataframes).
+
+    Parameters:
+        source: Iterable of workbook paths, or a callable receiving an on_file(path) callback, e.g.
+            lambda on_file: s.download_gstat_xlsx_file(..., on_downloaded=on_file).
+            on_file blocks while the parse queue is full, which slows the source down to the pipeline speed.
+            on_file(file_name, content) passes the bytes of a workbook instead, e.g. from
+            download_gstat_xlsx_file(..., in_memory=True): it is parsed from memory and never read from disk.
+        dest_engine (sqlalchemy.engine.base.Engine): Destination database engine.
+        schema_name (str): Schema of the destination tables.
+        sheet_groups (dict): Group name -> list of sheet names, e.g. SHEET_GROUPS.
+        bulk_method (str): How the temporary tables are filled, one of e.BULK_LOAD_METHODS.
+        chunksize (int, optional): Number of rows sent per batch by the bulk load.
+        cache_dir (str, optional): Parse cache directory (see read_workbook).
+        queue_size (int): Maximum number of workbooks waiting before each stage.
+        archive (bool): Move each workbook to the 'Archive' directory once all its tables are loaded.
+            Workbooks passed as bytes are written there by a background thread (see write_to_archive).
+        compact (bool): Transform into compact DataFrames (see compact_frame), using less memory but more CPU.
+
+    Returns:
+        dict: Sheet name -> {'table', 'files', 'rows', 'inserted', 'updated', 'skipped', 'shapes'}
+              summed over the loaded workbooks, shapes being the (rows, cols) of every loaded DataFrame.
+    """
+    sheet_group = {sheet_name: group for group, sheet_names in sheet_groups.items() for sheet_name in sheet_names}
+    totals = {}
+    first_load = []
+
+    # Workbooks given as bytes are archived off the critical path, one at a time
+    archiver = ThreadPoolExecutor(max_workers=1)
+
+    # Items are (file, data, content) tuples, content being the bytes of the workbook or None
+    def parse(item):
+        file, _, content = item
+        with stage_timer.span('read', file=file):
+            sheets = read_workbook(file, list(sheet_group), cache_dir, streaming=True, content=content)
+        sheets_data = {group: [] for group in sheet_groups}
+        for _, sheet_name, df in sheets:
+            sheets_data[sheet_group[sheet_name]].append((sheet_name, df))
+        return (file, sheets_data, content) if sheets else None
+
+    def transform(item):
+        file, sheets_data, content = item
+        with stage_timer.span('transform', file=file):
+            transform_dfs = {**transform_by_departments_data(sheets_data.get('departments', []), compact),
+                             **transform_by_countries_data(sheets_data.get('countries', []), compact)}
+        return (file, transform_dfs, content) if transform_dfs else None
+
+    def load(item):
+        file, transform_dfs, content = item
+        _, table_stats = load_transformed_dataframes(transform_dfs, dest_engine, schema_name, bulk_method, chunksize,
+                                                     max_workers=len(transform_dfs))
+        if table_stats and not first_load:
+            first_load.append(stage_timer.elapsed())
+            logging.info(f"Pipeline loaded its first rows after {first_load[0]:.2f} seconds")
+        for sheet_name, stats in table_stats.items():
+            total = totals.setdefault(sheet_name, {'table': stats['table'], 'files': 0, 'rows': 0, 'inserted': 0,
+                                                   'updated': 0, 'skipped': 0, 'shapes': []})
+            total['files'] += 1
+            for key in ('rows', 'inserted', 'updated', 'skipped'):
+                total[key] += stats[key]
+            total['shapes'].extend(df.shape for df in transform_dfs[sheet_name])
+        if archive and len(table_stats) == len(transform_dfs):
+            if content is not None:
+                archiver.submit(write_to_archive, file, content)
+            else:
+                move_file_to_archive(file)
+
+    parse_queue = queue.Queue(maxsize=queue_size)
+    transform_queue = queue.Queue(maxsize=queue_size)
+    load_queue = queue.Queue(maxsize=queue_size)
+    stages = [threading.Thread(target=_pipeline_stage, args=('parse', parse, parse_queue, transform_queue)),
+              threading.Thread(target=_pipeline_stage, args=('transform', transform, transform_queue, load_queue)),
+              threading.Thread(target=_pipeline_stage, args=('load', load, load_queue))]
+    for stage in stages:
+        stage.start()
+
+    try:
+        # The parse stage only uses the file and its content
+        on_file = lambda file, content=None: parse_queue.put((file, None, content))
+        if callable(source):
+            source(on_file)
+        else:
+            for file in source:
+                on_file(file)
+    finally:
+        parse_queue.put(_PIPELINE_DONE)
+        for stage in stages:
+            stage.join()
+        archiver.shutdown(wait=True)
+
+    loaded_rows = {stats['table']: stats['rows'] for stats in totals.values()}
+    logging.info(f"Pipeline finished in {stage_timer.elapsed():.2f} seconds, rows loaded: {loaded_rows}")
+    return totals
+
 def check_for_xlsx_files():
     """
     Check if there are any files ending with .xlsx in the current working directory.
@@ -615,34 +1524,78 @@ def check_for_xlsx_files():
             return True
     return False
 
-def main():
+def main(incremental=False, compact=False):
+    """
+    Run the ETL on the .xlsx files of the current working directory.
+
+    With incremental, sheets already loaded from the same file content are not read again (see plan_incremental_load).
+    With compact, the transforms return compact DataFrames (see compact_frame): less memory for many quarters,
+    but slower transforms.
+    """
+    global stage_timer
 
     logging.info("Starting ETL process...")
+    # Every span of this run is measured from here on the monotonic clock
+    stage_timer = StageTimer('GSTAT')
     dest_config_key = 'STG_DEV'  
     dmdq_config_key = 'ByDB_General' 
     file_path = "*.xlsx"
+    read_workers = min(4, os.cpu_count() or 1) #processes used to parse the Excel files
+    load_workers = len(table_mappings) #tables loaded concurrently, one pooled connection each
 
     #if there is xlsx file in current working dir, start ETL process
     if check_for_xlsx_files(): 
         try:
             # Assuming establish_connections is correctly defined elsewhere
-            Engine_DMDQ, Engine, SchemaName, database_name = establish_connections(dest_config_key, dmdq_config_key) 
-
-            #read sheets in excel file and return list of tuples(sheet_name, dataframe)
-        
-            departments_sheets_data = read_departments_sheets(file_path)
-            countries_sheets_data = read_countries_sheets(file_path)
+            Engine_DMDQ, Engine, SchemaName, database_name = establish_connections(dest_config_key, dmdq_config_key,
+                                                                                   pool_size=load_workers)
+
+            skip, pending, read_log = None, {}, []
+            if incremental:
+                state = open_load_state()
+                skip, pending = plan_incremental_load(file_path, state, Engine, SchemaName)
+                if not pending:
+                    logging.info("All the sheets were already loaded, nothing to process")
+                    state.close()
+                    move_file_to_archive(file_path)
+                    return
+
+            #read sheets in excel files once and return list of tuples(file, sheet_name, dataframe) per group
+            sheets_data = read_workbook_sheets(file_path, max_workers=read_workers, cache_dir=PARSE_CACHE_DIR,
+                                               streaming=True, skip=skip, read_log=read_log, with_files=True)
+            departments_sheets_data = sheets_data['departments']
+            countries_sheets_data = sheets_data['countries']
   
-            # return dictionary, key=sheet_name & value= transformed dataframe
-            departments_transform_dfs= transform_by_departments_data(departments_sheets_data)
-            countries_transform_dfs = transform_by_countries_data(countries_sheets_data)
+            # return dictionary, key=sheet_name & value= one dataframe for all the files
+            # (batch transforms are faster than per sheet, see GSTAT_benchmark.py etl --batch)
+            with stage_timer.span('transform', group='departments'):
+                departments_transform_dfs= transform_departments_batch(departments_sheets_data, compact)
+            with stage_timer.span('transform', group='countries'):
+                countries_transform_dfs = transform_countries_batch(countries_sheets_data, compact)
             #This method creates a new dictionary 'transform_dfs'by unpacking the items from both dictionaries.
             transform_dfs = {**departments_transform_dfs, **countries_transform_dfs}
             #print(transform_dfs)
             # Load data to the database
-            execution_time = load_transformed_dataframes(transform_dfs, Engine, SchemaName)
-            # Log the data load operation
-            log_data_load(Engine_DMDQ, database_name, SchemaName, list(table_mappings.values()), 'GSTAT', execution_time, list(transform_dfs.values()))        
+            # Bulk load method and batch size can be set per destination in ETL_Config
+            dest_config = get_database_config(dest_config_key)
+            execution_time, table_stats = load_transformed_dataframes(transform_dfs, Engine, SchemaName,
+                                                                      dest_config.get("bulk_method", "fast_executemany"),
+                                                                      dest_config.get("bulk_chunksize"),
+                                                                      max_workers=load_workers)
+            # Log the data load operation, Time_of_execution of each table is the run time when it was loaded
+            table_execution_times = {table_name: execution_time for table_name in table_mappings.values()}
+            table_execution_times.update({stats['table']: format(stats['finished_at'], ".2f")
+                                          for stats in table_stats.values()})
+            with stage_timer.span('audit'):
+                # Only the tables loaded in this run, a table that failed to load is not audited
+                audited_tables, audited_dfs = loaded_tables(transform_dfs, table_stats)
+                log_data_load(Engine_DMDQ, database_name, SchemaName, audited_tables,
+                              'GSTAT', table_execution_times, audited_dfs)
+            if incremental:
+                mark_sheets_loaded(state, pending, read_log, transform_dfs, table_stats)
+                state.close()
+            stage_timer.log_summary()
+            e.log_pool_metrics()
             logging.info(f"ETL process completed successfully in {execution_time} seconds.")
         
             #move file to 'Archive' after finished processing
@@ -652,5 +1605,246 @@ def main():
     else:
         logging.info("There is no new files to be processed")
 
+def main_pipeline(start_year=2021, in_memory=True, compact=False):
+    """
+    Download the GSTAT workbooks and stream each one through parse, transform and load as soon as
+    it is downloaded (see run_pipeline).
+
+    With in_memory, the downloaded bytes are parsed from memory and only written to 'Archive' once loaded,
+    in the background. Otherwise they are downloaded into the current working directory and read from there.
+    A workbook that fails to load is not archived: in memory, the next run downloads it again, otherwise it stays
+    in the working directory. The .xlsx files found in the working directory are loaded first, before the
+    downloads, so such a workbook is loaded by the next run in both modes.
+    compact is passed to run_pipeline.
+    """
+    global stage_timer
+
+    logging.info("Starting streaming ETL process...")
+    stage_timer = StageTimer('GSTAT')
+    dest_config_key = 'STG_DEV'  
+    dmdq_config_key = 'ByDB_General' 
+    save_directory = os.getcwd()
+    archive_directory = os.path.join(save_directory, 'Archive')
+
+    try:
+        Engine_DMDQ, Engine, SchemaName, database_name = establish_connections(dest_config_key, dmdq_config_key,
+                                                                               pool_size=len(table_mappings))
+        dest_config = get_database_config(dest_config_key)
+
+        archive_store = get_archive_store(archive_directory)
+
+        def source(on_file):
+            # Workbooks left in the working directory were not loaded by an earlier run, and the scraper skips
+            # their URLs since it finds a local copy
+            for file in sorted(glob.glob(os.path.join(save_directory, '*.xlsx'))):
+                on_file(file)
+            # Each downloaded file enters the pipeline while the next ones are still downloading
+            s.download_gstat_xlsx_file(save_directory, archive_directory, start_year, max_workers=4, rate_limit=2,
+                                       discover=True, revalidate_days=30, on_downloaded=on_file, in_memory=in_memory,
+                                       archive_store=archive_store)
+
+        totals = run_pipeline(source, Engine, SchemaName, bulk_method=dest_config.get("bulk_method", "fast_executemany"),
+                              chunksize=dest_config.get("bulk_chunksize"), cache_dir=PARSE_CACHE_DIR, compact=compact)
+        if not totals:
+            logging.info("There is no new files to be processed")
+            return
+
+        execution_time = format(stage_timer.elapsed(), ".2f")
+        with stage_timer.span('audit'):
+            log_data_load(Engine_DMDQ, database_name, SchemaName, [stats['table'] for stats in totals.values()],
+                          'GSTAT', execution_time, [stats['shapes'] for stats in totals.values()])
+        stage_timer.log_summary()
+        e.log_pool_metrics()
+        logging.info(f"Streaming ETL process completed successfully in {execution_time} seconds.")
+    except Exception as error:
+        logging.error(f"An error occurred in the streaming ETL process: {error}")
+
+def register_workbook_jobs(work_queue, pattern, sheet_groups=SHEET_GROUPS, per_sheet=False):
+    """
+    Register the workbooks matching the pattern as jobs of the work queue.
+
+    A job is keyed by the SHA-256 of its workbook, so a workbook already registered by any worker is not
+    registered again, and a republished workbook is a new job.
+
+    Parameters:
+        work_queue (ETL_work_queue.WorkQueue): Queue shared by the workers.
+        pattern (str): Glob pattern of the Excel files, on storage every worker can read.
+        sheet_groups (dict): Group name -> list of sheet names, e.g. SHEET_GROUPS.
+        per_sheet (bool): One job per sheet ('<sha256>:<sheet>') instead of one per workbook,
+            so the sheets of a workbook can be loaded by different workers.
+
+    Returns:
+        int: Number of new jobs.
+    """
+    sheet_names = [sheet_name for sheet_names in sheet_groups.values() for sheet_name in sheet_names]
+    jobs = []
+    for file in sorted(glob.glob(pattern)):
+        file_hash = file_sha256(file)
+        year, quarter = file_year_quarter(file)
+        job = {'file_name': os.path.basename(file), 'file_path': os.path.abspath(file), 'file_hash': file_hash,
+               'year': year, 'quarter': quarter}
+        if per_sheet:
+            jobs.extend({**job, 'job_key': f"{file_hash}:{sheet_name}", 'sheets': sheet_name} for sheet_name in sheet_names)
+        else:
+            jobs.append({**job, 'job_key': file_hash, 'sheets': ','.join(sheet_names)})
+    return work_queue.register(jobs)
+
+def _job_archive_directory(job):
+    """Archive directory next to the workbook of a job."""
+    return os.path.join(os.path.dirname(job['file_path']), 'Archive')
+
+def _job_content(job):
+    """
+    Bytes of the workbook of a job: its file if it still has the registered content, else the archived copy
+    with that SHA-256 (another worker may have archived the file, or it was replaced by a republished one).
+    """
+    try:
+        with open(job['file_path'], 'rb') as file:
+            content = file.read()
+        if hashlib.sha256(content).hexdigest() == job['file_hash']:
+            return content
+    except OSError:
+        pass
+    store = get_archive_store(_job_archive_directory(job))
+    if store.lookup_sha256(job['file_hash']) is None:
+        raise FileNotFoundError(f"{job['file_name']} ({job['file_hash'][:12]}) is neither in its directory nor archived")
+    return store.read_bytes(job['file_hash'])
+
+def process_job(job, dest_engine, schema_name, engine_dmdq=None, database_name=None, bulk_method='default',
+                chunksize=None, cache_dir=None, compact=False):
+    """
+    Read, transform and load the sheets of one work queue job, then audit the load and archive the workbook.
+
+    Parameters:
+        job (dict): Job claimed from the work queue.
+        dest_engine (sqlalchemy.engine.base.Engine): Destination database engine.
+        schema_name (str): Schema of the destination tables.
+        engine_dmdq (sqlalchemy.engine.base.Engine, optional): DM_Quality engine, the load is not audited if None.
+        database_name (str, optional): Destination database name written in the audit.
+        bulk_method (str): How the temporary tables are filled, one of e.BULK_LOAD_METHODS.
+        chunksize (int, optional): Number of rows sent per batch by the bulk load.
+        cache_dir (str, optional): Parse cache directory (see read_workbook).
+        compact (bool): Transform into compact DataFrames (see compact_frame).
+
+    Returns:
+        dict: Sheet name -> load_table statistics.
+
+    Raises:
+        Exception: If the workbook cannot be read, a sheet read cannot be transformed or a table fails to load,
+            so the job is released for another attempt. Loading again is safe, the tables are upserted.
+    """
+    sheet_names = job['sheets'].split(',') if job['sheets'] else list(table_mappings)
+    content = _job_content(job)
+    with stage_timer.span('read', file=job['file_name']):
+        sheets = read_workbook(job['file_name'], sheet_names, cache_dir, streaming=True, content=content)
+    if not sheets:
+        raise ValueError(f"No sheet of {sheet_names} could be read from {job['file_name']}")
+
+    with stage_timer.span('transform', file=job['file_name']):
+        transform_dfs = {
+            **transform_departments_batch([sheet for sheet in sheets if sheet[1] in SHEET_GROUPS['departments']], compact),
+            **transform_countries_batch([sheet for sheet in sheets if sheet[1] in SHEET_GROUPS['countries']], compact)}
+    not_transformed = [sheet_name for _, sheet_name, _ in sheets if sheet_name not in transform_dfs]
+    if not_transformed:
+        raise ValueError(f"Sheets {not_transformed} of {job['file_name']} could not be transformed")
+
+    # The lease token is unique per claim, so concurrent workers stage into different tables
+    _, table_stats = load_transformed_dataframes(transform_dfs, dest_engine, schema_name, bulk_method, chunksize,
+                                                 max_workers=len(transform_dfs), staging_suffix=job['lease_token'][:8])
+    not_loaded = [table_mappings[sheet_name] for sheet_name in transform_dfs if sheet_name not in table_stats]
+    if not_loaded:
+        raise RuntimeError(f"Tables {not_loaded} failed to load from {job['file_name']}")
+
+    if engine_dmdq is not None:
+        with stage_timer.span('audit', file=job['file_name']):
+            audited_tables, audited_dfs = loaded_tables(transform_dfs, table_stats)
+            log_data_load(engine_dmdq, database_name, schema_name, audited_tables,
+                          'GSTAT', {stats['table']: format(stats['seconds'], ".2f") for stats in table_stats.values()},
+                          audited_dfs)
+
+    # Only archive the file if it is still the registered content, a republished one has its own job
+    try:
+        if file_sha256(job['file_path']) == job['file_hash']:
+            get_archive_store(_job_archive_directory(job)).put_file(job['file_path'], **s.archive_description(job['file_name']))
+    except FileNotFoundError:
+        pass # already archived by the worker of another sheet of the workbook
+    return table_stats
+
+def run_worker(work_queue, dest_engine, schema_name, worker_id=None, poll_seconds=30, **job_options):
+    """
+    Claim and process the jobs of the work queue one at a time until none is left.
+
+    Several workers, on one or several nodes, can run on the same queue: each job is claimed by one worker
+    under a lease kept alive by heartbeats (see ETL_work_queue.WorkQueue). A failed job is released for
+    another attempt, up to the max_attempts of the queue.
+
+    Parameters:
+        work_queue (ETL_work_queue.WorkQueue): Queue shared by the workers.
+        dest_engine (sqlalchemy.engine.base.Engine): Destination database engine.
+        schema_name (str): Schema of the destination tables.
+        worker_id (str, optional): Name of the worker in the queue, '<host>:<pid>' by default.
+        poll_seconds (float): When nothing can be claimed but other workers still hold unexpired leases, wait this
+            long and try again, as those jobs may be released or their lease may expire. 0 stops at once.
+        **job_options: engine_dmdq, database_name, bulk_method, chunksize, cache_dir and compact of process_job.
+
+    Returns:
+        dict: Number of jobs of this worker per outcome: {'done', 'failed', 'lost'}, lost jobs being finished
+              after their lease expired and another worker claimed them.
+    """
+    worker_id = worker_id or default_worker_id()
+    outcomes = {'done': 0, 'failed': 0, 'lost': 0}
+    while True:
+        jobs = work_queue.claim(worker_id)
+        if not jobs:
+            if poll_seconds and work_queue.active_leases():
+                time.sleep(poll_seconds)
+                continue
+            break
+
+        job = jobs[0]
+        try:
+            with work_queue.keep_alive(job):
+                process_job(job, dest_engine, schema_name, **job_options)
+        except Exception as error:
+            logging.error(f"Worker {worker_id} failed job {job['job_key']} ({job['file_name']}): {error}")
+            outcomes['failed' if work_queue.fail(job, error) else 'lost'] += 1
+            continue
+        outcomes['done' if work_queue.complete(job) else 'lost'] += 1
+
+    logging.info(f"Worker {worker_id} finished: {outcomes}, queue: {work_queue.counts()}")
+    return outcomes
+
+def main_worker(per_sheet=False, compact=False):
+    """
+    Run one ETL worker on the .xlsx files of the current working directory, shared by all the workers.
+
+    The workbooks are registered in the jobs table of the destination database (any worker may register them,
+    each one only once), then this worker processes jobs until none is left. Start it on as many nodes as needed.
+    compact is passed to process_job.
+    """
+    global stage_timer
+
+    logging.info("Starting ETL worker...")
+    stage_timer = StageTimer('GSTAT')
+    dest_config_key = 'STG_DEV'  
+    dmdq_config_key = 'ByDB_General' 
+
+    try:
+        Engine_DMDQ, Engine, SchemaName, database_name = establish_connections(dest_config_key, dmdq_config_key,
+                                                                               pool_size=len(table_mappings) + 1)
+        dest_config = get_database_config(dest_config_key)
+        work_queue = WorkQueue(Engine, dest_config.get("jobs_table", JOBS_TABLE), SchemaName,
+                               lease_seconds=dest_config.get("job_lease_seconds", 300))
+        work_queue.create_table()
+        register_workbook_jobs(work_queue, "*.xlsx", per_sheet=per_sheet)
+        outcomes = run_worker(work_queue, Engine, SchemaName, engine_dmdq=Engine_DMDQ, database_name=database_name,
+                              bulk_method=dest_config.get("bulk_method", "fast_executemany"),
+                              chunksize=dest_config.get("bulk_chunksize"), cache_dir=PARSE_CACHE_DIR, compact=compact)
+        stage_timer.log_summary()
+        e.log_pool_metrics()
+        logging.info(f"ETL worker completed in {stage_timer.elapsed():.2f} seconds: {outcomes}")
+    except Exception as error:
+        logging.error(f"An error occurred in the ETL worker: {error}")
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
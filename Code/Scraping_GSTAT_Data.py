@@ -1,11 +1,21 @@
 import os
 import requests
 from bs4 import BeautifulSoup
-from urllib.parse import urlparse, urljoin, unquote
+from urllib.parse import urlparse, urljoin, unquote, quote
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 from datetime import datetime
+from email.utils import formatdate
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import hashlib
+import io
+import json
+import re
+import time
 import logging
+from ETL_timing import StageTimer
+from ETL_archive import ArchiveStore
 
 """
 We configure logging using basicConfig() to set the logging level to INFO. 
@@ -13,86 +23,721 @@ This means that only messages with severity level INFO and higher will be logged
 """
 logging.basicConfig(level=logging.INFO)
 
-def download_gstat_xlsx_file(save_directory, archive_directory, start_year):
+# Possible outcomes of a single URL download, returned in each result dictionary
+STATUS_DOWNLOADED = 'downloaded'
+STATUS_SKIPPED = 'skipped'   # file already exists in the Archive directory
+STATUS_MISSING = 'missing'   # the server has no file for this URL (e.g. 404 for a future quarter)
+STATUS_FAILED = 'failed'     # network error, unexpected status code or write error
+
+# URL of the SAMA Monthly Statistics page "https://www.stats.gov.sa/ar/1250"
+HEADERS = {'user-agent': 'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)'}
+
+# Size of the chunks written to disk while streaming a download, and suffix of unfinished downloads
+CHUNK_SIZE = 64 * 1024
+PART_SUFFIX = '.part'
+
+# JSON file next to the Archive directory with the ETag, Last-Modified, size and sha256 of every downloaded URL
+MANIFEST_FILE_NAME = 'download_manifest.json'
+
+# (connect, read) timeouts in seconds for every request sent to the GSTAT website
+REQUEST_TIMEOUT = (10, 60)
+# HTTP status codes worth retrying: rate limiting and temporary server errors
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Directory of the published workbooks
+FILES_URL = 'https://www.stats.gov.sa/sites/default/files/'
+FILE_PATTERN = 'https://www.stats.gov.sa/sites/default/files/ITR%20Q{quarter}{year}A.xlsx'
+# Workbook published before the ITR file naming was used
+LEGACY_URL = 'https://www.stats.gov.sa/sites/default/files/International%20Trade%2C%20Third%20Quarter%202021Ar.xlsx'
+
+# JSON file next to the Archive directory with the last published (year, quarter) found by discovery
+FRONTIER_FILE_NAME = 'download_frontier.json'
+
+
+class HostRateLimiter:
+    """
+    Thread-safe limiter that spaces requests to the same host by at least 1/rate seconds.
+
+    Parameters:
+        rate (float): Maximum number of requests per second for each host. None or 0 disables the limit.
+    """
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = {} # host -> earliest time.monotonic() the next request may start
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class AttemptLog(threading.local):
+    """
+    Timeline of the HTTP attempts of the request running in the current thread, filled by TimedRetry.
+
+    Each entry is {'attempt', 'seconds', 'outcome', 'backoff'}: the duration of the attempt until its reply
+    (or error), its outcome ('HTTP 503', the error, ...) and the back-off waited after it before the next one.
+    """
+
+    def __init__(self):
+        self.entries = None
+
+    def start(self):
+        """Start the timeline of a new request."""
+        self.entries = []
+        self.mark = time.perf_counter() # end of the last attempt or back-off, start of the next attempt
+        self.closed = False # True once the last attempt was recorded by TimedRetry (retries exhausted)
+
+    def end_attempt(self, outcome):
+        if self.entries is None:
+            return None
+        now = time.perf_counter()
+        entry = {'attempt': len(self.entries) + 1, 'seconds': now - self.mark, 'outcome': outcome, 'backoff': 0.0}
+        self.entries.append(entry)
+        self.mark = now
+        return entry
+
+    def backoff(self, seconds):
+        if self.entries:
+            self.entries[-1]['backoff'] += seconds
+        self.mark = time.perf_counter()
+
+    def stop(self, outcome):
+        """Record the last attempt with its outcome unless it was already recorded, and return the timeline."""
+        if self.entries is not None and not self.closed:
+            self.end_attempt(outcome)
+        entries, self.entries = self.entries or [], None
+        return entries
+
+
+# Attempts of the download running in each thread
+attempt_log = AttemptLog()
+
+
+class TimedRetry(Retry):
+    """Retry policy that logs every failed attempt with its duration, outcome and the back-off before the next one."""
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        status = response.status if response is not None else None
+        entry = attempt_log.end_attempt(f"HTTP {status}" if status is not None else str(error))
+        try:
+            new_retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        except Exception:
+            # No retry left, this failed attempt is the last one of the request
+            attempt_log.closed = True
+            raise
+        seconds = f" after {entry['seconds']:.2f}s" if entry else ''
+        logging.warning(f"Attempt {len(new_retry.history)} of {method} {url} failed{seconds} "
+                        f"(status={status}, error={error}), retrying in {new_retry.get_backoff_time():.1f}s")
+        return new_retry
+
+    def sleep(self, response=None):
+        started = time.perf_counter()
+        try:
+            super().sleep(response)
+        finally:
+            attempt_log.backoff(time.perf_counter() - started)
+
+
+def create_http_session(pool_maxsize=10, total_retries=5, backoff_factor=1):
+    """
+    Create one requests.Session shared by all downloads of a run.
+
+    The session keeps connections to stats.gov.sa alive between requests and retries connection errors,
+    read errors and RETRY_STATUS_CODES with exponential back-off (backoff_factor * 2 ** (attempt - 1) seconds),
+    honouring Retry-After headers.
+
+    Parameters:
+        pool_maxsize (int): Maximum number of pooled connections per host, at least the number of download workers.
+        total_retries (int): Maximum number of retries for one request.
+        backoff_factor (float): Base of the exponential back-off in seconds.
+
+    Returns:
+        requests.Session: Session with the GSTAT headers and the retrying adapter mounted for http and https.
+    """
+    retry = TimedRetry(
+        total=total_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(['HEAD', 'GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False, # return the last response so the caller can report its status code
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=True, max_retries=retry)
+
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _content_range_total(content_range):
+    """Return the total size from a 'Content-Range: bytes 0-99/1234' header, or None if unknown."""
+    if content_range and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1].strip()
+        if total.isdigit():
+            return int(total)
+    return None
+
+
+def _if_range_validator(partial):
+    """If-Range value for the validators of a partial download: its strong ETag, else its Last-Modified, else None."""
+    etag = partial.get('etag')
+    # Weak ETags cannot be used in If-Range
+    if etag and not etag.startswith('W/'):
+        return etag
+    return partial.get('last_modified')
+
+
+def _same_validators(partial, headers):
+    """False if the ETag or Last-Modified of a reply differs from the ones recorded for a partial download."""
+    if partial.get('etag') and headers.get('ETag'):
+        return partial['etag'] == headers['ETag']
+    if partial.get('last_modified') and headers.get('Last-Modified'):
+        return partial['last_modified'] == headers['Last-Modified']
+    return True
+
+
+def generate_gstat_urls(start_year, last_quarter=None):
+    """
+    Build the list of GSTAT International Trade workbook URLs from start_year (fourth quarter) to the current year.
+
+    Parameters:
+        start_year (int): The first year to generate URLs for, only its fourth quarter is included.
+        last_quarter (tuple, optional): (year, quarter) of the last URL to generate, e.g. the discovered frontier.
+
+    Returns:
+        list: URLs in chronological order, starting with the legacy Third Quarter 2021 workbook.
+    """
+    # Get the current year
+    current_year = datetime.now().year
+    if last_quarter is not None:
+        current_year = last_quarter[0]
+
+    # Initialize a list to store the generated URLs
+    generated_urls = [LEGACY_URL,]
+
+    # Loop through the years from start_year to the current year
+    for year in range(start_year, current_year + 1):
+        if year == start_year:
+            quarters = [4]
+        else:
+            # Loop through the quarters (1 to 4)
+            quarters = range(1, 5)
+        for quarter in quarters:
+            if last_quarter is not None and (year, quarter) > tuple(last_quarter):
+                break
+            # Format the URL with the year and quarter
+            url = FILE_PATTERN.format(year=year, quarter=quarter)
+            generated_urls.append(url)
+
+    return generated_urls
+
+
+def file_url(file_name):
+    """URL of a downloaded workbook from its file name, the reverse of the file name taken from the URL by download_file."""
+    return urljoin(FILES_URL, quote(file_name))
+
+
+def archive_description(file_name):
+    """
+    URL, year and quarter of an archived workbook from its file name, e.g. 'ITR Q22024A.xlsx' -> year '2024'
+    and quarter 'Q2' as stored in the destination tables, so ArchiveStore.lookup_quarter finds it.
+    Year and quarter are None for other names.
+    """
+    match = re.search(r'Q([1-4])(\d{4})', os.path.basename(file_name))
+    year, quarter = (match.group(2), f"Q{match.group(1)}") if match else (None, None)
+    return {'url': file_url(file_name), 'year': year, 'quarter': quarter}
+
+
+def load_frontier(frontier_path):
+    """Return the last published (year, quarter) saved by discover_published_quarters, or None."""
+    if not os.path.exists(frontier_path):
+        return None
+    try:
+        with open(frontier_path, 'r', encoding='utf-8') as file:
+            frontier = json.load(file)
+        return frontier['year'], frontier['quarter']
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Could not read frontier {frontier_path}, probing from the start year: {e}")
+        return None
+
+
+def save_frontier(frontier_path, year, quarter, revalidated_at=None):
+    """Persist the last published (year, quarter) atomically, keeping the time of the last full revalidation."""
+    revalidated_at = revalidated_at or last_revalidation(frontier_path)
+    temp_path = frontier_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump({'year': year, 'quarter': quarter, 'checked_at': datetime.now().isoformat(timespec='seconds'),
+                   'revalidated_at': revalidated_at}, file)
+    os.replace(temp_path, frontier_path)
+
+
+def last_revalidation(frontier_path):
+    """Return the time (ISO string) every known quarter was last revalidated, saved in the frontier file, or None."""
+    try:
+        with open(frontier_path, 'r', encoding='utf-8') as file:
+            return json.load(file).get('revalidated_at')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _revalidation_due(frontier_path, revalidate_days):
+    """True if no full revalidation was recorded in the frontier file within the last revalidate_days days."""
+    revalidated_at = last_revalidation(frontier_path)
+    if revalidated_at is None:
+        return True
+    return (datetime.now() - datetime.fromisoformat(revalidated_at)).total_seconds() >= revalidate_days * 86400
+
+
+def _probe_url(session, link):
+    """Send a HEAD request (GET without reading the body if HEAD is not allowed) and return the status code."""
+    response = session.head(link, allow_redirects=True, timeout=REQUEST_TIMEOUT)
+    if response.status_code in (405, 501):
+        with session.get(link, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            pass
+    return response.status_code
+
+
+def discover_published_quarters(session, start_year, frontier_path, rate_limiter=None):
     """
-    Download an Excel file (.xlsx) from the GSTAT Quarterly Statistics page in current working directory if doesn't exist in Archive directory
+    Find the latest published quarter by probing the quarters after the saved frontier with HEAD requests.
+
+    Probing starts after the frontier (or at the fourth quarter of start_year on the first run) and stops at
+    the first quarter that is missing, so a run where nothing new was published sends a single request.
+
+    Parameters:
+        session (requests.Session): Shared session from create_http_session.
+        start_year (int): First year of the series, used when there is no frontier yet.
+        frontier_path (str): JSON file where the last published (year, quarter) is kept.
+        rate_limiter (HostRateLimiter, optional): Limiter shared with the downloads.
 
+    Returns:
+        tuple: (frontier, new_quarters) where frontier is the last published (year, quarter) or None,
+        and new_quarters the list of (year, quarter) published since the previous run.
     """
+    frontier = load_frontier(frontier_path)
+    year, quarter = frontier if frontier else (start_year, 3)
+    current_year = datetime.now().year
+    new_quarters = []
+
+    while True:
+        year, quarter = (year, quarter + 1) if quarter < 4 else (year + 1, 1)
+        if year > current_year:
+            break
+        link = FILE_PATTERN.format(year=year, quarter=quarter)
+        if rate_limiter is not None:
+            rate_limiter.wait(link)
+        try:
+            status_code = _probe_url(session, link)
+        except Exception as e:
+            logging.error(f"Failed probing {link}: {e}")
+            break
+        if status_code == 200:
+            new_quarters.append((year, quarter))
+            frontier = (year, quarter)
+        else:
+            if status_code != 404:
+                logging.warning(f"Unexpected status {status_code} probing {link}, stopping discovery")
+            break
+
+    if new_quarters:
+        save_frontier(frontier_path, *frontier)
+        logging.info(f"Discovered new published quarters: {new_quarters}")
+    else:
+        logging.info(f"No new quarter published after {frontier}")
+
+    return frontier, new_quarters
+
+
+def load_manifest(manifest_path):
+    """
+    Load the download manifest, a JSON dictionary keyed by URL with the validators of the last downloaded copy.
+
+    Parameters:
+        manifest_path (str): Path of the manifest file.
+
+    Returns:
+        dict: {url: {'file_name', 'etag', 'last_modified', 'size', 'sha256', 'checked_at'}}, empty if the file doesn't exist.
+        An unfinished download also has 'partial': {'etag', 'last_modified'} of the bytes in its .part file.
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not read download manifest {manifest_path}, starting a new one: {e}")
+        return {}
+
+
+def save_manifest(manifest_path, manifest):
+    """Write the download manifest atomically so a crash never leaves a half-written JSON file."""
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+
+def _file_sha256(file_path, hasher=None):
+    """Return a sha256 object updated with the content of file_path, read in CHUNK_SIZE blocks."""
+    hasher = hasher or hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher
+
+
+def download_file(link, save_directory, archive_directory, rate_limiter=None, manifest=None, session=None,
+                  in_memory=False, archive_store=None):
+    """
+    Download a single workbook into save_directory unless an identical copy already exists.
+
+    When the manifest has validators for the URL and a copy exists in save_directory or archive_directory,
+    a conditional GET (If-None-Match / If-Modified-Since) is sent and a 304 reply skips the file.
+    Archived files without a manifest entry are revalidated against the archive file modification time.
+
+    Parameters:
+        link (str): URL of the workbook.
+        save_directory (str): Directory where the downloaded file is written.
+        archive_directory (str): Directory checked for an already archived copy of the file.
+        rate_limiter (HostRateLimiter, optional): Limiter shared by all workers of a download run.
+        manifest (dict, optional): Download manifest (see load_manifest), updated in place.
+        session (requests.Session, optional): Shared session from create_http_session, a new one is used if not given.
+        in_memory (bool): Keep the downloaded bytes in result['content'] instead of writing the file to save_directory.
+            There is no partial file, so an interrupted transfer is downloaded again from the start.
+        archive_store (ETL_archive.ArchiveStore, optional): Archive store of archive_directory. The archived copy of
+            the URL is looked up in its index, and a download with the same SHA-256 as that copy is skipped.
+
+    Returns:
+        dict: {'url', 'file_name', 'status', 'path', 'bytes', 'attempts', 'attempt_log', 'elapsed', 'error'}
+        where status is one of the STATUS_* values, attempts the number of HTTP attempts including retries,
+        attempt_log the timing of each attempt (see AttemptLog) and elapsed the wall-clock seconds spent on
+        the request. With in_memory, a downloaded file has its bytes in 'content' and no path.
+    """
+    file_name = link.split('/')[-1]
+    # Decode URL-encoded file name if necessary
+    file_name = unquote(file_name)
+
+    # Define the local file path and archive file path
+    local_file_path = os.path.join(save_directory, file_name)
+    archive_file_path = os.path.join(archive_directory, file_name)
+
+    result = {'url': link, 'file_name': file_name, 'status': None, 'path': None, 'bytes': 0,
+              'attempts': 0, 'attempt_log': [], 'elapsed': 0.0, 'error': None}
+    manifest = manifest if manifest is not None else {}
+    entry = manifest.get(link)
+
+    archived = archive_store.lookup_url(link) if archive_store is not None else None
+    if archived is not None:
+        # The archived copy is the blob found through the index, not a file named after the URL
+        archive_file_path = archive_store.entry_path(archived)
+
+    # Existing copy of the file: waiting for the ETL in save_directory, or already processed in archive_directory
+    existing_path = next((path for path in (local_file_path, archive_file_path) if os.path.exists(path)), None)
+
+    # Partial downloads are written to '<file>.part' and renamed once complete,
+    # so the ETL never sees a truncated .xlsx and an interrupted transfer can be resumed
+    part_file_path = local_file_path + PART_SUFFIX
+
+    if session is None:
+        session = create_http_session(pool_maxsize=1)
+
+    started = time.perf_counter()
+    try:
+        if rate_limiter is not None:
+            rate_limiter.wait(link)
+            started = time.perf_counter()
+
+        # identity encoding keeps byte offsets and Content-Length valid for resuming
+        request_headers = {'Accept-Encoding': 'identity'}
+        resume_from = os.path.getsize(part_file_path) if os.path.exists(part_file_path) and not in_memory else 0
+        partial = (entry or {}).get('partial') or {}
+        if_range = _if_range_validator(partial)
+        if resume_from and not if_range:
+            # Without the validators of the partial file, its bytes may belong to an older version of the file
+            logging.info(f"No validator recorded for the partial download of {file_name}, downloading it again")
+            os.remove(part_file_path)
+            resume_from = 0
+        if resume_from:
+            # Ask only for the missing bytes of the partial file, the server sends the whole file if it changed
+            request_headers['Range'] = f"bytes={resume_from}-"
+            request_headers['If-Range'] = if_range
+        elif existing_path and entry:
+            # Ask the server to send the file only if it changed since the recorded copy
+            if entry.get('etag'):
+                request_headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                request_headers['If-Modified-Since'] = entry['last_modified']
+        elif existing_path:
+            # Archived before the manifest existed, compare with the time the copy was saved
+            request_headers['If-Modified-Since'] = formatdate(os.path.getmtime(existing_path), usegmt=True)
+
+        # Download the file inside the current working directory, streaming it in chunks
+        attempt_log.start()
+        with session.get(link, headers=request_headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            result['attempt_log'] = attempt_log.stop(f"HTTP {response.status_code}")
+            result['attempts'] = len(result['attempt_log'])
+
+            if response.status_code == 304:
+                logging.info(f"File {file_name} not modified since last download. Skipping download.")
+                result.update(status=STATUS_SKIPPED, path=existing_path)
+                if entry:
+                    entry['checked_at'] = datetime.now().isoformat(timespec='seconds')
+
+            elif response.status_code in (200, 206) or (response.status_code == 416 and resume_from):
+                if response.status_code == 206:
+                    if not _same_validators(partial, response.headers):
+                        # Server ignored If-Range: the remaining bytes are from another version of the file
+                        os.remove(part_file_path)
+                        raise IOError("partial file does not match the remote file, removed it")
+                    mode, written = 'ab', resume_from
+                    expected_size = _content_range_total(response.headers.get('Content-Range'))
+                    # The hash covers the bytes already in the partial file too
+                    hasher = _file_sha256(part_file_path)
+                    logging.info(f"Resuming download of {file_name} from byte {resume_from}")
+                elif response.status_code == 200:
+                    # Full reply (the server ignored the Range header if any), start from the beginning
+                    mode, written, hasher = 'wb', 0, hashlib.sha256()
+                    if in_memory:
+                        content = io.BytesIO()
+                    else:
+                        # Validators of the bytes written to the partial file, sent as If-Range to resume it
+                        manifest.setdefault(link, {'file_name': file_name})['partial'] = {
+                            'etag': response.headers.get('ETag'),
+                            'last_modified': response.headers.get('Last-Modified'),
+                        }
+                    expected_size = response.headers.get('Content-Length')
+                    expected_size = int(expected_size) if expected_size else None
+                else:
+                    # 416: nothing left to send, the partial file is only usable if it already has the full size
+                    if _content_range_total(response.headers.get('Content-Range')) != resume_from:
+                        os.remove(part_file_path)
+                        raise IOError("partial file does not match the remote file, removed it")
+                    mode, written, expected_size = None, resume_from, resume_from
+                    hasher = _file_sha256(part_file_path)
+
+                if in_memory:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        content.write(chunk)
+                        hasher.update(chunk)
+                        written += len(chunk)
+                        result['bytes'] += len(chunk)
+                elif mode:
+                    with open(part_file_path, mode) as file:
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            file.write(chunk)
+                            hasher.update(chunk)
+                            written += len(chunk)
+                            result['bytes'] += len(chunk)
+
+                if expected_size is not None and written != expected_size:
+                    # Keep the .part file so the next attempt resumes from here
+                    raise IOError(f"incomplete transfer, received {written} of {expected_size} bytes")
+
+                sha256 = hasher.hexdigest()
+                manifest[link] = {
+                    'file_name': file_name,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'size': written,
+                    'sha256': sha256,
+                    'checked_at': datetime.now().isoformat(timespec='seconds'),
+                }
+
+                archived_sha256 = archived['sha256'] if archived is not None else (entry or {}).get('sha256')
+                if existing_path == archive_file_path and archived_sha256 == sha256:
+                    # Republished with new validators but the same content, no need to process it again
+                    if not in_memory:
+                        os.remove(part_file_path)
+                    logging.info(f"File {file_name} content is unchanged. Skipping download.")
+                    result.update(status=STATUS_SKIPPED, path=archive_file_path)
+                elif in_memory:
+                    logging.info(f"File {file_name} downloaded successfully in memory ({written} bytes)")
+                    result.update(status=STATUS_DOWNLOADED, content=content.getvalue())
+                else:
+                    os.replace(part_file_path, local_file_path)
+                    logging.info(f"File {file_name} downloaded successfully in: {local_file_path}")
+                    result.update(status=STATUS_DOWNLOADED, path=local_file_path)
+
+            elif response.status_code == 404:
+                logging.info(f"File {file_name} is not published yet.")
+                result['status'] = STATUS_MISSING
+            else:
+                logging.error(f"Failed with downloading {file_name}: HTTP {response.status_code}")
+                result.update(status=STATUS_FAILED, error=f"HTTP {response.status_code}")
+    except Exception as d:
+        logging.error(f"Failed with downloading {file_name}: {d}")
+        result.update(status=STATUS_FAILED, error=str(d))
+        if attempt_log.entries is not None:
+            # The request itself failed, e.g. connection errors until no retry was left
+            result['attempt_log'] = attempt_log.stop(str(d))
+            result['attempts'] = len(result['attempt_log'])
+    finally:
+        result['elapsed'] = time.perf_counter() - started
+
+    return result
+
+
+def _has_local_copy(link, save_directory, archive_directory, archive_store=None):
+    """True if the file of link exists in save_directory or archive_directory, or is in the archive store."""
+    if archive_store is not None and archive_store.lookup_url(link) is not None:
+        return True
+    file_name = unquote(link.split('/')[-1])
+    return any(os.path.exists(os.path.join(directory, file_name)) for directory in (save_directory, archive_directory))
+
+
+def log_download_metrics(results):
+    """Log a summary of a download run: outcome counts, transferred bytes, HTTP attempts and request timings."""
+    if not results:
+        return
+    statuses = {}
+    for result in results:
+        statuses[result['status']] = statuses.get(result['status'], 0) + 1
+    elapsed = [result['elapsed'] for result in results]
+    backoff = sum(attempt['backoff'] for result in results for attempt in result.get('attempt_log', []))
+    logging.info(
+        f"Download run: {len(results)} URLs {statuses}, "
+        f"{sum(result['bytes'] for result in results)} bytes, "
+        f"{sum(result['attempts'] for result in results)} HTTP attempts, {backoff:.2f}s back-off, "
+        f"request time total={sum(elapsed):.2f}s mean={sum(elapsed) / len(elapsed):.2f}s max={max(elapsed):.2f}s")
+
+
+def download_gstat_xlsx_file(save_directory, archive_directory, start_year, max_workers=1, rate_limit=None,
+                             manifest_path=None, discover=False, revalidate=False, revalidate_days=None,
+                             on_downloaded=None, in_memory=False, archive_store=None):
+    """
+    Download Excel files (.xlsx) from the GSTAT Quarterly Statistics page in current working directory if they are new or changed
+
+    Parameters:
+        save_directory (str): Directory where downloaded files are written.
+        archive_directory (str): Directory of already processed files, files found there are only revalidated.
+        start_year (int): First year to download.
+        max_workers (int): Number of concurrent downloads, 1 keeps the sequential behaviour.
+        rate_limit (float, optional): Maximum requests per second sent to each host across all workers.
+        manifest_path (str, optional): Download manifest file, defaults to MANIFEST_FILE_NAME next to the archive directory.
+        discover (bool): Find the latest published quarter with HEAD probes (see discover_published_quarters)
+            instead of requesting every quarter up to the end of the current year.
+        revalidate (bool): With discover, also send conditional GETs for quarters that already have a local copy,
+            to catch republished workbooks. By default only newly published quarters and quarters never
+            downloaded are requested, so a run where nothing new was published sends a single HEAD request.
+        revalidate_days (float, optional): With discover, revalidate every known quarter when the last full
+            revalidation (kept in the frontier file) is older than this many days, e.g. 30 for a monthly check.
+        on_downloaded (callable, optional): Called with the path of each downloaded file as soon as it is written,
+            from the download worker, so the file can be processed while the other downloads run.
+            If it blocks (e.g. on a full queue), that worker waits before downloading its next file.
+        in_memory (bool): Do not write the downloaded files to save_directory (see download_file). on_downloaded
+            is called with (file_name, content bytes) instead of a path, and the bytes are not kept in the results.
+        archive_store (ETL_archive.ArchiveStore, optional): Archive store of archive_directory (see download_file),
+            opened for the run if not given.
+
+    Returns:
+        list: One result dictionary per requested URL (see download_file), in chronological order.
+    """
+    results = []
     # Ensure the archive directory exists
     if not os.path.exists(archive_directory):
         os.makedirs(archive_directory)
         logging.info(f"Created archive directory: {archive_directory}")
-    
-    try:
-        # URL of the SAMA Monthly Statistics page "https://www.stats.gov.sa/ar/1250"
-        headers = {'user-agent': 'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)'}
-
-        # Get the current year
-        current_year = datetime.now().year
 
-        file_pattern = 'https://www.stats.gov.sa/sites/default/files/ITR%20Q{quarter}{year}A.xlsx'
+    base_directory = os.path.dirname(os.path.abspath(archive_directory))
+    if manifest_path is None:
+        manifest_path = os.path.join(base_directory, MANIFEST_FILE_NAME)
+    manifest = load_manifest(manifest_path)
+    timer = StageTimer('GSTAT download')
+    own_archive_store = archive_store is None
+    if own_archive_store:
+        archive_store = ArchiveStore(archive_directory)
 
-        # Initialize a list to store the generated URLs
-        generated_urls = ['https://www.stats.gov.sa/sites/default/files/International%20Trade%2C%20Third%20Quarter%202021Ar.xlsx',]
+    try:
+        rate_limiter = HostRateLimiter(rate_limit)
+        # One pooled session for the whole run so every URL reuses warm keep-alive connections
+        session = create_http_session(pool_maxsize=max(1, max_workers))
 
-        # Loop through the years from start_year to the current year
-        for year in range(start_year, current_year + 1):
-            if year == start_year:
-                # Format the URL with the year and quarter
-                url = file_pattern.format(year=year, quarter=4)
-                generated_urls.append(url)
-            else:
-                # Loop through the quarters (1 to 4)
-                for quarter in range(1, 5):
-                    # Format the URL with the year and quarter
-                    url = file_pattern.format(year=year, quarter=quarter)
-                    generated_urls.append(url)
-
-        for link in generated_urls:
-                archive_found = False # change to true if file exist in Archive directory
-
-                file_name = link.split('/')[-1]
-                # Decode URL-encoded file name if necessary
-                file_name = unquote(file_name)
-
-                # Define the local file path and archive file path
-            
-                local_file_path = os.path.join(save_directory, file_name)
-                archive_file_path = os.path.join(archive_directory, file_name) 
-
-                # Check if file already exists in archive
-                if os.path.exists(archive_file_path):
-                    logging.info(f"File already exists in archive. Skipping download.")
-                    archive_found = True
-
-                elif archive_found==False: 
-                    try:
-                        # Download the file inside the current working directory
-                        response = requests.get(link, headers=headers)
-
-                        if response.status_code == 200:
-                            
-                            with open(local_file_path, 'wb') as file:
-                                file.write(response.content)
-
-                            logging.info(f"File {file_name} downloaded successfully in: {local_file_path}")
-                    except Exception as d:
-                        logging.error(f"Failed with downloading {file_name}")
+        if discover:
+            frontier_path = os.path.join(base_directory, FRONTIER_FILE_NAME)
+            frontier, new_quarters = discover_published_quarters(session, start_year, frontier_path, rate_limiter)
+            generated_urls = generate_gstat_urls(start_year, frontier or (start_year, 3))
+            if not revalidate and revalidate_days is not None and frontier is not None:
+                revalidate = _revalidation_due(frontier_path, revalidate_days)
+                if revalidate:
+                    logging.info(f"Last full revalidation is older than {revalidate_days} days, revalidating every quarter")
+            if not revalidate:
+                new_urls = {FILE_PATTERN.format(year=year, quarter=quarter) for year, quarter in new_quarters}
+                generated_urls = [link for link in generated_urls
+                                  if link in new_urls
+                                  or not _has_local_copy(link, save_directory, archive_directory, archive_store)]
+        else:
+            generated_urls = generate_gstat_urls(start_year)
 
-    except Exception as e:
-        logging.error(e)    
+        def fetch(link):
+            result = download_file(link, save_directory, archive_directory, rate_limiter, manifest, session, in_memory,
+                                   archive_store)
+            if on_downloaded is not None and result['status'] == STATUS_DOWNLOADED:
+                if in_memory:
+                    # Hand the bytes over, so the results of the run do not hold every workbook
+                    on_downloaded(result['file_name'], result.pop('content'))
+                else:
+                    on_downloaded(result['path'])
+            return result
 
-#save in current working directory
-save_directory = os.getcwd()
-archive_directory = os.path.join(save_directory, 'Archive') # Join the current working directory with the subdirectory 'Archive'
+        if max_workers <= 1:
+            for link in generated_urls:
+                results.append(fetch(link))
+        else:
+            # executor.map keeps the results in the same order as generated_urls
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(fetch, generated_urls))
 
-start_year = 2021
-# Call the function:
-downloaded_file_name = download_gstat_xlsx_file(save_directory, archive_directory, start_year)
-if downloaded_file_name:
-    print(f"Downloaded file name: {downloaded_file_name}")
+        session.close()
+        log_download_metrics(results)
+        if discover and revalidate and frontier is not None and all(result['status'] != STATUS_FAILED for result in results):
+            save_frontier(frontier_path, *frontier, revalidated_at=datetime.now().isoformat(timespec='seconds'))
+        # download_file measures each request with perf_counter, add them as spans of the run
+        for result in results:
+            timer.record('download', result['elapsed'], 'error' if result['status'] == STATUS_FAILED else 'ok',
+                         file=result['file_name'], outcome=result['status'], bytes=result['bytes'])
+            # One span per HTTP attempt and per back-off wait, so retries show in the timings
+            for attempt in result['attempt_log']:
+                timer.record('download_attempt', attempt['seconds'],
+                             'ok' if attempt is result['attempt_log'][-1] and result['status'] != STATUS_FAILED else 'error',
+                             file=result['file_name'], attempt=attempt['attempt'], outcome=attempt['outcome'])
+                if attempt['backoff']:
+                    timer.record('backoff', attempt['backoff'], file=result['file_name'], attempt=attempt['attempt'])
 
+    except Exception as e:
+        logging.error(e)
+    finally:
+        save_manifest(manifest_path, manifest)
+        if own_archive_store:
+            archive_store.close()
+        timer.log_summary()
 
+    return results
 
 
+if __name__ == '__main__':
+    #save in current working directory
+    save_directory = os.getcwd()
+    archive_directory = os.path.join(save_directory, 'Archive') # Join the current working directory with the subdirectory 'Archive'
 
+    start_year = 2021
+    # Files archived before the archive store existed are moved into it
+    archive_store = ArchiveStore(archive_directory)
+    archive_store.import_flat_files(describe=archive_description)
+    # Call the function:
+    download_results = download_gstat_xlsx_file(save_directory, archive_directory, start_year, max_workers=4, rate_limit=2,
+                                                discover=True, revalidate_days=30, archive_store=archive_store)
+    archive_store.close()
+    for result in download_results:
+        if result['status'] == STATUS_DOWNLOADED:
+            print(f"Downloaded file name: {result['file_name']}")
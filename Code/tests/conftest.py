@@ -0,0 +1,116 @@
+import http.server
+import os
+import sys
+import threading
+import types
+import urllib.parse
+
+import pytest
+
+# The ETL modules are scripts of the Code directory, not an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ETL_Config holds the local connection settings and is not in the repository. The tests only use SQLite
+# engines they create, so an empty configuration is enough to import the ETL modules.
+try:
+    import ETL_Config  # noqa: F401
+except ImportError:
+    ETL_Config = types.ModuleType('ETL_Config')
+    ETL_Config.config = {'servers': {}}
+    sys.modules['ETL_Config'] = ETL_Config
+
+
+class StandInServer:
+    """
+    Local HTTP stand-in of the GSTAT files server for the download tests.
+
+    It serves the published files with ETag and Last-Modified, answers conditional GETs with 304, Range
+    requests with 206 (or 416 past the end) and honours If-Range unless ignore_if_range is set.
+    fail[name] is a list of status codes sent before the file, truncate[name] a number of bytes after which
+    the next reply of the file is cut off. Every request is recorded as (method, name, headers).
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.fail = {}
+        self.truncate = {}
+        self.ignore_if_range = False
+        self.requests = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                server._reply(self, body=False)
+
+            def do_GET(self):
+                server._reply(self, body=True)
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/files/"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, name):
+        return self.base_url + urllib.parse.quote(name)
+
+    def publish(self, name, content, etag, last_modified='Mon, 01 Jan 2024 00:00:00 GMT'):
+        self.files[name] = {'content': content, 'etag': etag, 'last_modified': last_modified}
+
+    def requests_of(self, name, method='GET'):
+        return [headers for request_method, request_name, headers in self.requests
+                if request_method == method and request_name == name]
+
+    def _reply(self, handler, body):
+        name = urllib.parse.unquote(handler.path.split('/')[-1])
+        self.requests.append((handler.command, name, dict(handler.headers)))
+        if self.fail.get(name):
+            return self._send(handler, self.fail[name].pop(0))
+        published = self.files.get(name)
+        if published is None:
+            return self._send(handler, 404)
+
+        content, etag, last_modified = published['content'], published['etag'], published['last_modified']
+        validators = {'ETag': etag, 'Last-Modified': last_modified}
+        if handler.headers.get('If-None-Match') == etag or (
+                'If-None-Match' not in handler.headers and handler.headers.get('If-Modified-Since') == last_modified):
+            return self._send(handler, 304, headers=validators)
+
+        status, headers = 200, dict(validators)
+        byte_range = handler.headers.get('Range')
+        if_range = handler.headers.get('If-Range')
+        if byte_range and (self.ignore_if_range or if_range is None or if_range in (etag, last_modified)):
+            start = int(byte_range.split('=')[1].split('-')[0])
+            if start >= len(content):
+                return self._send(handler, 416, headers={'Content-Range': f"bytes */{len(content)}"})
+            status = 206
+            headers['Content-Range'] = f"bytes {start}-{len(content) - 1}/{len(content)}"
+            content = content[start:]
+        self._send(handler, status, content if body else b'', headers, len(content), self.truncate.pop(name, None))
+
+    @staticmethod
+    def _send(handler, status, content=b'', headers=None, length=None, truncate=None):
+        handler.send_response(status)
+        for header, value in (headers or {}).items():
+            handler.send_header(header, value)
+        handler.send_header('Content-Length', str(len(content) if length is None else length))
+        handler.end_headers()
+        if truncate is not None:
+            # Interrupted transfer: part of the body, then the connection is closed
+            handler.wfile.write(content[:truncate])
+            handler.close_connection = True
+            return
+        handler.wfile.write(content)
+
+
+@pytest.fixture
+def stand_in_server():
+    server = StandInServer()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
@@ -0,0 +1,131 @@
+"""
+ArchiveStore tests on a temporary archive directory with its SQLite index.
+"""
+import gzip
+import hashlib
+import os
+
+import pytest
+
+import Scraping_GSTAT_Data as s
+from ETL_archive import INDEX_FILE_NAME, ArchiveStore
+
+NAME = 'ITR Q12024A.xlsx'
+URL = 'https://example.org/ITR%20Q12024A.xlsx'
+CONTENT = bytes(range(256)) * 1000
+REPUBLISHED = bytes(reversed(range(256))) * 1100
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ArchiveStore(str(tmp_path / 'Archive'))
+    yield store
+    store.close()
+
+
+def _write(directory, name, content):
+    path = os.path.join(str(directory), name)
+    with open(path, 'wb') as file:
+        file.write(content)
+    return path
+
+
+def test_put_file_is_indexed_by_url_name_and_quarter(store, tmp_path):
+    path = _write(tmp_path, NAME, CONTENT)
+
+    entry = store.put_file(path, url=URL, year='2024', quarter='Q1')
+
+    assert not os.path.exists(path)
+    assert os.path.exists(os.path.join(store.archive_directory, INDEX_FILE_NAME))
+    assert entry['sha256'] == hashlib.sha256(CONTENT).hexdigest()
+    assert entry['size'] == len(CONTENT)
+    assert store.lookup_url(URL) == entry
+    assert store.lookup_name(NAME) == entry
+    assert store.lookup_quarter(2024, 'Q1') == entry
+    assert store.lookup_quarter('2024', 'Q2') is None
+    assert store.lookup_url('https://example.org/ITR%20Q22024A.xlsx') is None
+
+
+def test_put_file_can_keep_the_file(store, tmp_path):
+    path = _write(tmp_path, NAME, CONTENT)
+
+    store.put_file(path, remove=False)
+
+    assert os.path.exists(path)
+    # Without URL the entry is found by the file name of the URL
+    assert store.lookup_url(URL)['file_name'] == NAME
+
+
+def test_same_content_under_two_names_is_stored_once(store, tmp_path):
+    first = store.put_file(_write(tmp_path, NAME, CONTENT), year='2024', quarter='Q1')
+    second = store.put(CONTENT, 'ITR Q12024A (1).xlsx', year='2024', quarter='Q1')
+
+    blobs = [name for _, _, names in os.walk(os.path.join(store.archive_directory, 'objects')) for name in names]
+    assert first['sha256'] == second['sha256']
+    assert blobs == [first['sha256'] + '.gz']
+    assert store.stats() == {'files': 2, 'blobs': 1, 'size': len(CONTENT), 'stored_size': first['stored_size']}
+
+
+def test_republished_workbook_replaces_its_blob(store):
+    old = store.put(CONTENT, NAME, url=URL, year='2024', quarter='Q1')
+    new = store.put(REPUBLISHED, NAME, url=URL)
+
+    assert new['sha256'] != old['sha256']
+    assert (new['year'], new['quarter']) == ('2024', 'Q1')
+    assert not os.path.exists(store.entry_path(old))
+    assert store.lookup_sha256(old['sha256']) is None
+    assert store.stats()['blobs'] == 1
+
+
+def test_gzip_blob_round_trip(store, tmp_path):
+    entry = store.put(CONTENT, NAME, url=URL)
+
+    with gzip.open(store.entry_path(entry), 'rb') as blob:
+        assert blob.read() == CONTENT
+    assert entry['compression'] == 'gzip'
+    assert store.read_bytes(entry['sha256']) == CONTENT
+    exported = store.export(entry, str(tmp_path / 'exported.xlsx'))
+    with open(exported, 'rb') as file:
+        assert file.read() == CONTENT
+
+
+def test_uncompressed_blob_round_trip(tmp_path):
+    store = ArchiveStore(str(tmp_path / 'Archive'), compress=False)
+    try:
+        entry = store.put(CONTENT, NAME)
+
+        assert entry['compression'] is None
+        assert store.entry_path(entry).endswith(entry['sha256'])
+        assert store.read_bytes(entry['sha256']) == CONTENT
+    finally:
+        store.close()
+
+
+def test_read_bytes_of_an_unknown_hash(store):
+    with pytest.raises(KeyError):
+        store.read_bytes(hashlib.sha256(CONTENT).hexdigest())
+
+
+def test_index_survives_a_reopen(tmp_path):
+    store = ArchiveStore(str(tmp_path / 'Archive'))
+    entry = store.put(CONTENT, NAME, url=URL, year='2024', quarter='Q1')
+    store.close()
+
+    reopened = ArchiveStore(str(tmp_path / 'Archive'))
+    try:
+        assert reopened.lookup_url(URL) == entry
+        assert reopened.read_bytes(entry['sha256']) == CONTENT
+    finally:
+        reopened.close()
+
+
+def test_import_flat_files_of_the_archive_directory(store):
+    _write(store.archive_directory, NAME, CONTENT)
+    _write(store.archive_directory, 'ITR Q22024A.xlsx', REPUBLISHED)
+
+    assert store.import_flat_files(describe=s.archive_description) == 2
+
+    assert not [name for name in os.listdir(store.archive_directory) if name.endswith('.xlsx')]
+    assert store.lookup_quarter('2024', 'Q1')['sha256'] == hashlib.sha256(CONTENT).hexdigest()
+    assert store.lookup_url(s.file_url('ITR Q22024A.xlsx'))['quarter'] == 'Q2'
+    assert store.import_flat_files() == 0
@@ -0,0 +1,75 @@
+"""
+Load of the synthetic workbooks into the SQLite stand-in tables of GSTAT_benchmark.
+"""
+import os
+
+import pytest
+import sqlalchemy
+
+import GSTAT_benchmark as benchmark
+etl = benchmark.etl
+
+
+@pytest.fixture
+def sheets(tmp_path):
+    benchmark.generate_synthetic_workbooks(str(tmp_path), files=2, sections=5, countries=10)
+    etl.stage_timer = etl.StageTimer('test')
+    return etl.read_workbook_sheets(os.path.join(str(tmp_path), 'ITR Q*.xlsx'), streaming=True)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'destination.db'}")
+    yield engine
+    engine.dispose()
+
+
+def _transform(sheets, compact=False):
+    return {**etl.transform_by_departments_data(sheets['departments'], compact),
+            **etl.transform_by_countries_data(sheets['countries'], compact)}
+
+
+def test_rerun_of_the_same_workbooks_changes_nothing(sheets, engine):
+    transformed = _transform(sheets)
+    benchmark.create_destination_tables(engine, transformed)
+
+    _, first = etl.load_transformed_dataframes(transformed, engine, None)
+    _, second = etl.load_transformed_dataframes(transformed, engine, None)
+
+    assert all(stats['inserted'] == stats['rows'] for stats in first.values())
+    assert all(stats['inserted'] == 0 and stats['updated'] == 0 for stats in second.values())
+
+
+def test_compact_reload_of_a_plain_load_changes_nothing(sheets, engine):
+    transformed = _transform(sheets)
+    benchmark.create_destination_tables(engine, transformed)
+    etl.load_transformed_dataframes(transformed, engine, None)
+
+    _, reload = etl.load_transformed_dataframes(_transform(sheets, compact=True), engine, None)
+
+    assert {sheet: (stats['inserted'], stats['updated']) for sheet, stats in reload.items()} == \
+        {sheet: (0, 0) for sheet in transformed}
+
+
+def test_value_columns_are_created_as_float(sheets, engine):
+    transformed = _transform(sheets)
+    benchmark.create_destination_tables(engine, transformed)
+
+    columns = {column['name']: column['type'] for column in
+               sqlalchemy.inspect(engine).get_columns(etl.table_mappings['1.4'])}
+
+    assert isinstance(columns[next(iter(etl.sections_columns_renamed.values()))], sqlalchemy.Float)
+    assert not isinstance(columns['الدولة'], sqlalchemy.Float)
+
+
+def test_table_that_fails_to_load_is_not_audited(sheets, engine):
+    transformed = _transform(sheets)
+    benchmark.create_destination_tables(engine, transformed)
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(f'DROP TABLE "{etl.table_mappings["2.4"]}"'))
+
+    _, table_stats = etl.load_transformed_dataframes(transformed, engine, None)
+    table_names, data_frames = etl.loaded_tables(transformed, table_stats)
+
+    assert table_names == [etl.table_mappings[sheet] for sheet in transformed if sheet != '2.4']
+    assert data_frames == [transformed[sheet] for sheet in transformed if sheet != '2.4']
@@ -0,0 +1,85 @@
+"""
+Incremental mode: which sheets are read again, decided from the SQLite state store and the destination tables.
+"""
+import importlib
+import os
+from datetime import datetime
+
+import pytest
+import sqlalchemy
+
+etl = importlib.import_module('GSTAT_refactor-V2')
+
+
+@pytest.fixture
+def workbooks(tmp_path):
+    # Only hashed, never parsed
+    paths = []
+    for name, content in [('ITR Q12024A.xlsx', b'first quarter'), ('ITR Q22024A.xlsx', b'second quarter')]:
+        path = tmp_path / name
+        path.write_bytes(content)
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def destination(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'destination.db'}")
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(
+            f'CREATE TABLE "{etl.table_mappings["1.1"]}" ("Section_number" TEXT, "Year" TEXT, "Quarter" TEXT)'))
+        connection.execute(sqlalchemy.text(
+            f'INSERT INTO "{etl.table_mappings["1.1"]}" VALUES (\'1\', \'2024\', \'Q1\')'))
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def state(tmp_path):
+    state = etl.open_load_state(str(tmp_path / etl.LOAD_STATE_FILE))
+    yield state
+    state.close()
+
+
+def _mark_loaded(state, file, sheet_name):
+    year, quarter = etl.file_year_quarter(file)
+    with state:
+        state.execute("INSERT OR REPLACE INTO load_state VALUES (?, ?, ?, ?, ?, ?, ?)",
+                      (etl.file_sha256(file), sheet_name, year, quarter, etl.LOAD_STATUS_LOADED,
+                       os.path.basename(file), datetime.now().isoformat(timespec='seconds')))
+
+
+def test_loaded_quarter_is_skipped(workbooks, destination, state, tmp_path):
+    first, second = workbooks
+    _mark_loaded(state, first, '1.1')
+
+    skip, pending = etl.plan_incremental_load(str(tmp_path / 'ITR Q*.xlsx'), state, destination, None)
+
+    assert skip == {(first, '1.1')}
+    assert set(pending) == {(file, sheet_name) for file in workbooks for sheet_name in etl.table_mappings} - skip
+    assert pending[(second, '1.1')] == (etl.file_sha256(second), '2024', 'Q2')
+
+
+def test_sheet_is_read_again_when_its_quarter_left_the_table(workbooks, destination, state, tmp_path):
+    first, second = workbooks
+    # Marked as loaded, but the destination table has no 2024 Q2 rows
+    _mark_loaded(state, second, '1.1')
+    # Marked as loaded, but its destination table does not exist
+    _mark_loaded(state, first, '2.1')
+
+    skip, pending = etl.plan_incremental_load(str(tmp_path / 'ITR Q*.xlsx'), state, destination, None)
+
+    assert skip == set()
+    assert (second, '1.1') in pending and (first, '2.1') in pending
+
+
+def test_republished_workbook_is_read_again(workbooks, destination, state, tmp_path):
+    first, _ = workbooks
+    _mark_loaded(state, first, '1.1')
+    with open(first, 'wb') as file:
+        file.write(b'first quarter, republished')
+
+    skip, pending = etl.plan_incremental_load(str(tmp_path / 'ITR Q*.xlsx'), state, destination, None)
+
+    assert skip == set()
+    assert pending[(first, '1.1')][0] == etl.file_sha256(first)
@@ -0,0 +1,120 @@
+"""
+Streaming pipeline tests: synthetic workbooks from a fake source, loaded into SQLite stand-in tables.
+"""
+import os
+
+import pytest
+import sqlalchemy
+
+import GSTAT_benchmark as benchmark
+etl = benchmark.etl
+
+CORRUPT = 'ITR Q42021A.xlsx'
+
+
+@pytest.fixture
+def workbooks(tmp_path, monkeypatch):
+    # The pipeline archives into 'Archive' of the current working directory
+    monkeypatch.chdir(tmp_path)
+    etl.stage_timer = etl.StageTimer('test')
+    paths = benchmark.generate_synthetic_workbooks(str(tmp_path), files=2, sections=5, countries=10)
+    yield [os.path.basename(path) for path in paths]
+    store = etl._archive_stores.pop(os.path.abspath('Archive'), None)
+    if store is not None:
+        store.close()
+
+
+@pytest.fixture
+def transformed(workbooks):
+    sheets = etl.read_workbook_sheets('ITR Q*.xlsx', streaming=True)
+    return {**etl.transform_by_departments_data(sheets['departments']),
+            **etl.transform_by_countries_data(sheets['countries'])}
+
+
+@pytest.fixture
+def engine(tmp_path, transformed):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'destination.db'}")
+    benchmark.create_destination_tables(engine, transformed)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def content(workbooks, engine):
+    # Once the stand-in tables exist: downloaded in memory, the second workbook is never written to the working directory
+    with open(workbooks[1], 'rb') as file:
+        content = file.read()
+    os.remove(workbooks[1])
+    return content
+
+
+def _source(workbooks, content):
+    """Fake download: the first workbook as a path, the second as bytes, then a workbook that cannot be read."""
+    def source(on_file):
+        on_file(os.path.abspath(workbooks[0]))
+        on_file(workbooks[1], content)
+        with open(CORRUPT, 'wb') as file:
+            file.write(b'not a workbook')
+        on_file(os.path.abspath(CORRUPT))
+    return source
+
+
+def _archived(names):
+    store = etl.get_archive_store()
+    return [name for name in names if store.lookup_name(name) is not None]
+
+
+def test_pipeline_totals_and_archive(workbooks, content, transformed, engine):
+    totals = etl.run_pipeline(_source(workbooks, content), engine, None)
+
+    assert set(totals) == set(transformed)
+    for sheet_name, dfs in transformed.items():
+        rows = sum(len(df) for df in dfs)
+        assert totals[sheet_name]['table'] == etl.table_mappings[sheet_name]
+        assert totals[sheet_name]['files'] == 2
+        assert (totals[sheet_name]['rows'], totals[sheet_name]['inserted'], totals[sheet_name]['updated']) == \
+            (rows, rows, 0)
+        assert sum(shape[0] for shape in totals[sheet_name]['shapes']) == rows
+    # Both loaded workbooks are archived, the one that could not be read stays for the next run
+    assert _archived(workbooks + [CORRUPT]) == workbooks
+    assert sorted(name for name in os.listdir('.') if name.endswith('.xlsx')) == [CORRUPT]
+
+
+def test_rerun_of_the_pipeline_changes_nothing(workbooks, content, engine):
+    etl.run_pipeline(_source(workbooks, content), engine, None, archive=False)
+
+    totals = etl.run_pipeline(_source(workbooks, content), engine, None, archive=False)
+
+    assert all(stats['inserted'] == 0 and stats['updated'] == 0 for stats in totals.values())
+    assert not os.path.exists('Archive')
+
+
+def test_workbook_with_a_table_that_fails_is_not_archived(workbooks, content, transformed, engine):
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(f'DROP TABLE "{etl.table_mappings["2.4"]}"'))
+
+    totals = etl.run_pipeline(_source(workbooks, content), engine, None)
+
+    assert set(totals) == set(transformed) - {'2.4'}
+    assert all(stats['files'] == 2 for stats in totals.values())
+    assert _archived(workbooks + [CORRUPT]) == []
+    # The workbook given as a path is still in the working directory
+    assert os.path.exists(workbooks[0])
+
+
+def test_main_pipeline_loads_the_workbooks_left_by_an_earlier_run(workbooks, transformed, engine, monkeypatch):
+    audited = []
+    downloaded = []
+    monkeypatch.setattr(etl, 'establish_connections', lambda *args, **kwargs: (None, engine, None, 'database'))
+    monkeypatch.setattr(etl, 'get_database_config', lambda config_key: {'bulk_method': 'default'})
+    monkeypatch.setattr(etl, 'log_data_load', lambda engine_dmdq, db_name, schema_name, table_names, *args:
+                        audited.extend(table_names))
+    # The scraper finds the local copies of the workbooks and downloads nothing
+    monkeypatch.setattr(etl.s, 'download_gstat_xlsx_file', lambda *args, **kwargs: downloaded.append(kwargs))
+
+    etl.main_pipeline(in_memory=False)
+
+    assert len(downloaded) == 1
+    assert sorted(audited) == sorted(etl.table_mappings[sheet_name] for sheet_name in transformed)
+    assert _archived(workbooks) == workbooks
+    assert not [name for name in os.listdir('.') if name.endswith('.xlsx')]
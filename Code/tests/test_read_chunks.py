@@ -0,0 +1,64 @@
+"""
+Chunked reads of a source table.
+"""
+import pandas as pd
+import sqlalchemy
+
+import ETL_com_functions as e
+
+
+class UnbufferedCursor:
+    """Cursor behaving like a mysql.connector unbuffered cursor: closing it with unread rows raises."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.description = None
+
+    def execute(self, query, params=None):
+        self.description = [('id',), ('value',)]
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        if self.rows:
+            raise RuntimeError('Unread result found')
+
+
+class UnbufferedConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self, buffered=True):
+        assert buffered is False
+        return UnbufferedCursor(self.rows)
+
+
+def test_chunks_of_an_engine(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'source.db'}")
+    pd.DataFrame({'id': range(25), 'value': [0.5] * 25}).to_sql('source', engine, index=False)
+
+    chunks = list(e.read_source_data_chunks('source', engine, chunksize=10, where='id >= :low', params={'low': 5}))
+    engine.dispose()
+
+    assert [len(chunk) for chunk in chunks] == [10, 10]
+    assert list(chunks[0].columns) == ['id', 'value']
+
+
+def test_unbuffered_cursor_is_closed_when_the_reader_stops_early():
+    rows = [(i, i * 0.5) for i in range(25)]
+    chunks = e.read_source_data_chunks('source', UnbufferedConnection(rows), chunksize=10)
+
+    first = next(chunks)
+    chunks.close()
+
+    assert first.to_dict('list') == {'id': list(range(10)), 'value': [i * 0.5 for i in range(10)]}
+
+
+def test_unbuffered_cursor_reads_every_row():
+    rows = [(i, i * 0.5) for i in range(25)]
+
+    chunks = list(e.read_source_data_chunks('source', UnbufferedConnection(rows), chunksize=10))
+
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
@@ -0,0 +1,289 @@
+"""
+Download tests against the local stand-in server of conftest.py.
+"""
+import hashlib
+import os
+from datetime import datetime
+
+import pytest
+
+import Scraping_GSTAT_Data as s
+from conftest import StandInServer
+
+NAME = 'ITR Q12024A.xlsx'
+CONTENT = bytes(range(256)) * 1000
+REPUBLISHED = bytes(reversed(range(256))) * 1100
+# Bytes received before the connection is cut, whole chunks so they all reach the partial file
+RECEIVED = 2 * s.CHUNK_SIZE
+
+
+@pytest.fixture
+def directories(tmp_path):
+    save_directory, archive_directory = tmp_path / 'downloads', tmp_path / 'Archive'
+    save_directory.mkdir()
+    archive_directory.mkdir()
+    return str(save_directory), str(archive_directory)
+
+
+@pytest.fixture
+def session():
+    session = s.create_http_session(total_retries=2, backoff_factor=0)
+    yield session
+    session.close()
+
+
+def _download(server, directories, manifest, session):
+    return s.download_file(server.url(NAME), *directories, manifest=manifest, session=session)
+
+
+def _read(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def _interrupted_download(server, directories, manifest, session):
+    server.publish(NAME, CONTENT, etag='"v1"')
+    server.truncate[NAME] = RECEIVED
+    result = _download(server, directories, manifest, session)
+    assert result['status'] == s.STATUS_FAILED
+    return os.path.join(directories[0], NAME + s.PART_SUFFIX)
+
+
+def test_interrupted_download_is_resumed(stand_in_server, directories, session):
+    manifest = {}
+    part_path = _interrupted_download(stand_in_server, directories, manifest, session)
+    assert os.path.getsize(part_path) == RECEIVED
+    assert manifest[stand_in_server.url(NAME)]['partial']['etag'] == '"v1"'
+
+    result = _download(stand_in_server, directories, manifest, session)
+
+    resume = stand_in_server.requests_of(NAME)[-1]
+    assert (resume['Range'], resume['If-Range']) == (f'bytes={RECEIVED}-', '"v1"')
+    assert result['status'] == s.STATUS_DOWNLOADED
+    assert result['bytes'] == len(CONTENT) - RECEIVED
+    assert _read(result['path']) == CONTENT
+    assert not os.path.exists(part_path)
+    assert 'partial' not in manifest[stand_in_server.url(NAME)]
+
+
+def test_file_republished_during_a_partial_download_is_downloaded_again(stand_in_server, directories, session):
+    manifest = {}
+    _interrupted_download(stand_in_server, directories, manifest, session)
+    stand_in_server.publish(NAME, REPUBLISHED, etag='"v2"')
+
+    result = _download(stand_in_server, directories, manifest, session)
+
+    # If-Range does not match the new ETag, so the server sends the whole new file
+    assert result['status'] == s.STATUS_DOWNLOADED
+    assert _read(result['path']) == REPUBLISHED
+    assert manifest[stand_in_server.url(NAME)]['etag'] == '"v2"'
+
+
+def test_partial_download_is_restarted_when_the_server_ignores_if_range(stand_in_server, directories, session):
+    manifest = {}
+    part_path = _interrupted_download(stand_in_server, directories, manifest, session)
+    stand_in_server.publish(NAME, REPUBLISHED, etag='"v2"')
+    stand_in_server.ignore_if_range = True
+
+    mismatch = _download(stand_in_server, directories, manifest, session)
+
+    # The 206 reply belongs to another version of the file: the partial file is dropped, not completed
+    assert mismatch['status'] == s.STATUS_FAILED
+    assert not os.path.exists(part_path)
+
+    result = _download(stand_in_server, directories, manifest, session)
+
+    assert 'Range' not in stand_in_server.requests_of(NAME)[-1]
+    assert result['status'] == s.STATUS_DOWNLOADED
+    assert _read(result['path']) == REPUBLISHED
+
+
+def test_complete_partial_file_is_finished_on_416(stand_in_server, directories, session):
+    manifest = {stand_in_server.url(NAME): {'file_name': NAME, 'partial': {'etag': '"v1"', 'last_modified': None}}}
+    stand_in_server.publish(NAME, CONTENT, etag='"v1"')
+    part_path = os.path.join(directories[0], NAME + s.PART_SUFFIX)
+    with open(part_path, 'wb') as file:
+        file.write(CONTENT)
+
+    result = _download(stand_in_server, directories, manifest, session)
+
+    assert result['status'] == s.STATUS_DOWNLOADED
+    assert result['bytes'] == 0
+    assert _read(result['path']) == CONTENT
+
+
+def test_partial_file_without_validators_is_downloaded_again(stand_in_server, directories, session):
+    stand_in_server.publish(NAME, CONTENT, etag='"v1"')
+    with open(os.path.join(directories[0], NAME + s.PART_SUFFIX), 'wb') as file:
+        file.write(b'bytes of an unknown version')
+
+    result = _download(stand_in_server, directories, {}, session)
+
+    assert 'Range' not in stand_in_server.requests_of(NAME)[-1]
+    assert _read(result['path']) == CONTENT
+
+
+def test_unchanged_file_is_skipped_with_a_conditional_get(stand_in_server, directories, session, tmp_path):
+    stand_in_server.publish(NAME, CONTENT, etag='"v1"')
+    manifest_path = str(tmp_path / s.MANIFEST_FILE_NAME)
+    manifest = {}
+    first = _download(stand_in_server, directories, manifest, session)
+    s.save_manifest(manifest_path, manifest)
+
+    manifest = s.load_manifest(manifest_path)
+    second = _download(stand_in_server, directories, manifest, session)
+
+    request = stand_in_server.requests_of(NAME)[-1]
+    assert (request['If-None-Match'], request['If-Modified-Since']) == ('"v1"', 'Mon, 01 Jan 2024 00:00:00 GMT')
+    assert first['status'] == s.STATUS_DOWNLOADED
+    assert (second['status'], second['bytes'], second['path']) == (s.STATUS_SKIPPED, 0, first['path'])
+
+
+def test_republished_file_is_downloaded_again(stand_in_server, directories, session):
+    stand_in_server.publish(NAME, CONTENT, etag='"v1"')
+    manifest = {}
+    _download(stand_in_server, directories, manifest, session)
+    stand_in_server.publish(NAME, REPUBLISHED, etag='"v2"', last_modified='Mon, 01 Apr 2024 00:00:00 GMT')
+
+    result = _download(stand_in_server, directories, manifest, session)
+
+    assert result['status'] == s.STATUS_DOWNLOADED
+    assert _read(result['path']) == REPUBLISHED
+    assert manifest[stand_in_server.url(NAME)]['etag'] == '"v2"'
+
+
+def test_manifest_round_trip(stand_in_server, directories, session, tmp_path):
+    stand_in_server.publish(NAME, CONTENT, etag='"v1"')
+    manifest_path = str(tmp_path / s.MANIFEST_FILE_NAME)
+    manifest = {}
+    _download(stand_in_server, directories, manifest, session)
+
+    s.save_manifest(manifest_path, manifest)
+    entry = s.load_manifest(manifest_path)[stand_in_server.url(NAME)]
+
+    assert s.load_manifest(manifest_path) == manifest
+    assert (entry['file_name'], entry['etag'], entry['size']) == (NAME, '"v1"', len(CONTENT))
+    assert entry['sha256'] == hashlib.sha256(CONTENT).hexdigest()
+    assert not os.path.exists(manifest_path + '.tmp')
+
+
+def test_missing_or_corrupt_manifest_is_empty(tmp_path):
+    manifest_path = tmp_path / s.MANIFEST_FILE_NAME
+    assert s.load_manifest(str(manifest_path)) == {}
+
+    manifest_path.write_text('{"truncated', encoding='utf-8')
+
+    assert s.load_manifest(str(manifest_path)) == {}
+
+
+def test_each_retried_attempt_is_timed(stand_in_server, directories):
+    stand_in_server.publish(NAME, CONTENT, etag='"v1"')
+    stand_in_server.fail[NAME] = [503, 503]
+    session = s.create_http_session(total_retries=3, backoff_factor=0.05)
+
+    result = _download(stand_in_server, directories, {}, session)
+    session.close()
+
+    assert result['status'] == s.STATUS_DOWNLOADED
+    assert result['attempts'] == 3
+    assert [attempt['outcome'] for attempt in result['attempt_log']] == ['HTTP 503', 'HTTP 503', 'HTTP 200']
+    assert [attempt['attempt'] for attempt in result['attempt_log']] == [1, 2, 3]
+    assert all(attempt['seconds'] >= 0 for attempt in result['attempt_log'])
+    # urllib3 waits before the second retry only: backoff_factor * 2
+    assert result['attempt_log'][1]['backoff'] >= 0.1
+    assert result['attempt_log'][-1]['backoff'] == 0
+
+
+def test_exhausted_retries_fail_with_the_last_status(stand_in_server, directories, session):
+    stand_in_server.publish(NAME, CONTENT, etag='"v1"')
+    stand_in_server.fail[NAME] = [503] * 5
+
+    result = _download(stand_in_server, directories, {}, session)
+
+    # total_retries=2: the first attempt and two retries
+    assert (result['status'], result['error']) == (s.STATUS_FAILED, 'HTTP 503')
+    assert [attempt['outcome'] for attempt in result['attempt_log']] == ['HTTP 503'] * 3
+    assert len(stand_in_server.requests_of(NAME)) == 3
+
+
+def test_connection_errors_are_timed_until_no_retry_is_left(directories, session):
+    # Nothing listens on the port of a closed server
+    server = StandInServer()
+    url = server.url(NAME)
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+    result = s.download_file(url, *directories, manifest={}, session=session)
+
+    assert result['status'] == s.STATUS_FAILED
+    assert result['attempts'] == 3
+    assert all('Connection refused' in attempt['outcome'] for attempt in result['attempt_log'])
+
+
+YEAR = datetime.now().year
+
+
+def _quarter_name(year, quarter):
+    return f"ITR Q{quarter}{year}A.xlsx"
+
+
+@pytest.fixture
+def gstat_urls(stand_in_server, monkeypatch):
+    """Point the GSTAT URLs at the stand-in server."""
+    monkeypatch.setattr(s, 'FILE_PATTERN', stand_in_server.base_url + 'ITR%20Q{quarter}{year}A.xlsx')
+    monkeypatch.setattr(s, 'LEGACY_URL', stand_in_server.url('legacy.xlsx'))
+    stand_in_server.publish('legacy.xlsx', b'legacy', etag='"legacy"')
+    return stand_in_server
+
+
+def test_discovery_saves_the_frontier_and_probes_only_after_it(gstat_urls, session, tmp_path):
+    for year, quarter in [(YEAR - 1, 4), (YEAR, 1)]:
+        gstat_urls.publish(_quarter_name(year, quarter), CONTENT, etag=f'"{year}{quarter}"')
+    frontier_path = str(tmp_path / s.FRONTIER_FILE_NAME)
+
+    first = s.discover_published_quarters(session, YEAR - 1, frontier_path)
+    second = s.discover_published_quarters(session, YEAR - 1, frontier_path)
+
+    assert first == ((YEAR, 1), [(YEAR - 1, 4), (YEAR, 1)])
+    assert s.load_frontier(frontier_path) == (YEAR, 1)
+    # Nothing new: the second run only probes the quarter after the frontier
+    assert second == ((YEAR, 1), [])
+    assert [len(gstat_urls.requests_of(_quarter_name(year, quarter), 'HEAD'))
+            for year, quarter in [(YEAR - 1, 4), (YEAR, 1), (YEAR, 2)]] == [1, 1, 2]
+
+
+def test_discovery_stops_at_the_first_missing_quarter(gstat_urls, session, tmp_path):
+    gstat_urls.publish(_quarter_name(YEAR - 1, 4), CONTENT, etag='"a"')
+    gstat_urls.publish(_quarter_name(YEAR, 2), CONTENT, etag='"b"')
+    frontier_path = str(tmp_path / s.FRONTIER_FILE_NAME)
+
+    frontier, new_quarters = s.discover_published_quarters(session, YEAR - 1, frontier_path)
+
+    assert (frontier, new_quarters) == ((YEAR - 1, 4), [(YEAR - 1, 4)])
+    assert gstat_urls.requests_of(_quarter_name(YEAR, 2), 'HEAD') == []
+
+
+def test_frontier_file_keeps_the_last_revalidation(tmp_path):
+    frontier_path = str(tmp_path / s.FRONTIER_FILE_NAME)
+    s.save_frontier(frontier_path, 2024, 1, revalidated_at='2024-05-01T00:00:00')
+
+    s.save_frontier(frontier_path, 2024, 2)
+
+    assert s.load_frontier(frontier_path) == (2024, 2)
+    assert s.last_revalidation(frontier_path) == '2024-05-01T00:00:00'
+    with open(frontier_path, 'w', encoding='utf-8') as file:
+        file.write('not json')
+    assert s.load_frontier(frontier_path) is None
+
+
+def test_run_without_new_quarter_sends_a_single_head(gstat_urls, directories):
+    gstat_urls.publish(_quarter_name(YEAR - 1, 4), CONTENT, etag='"a"')
+    first = s.download_gstat_xlsx_file(*directories, YEAR - 1, discover=True)
+    requests_before = len(gstat_urls.requests)
+
+    second = s.download_gstat_xlsx_file(*directories, YEAR - 1, discover=True)
+
+    assert [result['status'] for result in first] == [s.STATUS_DOWNLOADED] * 2
+    assert second == []
+    assert [(method, name) for method, name, _ in gstat_urls.requests[requests_before:]] == \
+        [('HEAD', _quarter_name(YEAR, 1))]
@@ -0,0 +1,57 @@
+"""
+Upsert tests on SQLite.
+"""
+import pandas as pd
+import pytest
+import sqlalchemy
+
+import ETL_com_functions as e
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'destination.db'}")
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(
+            'CREATE TABLE "values" ("Key" TEXT, "Year" TEXT, "Value" FLOAT, "STG_CreatedDate" DATETIME)'))
+    yield engine
+    engine.dispose()
+
+
+def _frame(rows):
+    return pd.DataFrame(rows, columns=['Key', 'Year', 'Value']).assign(STG_CreatedDate=pd.Timestamp.now())
+
+
+def _table(engine):
+    with engine.connect() as connection:
+        return connection.execute(sqlalchemy.text(
+            'SELECT "Key", "Year", "Value" FROM "values" ORDER BY "Key", "Year"')).fetchall()
+
+
+def test_identical_rerun_inserts_and_updates_nothing(engine):
+    df = _frame([('1', '2024', 10.5), ('2', '2024', 20.25), ('3', '2024', None)])
+
+    first = e.upsert_dataframe(df, 'values', ['Key', 'Year'], engine)
+    second = e.upsert_dataframe(df.assign(STG_CreatedDate=pd.Timestamp.now()), 'values', ['Key', 'Year'], engine)
+
+    assert first == {'inserted': 3, 'updated': 0, 'skipped': 0}
+    assert second == {'inserted': 0, 'updated': 0, 'skipped': 3}
+
+
+def test_changed_row_is_updated(engine):
+    e.upsert_dataframe(_frame([('1', '2024', 10.5), ('2', '2024', 20.25)]), 'values', ['Key', 'Year'], engine)
+
+    counts = e.upsert_dataframe(_frame([('1', '2024', 10.5), ('2', '2024', 30.0)]), 'values', ['Key', 'Year'], engine)
+
+    assert counts == {'inserted': 0, 'updated': 1, 'skipped': 1}
+    assert _table(engine) == [('1', '2024', 10.5), ('2', '2024', 30.0)]
+
+
+def test_duplicate_keys_keep_the_last_row(engine):
+    # The same quarter republished in a later file
+    df = _frame([('1', '2024', 10.5), ('2', '2024', 20.25), ('1', '2024', 11.0)])
+
+    counts = e.upsert_dataframe(df, 'values', ['Key', 'Year'], engine)
+
+    assert counts == {'inserted': 2, 'updated': 0, 'skipped': 0}
+    assert _table(engine) == [('1', '2024', 11.0), ('2', '2024', 20.25)]
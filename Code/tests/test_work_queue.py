@@ -0,0 +1,74 @@
+"""
+Work queue tests on SQLite, the clock of the queue is moved forward instead of waiting for leases to expire.
+"""
+import importlib
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import sqlalchemy
+
+import ETL_work_queue as work_queue_module
+from ETL_work_queue import WorkQueue
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    times = [datetime(2024, 1, 1)]
+    monkeypatch.setattr(work_queue_module, '_now', lambda: times[0])
+    return times
+
+
+@pytest.fixture
+def work_queue(tmp_path, clock):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    work_queue = WorkQueue(engine, lease_seconds=1, max_attempts=2)
+    work_queue.create_table()
+    work_queue.register([{'job_key': 'a', 'file_name': 'ITR Q12024A.xlsx'}])
+    yield work_queue
+    engine.dispose()
+
+
+def _expire_lease(clock):
+    clock[0] += timedelta(seconds=2)
+
+
+def test_expired_lease_is_claimed_again(work_queue, clock):
+    first = work_queue.claim('node-1')
+    _expire_lease(clock)
+    second = work_queue.claim('node-2')
+
+    assert [job['attempts'] for job in first + second] == [1, 2]
+    assert not work_queue.complete(first[0])
+    assert work_queue.complete(second[0])
+
+
+def test_expired_lease_on_the_last_attempt_fails_the_job(work_queue, clock):
+    work_queue.claim('node-1')
+    _expire_lease(clock)
+    work_queue.claim('node-2')
+    assert work_queue.active_leases() == 1
+    _expire_lease(clock)
+
+    assert work_queue.active_leases() == 0
+    assert work_queue.claim('node-3') == []
+    assert work_queue.counts() == {'failed': 1}
+
+
+def test_worker_stops_when_only_expired_leases_are_left(work_queue, clock):
+    etl = importlib.import_module('GSTAT_refactor-V2')
+    work_queue.claim('node-1')
+    _expire_lease(clock)
+    work_queue.claim('node-2')
+    _expire_lease(clock)
+
+    outcomes = etl.run_worker(work_queue, None, None, worker_id='node-3', poll_seconds=0.01)
+
+    assert outcomes == {'done': 0, 'failed': 0, 'lost': 0}
+    assert work_queue.counts() == {'failed': 1}
+
+
+def test_lease_times_are_naive_utc():
+    now = work_queue_module._now()
+
+    assert now.tzinfo is None
+    assert abs(now - datetime.now(timezone.utc).replace(tzinfo=None)) < timedelta(seconds=5)